@@ -0,0 +1,19 @@
+import os
+
+from celery import Celery
+
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Uber.settings')
+
+app = Celery('Uber')
+# Every CELERY_* entry in settings.py configures the app.
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
+
+
+@app.on_after_configure.connect
+def create_broker_folders(sender, **kwargs):
+    # The filesystem broker expects its folders to exist.
+    options = sender.conf.broker_transport_options or {}
+    for folder in {options.get('data_folder_in'), options.get('data_folder_out'), options.get('control_folder')} - {None}:
+        os.makedirs(folder, exist_ok=True)
@@ -27,6 +27,202 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 open_route_service_key = '5b3ce3597851110001cf624850c190f4ff394eb4a83c14300af5c636'
 
+# Route cache in front of OpenRouteService (utils/routeCache.py)
+ROUTE_CACHE = {
+    'PRECISION': 3,             # decimal places pickup/drop are snapped to (~110 m)
+    'MAX_ENTRIES': 10000,
+    'TTL': 60 * 15,             # seconds
+    'SHARED_BACKEND': None,     # CACHES alias shared by all workers, e.g. 'shared'
+}
+
+# Routing source used for trip quotes (utils/routingBackends.py)
+ROUTING = {
+    'BACKEND': 'utils.routingBackends.OpenRouteServiceBackend',
+    'OPTIONS': {
+        'api_key': open_route_service_key,
+        'connect_timeout': 2.0,     # seconds
+        'read_timeout': 5.0,        # seconds
+        'retries': 2,               # extra attempts, exponential backoff with jitter
+        'pool_size': 20,            # keep-alive connections per worker
+    },
+}
+
+# Compiled TripFare lookup table (utils/fareSchedule.py)
+FARE_SCHEDULE = {
+    'REFRESH_INTERVAL': 60 * 5,     # seconds before a worker recompiles on its own
+}
+
+# Signed fare quotes returned by tripDetails and required by addTripDetails
+TRIP_QUOTE = {
+    'TTL': 60 * 10,     # seconds a quote can be booked for
+}
+
+# Batch quote endpoint (tripDetailsBatch)
+TRIP_QUOTE_BATCH = {
+    'MAX_PAIRS': 5000,
+}
+
+# New trips are announced once per vehicle type group. With USE_ZONES drivers
+# also pass ?latitude=&longitude= on the socket and trips go to the pickup's
+# geohash cell (ZONE_PRECISION 5 is ~4.9 km) and its neighbours.
+DISPATCH = {
+    'USE_ZONES': False,
+    'ZONE_PRECISION': 5,
+    # Trips are offered to this many closest drivers within SEARCH_RADIUS
+    # metres, taken from the live driver index.
+    'NEAREST_DRIVERS': 10,
+    'SEARCH_RADIUS': 5000,
+    # 'nearest' offers each trip to NEAREST_DRIVERS at once; 'batch' hands
+    # it to the matching engine (see MATCHING).
+    'STRATEGY': 'nearest',
+}
+
+# Batch matching: every WINDOW seconds pending trips are assigned to idle
+# drivers (SOLVER 'hungarian' or 'greedy') by straight line ETA at
+# AVERAGE_SPEED m/s over the CANDIDATES nearest drivers per trip. Offers
+# lapse after OFFER_TTL seconds; trips waiting MAX_WAIT are broadcast.
+MATCHING = {
+    'WINDOW': 2,
+    'SOLVER': 'hungarian',
+    'CANDIDATES': 20,
+    'AVERAGE_SPEED': 8.3,
+    'OFFER_TTL': 15,
+    'MAX_WAIT': 30,
+}
+
+# Driver pending trip feed: trips older than MAX_AGE seconds are left out
+# and at most MAX_TRIPS newest ones are ranked by pickup distance.
+PENDING_TRIP_FEED = {
+    'MAX_AGE': 900,
+    'MAX_TRIPS': 200,
+}
+
+# `manage_trip_partitions` (run daily) keeps MONTHS_AHEAD monthly Trip
+# partitions ready and moves trips in ARCHIVE_STATUSES from months older
+# than ARCHIVE_AFTER_DAYS into user_trip_archive. PostgreSQL only.
+TRIP_PARTITIONS = {
+    'MONTHS_AHEAD': 3,
+    'ARCHIVE_AFTER_DAYS': 180,
+    'ARCHIVE_STATUSES': ['completed'],
+}
+
+# Zone surge: quotes and bookings are counted per geohash zone
+# (ZONE_PRECISION 5 is ~4.9 km) over WINDOW seconds; every INTERVAL seconds
+# each zone gets 1 + SENSITIVITY * (demand / idle drivers - THRESHOLD),
+# capped at MAX_MULTIPLIER and smoothed against the previous value.
+SURGE = {
+    'ZONE_PRECISION': 5,
+    'WINDOW': 300,
+    'BUCKET': 10,
+    'INTERVAL': 5,
+    'QUOTE_WEIGHT': 1.0,
+    'BOOKING_WEIGHT': 3.0,
+    'THRESHOLD': 1.0,
+    'SENSITIVITY': 0.25,
+    'MAX_MULTIPLIER': 3.0,
+    'SMOOTHING': 0.5,
+}
+
+# Historical distance / duration model written by `train_eta_model`.
+# TripDetails falls back to it when routing fails or takes longer than
+# ROUTING_TIMEOUT seconds, and refuses trips it estimates above MAX_TRIP_KM
+# without calling the router.
+ETA_MODEL = {
+    'PATH': os.path.join(BASE_DIR, 'eta_model.npz'),
+    'CELL_SIZE': 0.05,
+    'MIN_SAMPLES': 5,
+    'ROUTING_TIMEOUT': 3,
+    'MAX_TRIP_KM': 150,
+}
+
+# Transactional outbox for trip side effects (driver notifications). Rows are
+# written with the trip and relayed in batches of BATCH_SIZE at least every
+# INTERVAL seconds; a claimed row is hidden from other relays for LEASE
+# seconds and a failed one retried after RETRY_BACKOFF ** attempts seconds,
+# up to MAX_ATTEMPTS. With IN_PROCESS the relay runs inside the ASGI server;
+# otherwise run `manage.py relay_outbox` against a shared channel layer.
+OUTBOX = {
+    'BATCH_SIZE': 100,
+    'INTERVAL': 1,
+    'LEASE': 30,
+    'MAX_ATTEMPTS': 10,
+    'RETRY_BACKOFF': 2,
+    'IN_PROCESS': True,
+}
+
+# Role permissions compiled per worker (utils/rolePermissions.py). Edits
+# invalidate the local copy at once; other workers recompile when the
+# generation in SHARED_BACKEND moves or after REFRESH_INTERVAL seconds.
+# Per-user token versions (utils/tokens.py) live in the same cache; without
+# a shared backend a revoked token is only refused by the worker that
+# revoked it, so set it whenever more than one worker runs.
+ROLE_PERMISSIONS = {
+    'REFRESH_INTERVAL': 60 * 5,     # seconds
+    'SHARED_BACKEND': None,         # CACHES alias shared by all workers
+}
+
+# Login OTPs (utils/otpStore.py), kept out of the User table. A code lives
+# for TTL seconds and allows MAX_ATTEMPTS guesses; a number gets at most
+# MAX_SENDS codes per SEND_WINDOW seconds. Codes sit in the 'shared' cache
+# so every worker sees them; LocalOtpStore is per process (tests only).
+OTP = {
+    'BACKEND': 'utils.otpStore.CacheOtpStore',
+    'OPTIONS': {
+        'cache': 'shared',
+        'ttl': 120,
+        'max_attempts': 5,
+        'max_sends': 3,
+        'send_window': 60 * 10,
+    },
+}
+
+# Background tasks (Uber/celery.py), run with `celery -A Uber worker`. The
+# filesystem broker needs no extra service; point CELERY_BROKER_URL at Redis
+# or RabbitMQ when workers run on other hosts.
+CELERY_BROKER_URL = 'filesystem://'
+celery_broker_folder = os.path.join(BASE_DIR, 'celery_broker')
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'data_folder_in': celery_broker_folder,
+    'data_folder_out': celery_broker_folder,
+    'control_folder': os.path.join(celery_broker_folder, 'control'),
+}
+CELERY_TASK_IGNORE_RESULT = True
+
+# Profile picture thumbnails (user/tasks.py): one image per size in SIZES
+# (longest side, px) plus a WebP copy of each. The smallest is stored in
+# User.thumbnail_pic; the rest sit next to it.
+THUMBNAILS = {
+    'SIZES': (100, 300, 600),
+    'QUALITY': 85,
+    'WEBP_QUALITY': 80,
+}
+
+# In-process index of driver positions sent over the trip websocket.
+# CELL_SIZE is in degrees (0.01 is ~1.1 km); positions older than TTL
+# seconds count as offline.
+DRIVER_INDEX = {
+    'CELL_SIZE': 0.01,
+    'TTL': 60,
+    'MAX_RINGS': 20,
+}
+
+# Location pings faster than MIN_INTERVAL seconds, or implying more than
+# MAX_SPEED m/s since the previous one, are dropped. Accepted pings are
+# written to DriverLocation in bulk every FLUSH_INTERVAL seconds.
+DRIVER_LOCATIONS = {
+    'MIN_INTERVAL': 1,
+    'MAX_SPEED': 70,
+    'FLUSH_INTERVAL': 5,
+    'MAX_PENDING': 5000,
+    'BATCH_SIZE': 1000,
+}
+
+# Offline routing over a local graph built with `manage.py build_road_graph`
+# ROUTING = {
+#     'BACKEND': 'utils.routingBackends.LocalGraphBackend',
+#     'OPTIONS': {'graph_path': os.path.join(BASE_DIR, 'road_graph.bin')},
+# }
+
 # settings.py
 TIME_ZONE = 'Asia/Kolkata'
 USE_TZ = True  # Make sure timezone support is enabled
@@ -185,19 +381,14 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'utils.tokens.TokenUserAuthentication',
     ],
-}
-
-REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
    'rest_framework.permissions.AllowAny',
 ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 8,
-}
-
-REST_FRAMEWORK = {
+    # No DEFAULT_PAGINATION_CLASS: admin lists opt in with
+    # pagination_class = KeysetPagination (8 per page), lookup lists such as
+    # languages still return everything.
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend']
 }
 
@@ -211,6 +402,9 @@ EMAIL_HOST_PASSWORD = 'dtoumtcmtoyfsucc'
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=2),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=30),
+    # Stamp user type, role and permission bitmask claims (utils/tokens.py).
+    'TOKEN_OBTAIN_SERIALIZER': 'utils.tokens.PermissionTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'utils.tokens.PermissionTokenRefreshSerializer',
 }
 
 CHANNEL_LAYERS = {
@@ -219,6 +413,18 @@ CHANNEL_LAYERS = {
     },
 }
 
+# 'shared' is one store for every worker: OTP codes, and the alias to use
+# for ROUTE_CACHE / ROLE_PERMISSIONS['SHARED_BACKEND'].
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "shared": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": "redis://127.0.0.1:6379/1",
+    },
+}
+
 SWAGGER_SETTINGS = {
     'SECURITY_DEFINITIONS': {
         'Bearer': {
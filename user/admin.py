@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User , Language, DriverRequest, Trip, TripFare, DocumentType, DocumentRequired ,DriverDetail, Role, Permission, RolePermission
+from .models import User , Language, DriverRequest, Trip, TripFare, DocumentType, DocumentRequired ,DriverDetail, Role, Permission, RolePermission, DriverLocation, OutboxMessage
 
 
 
@@ -14,4 +14,6 @@ admin.site.register(DocumentRequired)
 admin.site.register(DocumentType)
 admin.site.register(DriverRequest)
 admin.site.register(Trip)
-admin.site.register(TripFare)
\ No newline at end of file
+admin.site.register(TripFare)
+admin.site.register(DriverLocation)
+admin.site.register(OutboxMessage)
\ No newline at end of file
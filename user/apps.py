@@ -8,5 +8,7 @@ class UserConfig(AppConfig):
     def ready(self):
         # Import signals so they get registered
         import user.signals.CustomUserSignal  # If you have separate signal files
+        import user.signals.TripFareSignal
+        import user.signals.RolePermissionSignal
         # Or if your signals are all in one file:
         # import user.signals
@@ -1,5 +1,14 @@
 from channels.generic.websocket import AsyncWebsocketConsumer
+from urllib.parse import parse_qs
 import json
+import time
+
+from utils.driverIndex import driver_index
+from utils.locationBuffer import location_buffer
+from utils.matching import matching_engine
+from utils.outbox import outbox_relay
+from utils.roadGraph import haversine_m
+from Uber import settings
 
 
 
@@ -8,11 +17,8 @@ class TripUpdateConsumer(AsyncWebsocketConsumer):
         from rest_framework_simplejwt.tokens import AccessToken
         from user.models import User
 
-        query_string = self.scope['query_string'].decode()  # Decode the query string
-        token = None
-
-        if 'token=' in query_string:
-            token = query_string.split('token=')[1]
+        query = parse_qs(self.scope['query_string'].decode())  # Decode the query string
+        token = query.get('token', [None])[0]
 
         if token:
             try:
@@ -25,6 +31,13 @@ class TripUpdateConsumer(AsyncWebsocketConsumer):
                     self.group_name = f'driver_{user.id}'
                     print("self.group_name------------------------",self.group_name)
                     await self.channel_layer.group_add(self.group_name, self.channel_name)
+                    self.query = query
+                    self.vehicle_type = await self.get_vehicle_type(user.id)
+                    await self.join_trip_groups(self.vehicle_type)
+                    if settings.DISPATCH['STRATEGY'] == 'batch':
+                        matching_engine.start()
+                    if settings.OUTBOX['IN_PROCESS']:
+                        outbox_relay.start()
                     await self.accept()
                 else:
                     await self.close()
@@ -37,9 +50,81 @@ class TripUpdateConsumer(AsyncWebsocketConsumer):
     async def disconnect(self, close_code):
         if hasattr(self, "group_name"):
             await self.channel_layer.group_discard(self.group_name, self.channel_name)
+            driver_index.remove(self.user.id)
+        await self.leave_trip_groups()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        '''
+            Drivers report their position as
+            {"type": "location", "latitude": .., "longitude": ..}.
+            Accepted pings update the live index right away and are queued
+            for the next batched write to DriverLocation.
+        '''
+        try:
+            message = json.loads(text_data or '')
+        except ValueError:
+            return
+        if not isinstance(message, dict) or message.get("type") != "location":
+            return
+        try:
+            latitude = float(message["latitude"])
+            longitude = float(message["longitude"])
+        except (KeyError, TypeError, ValueError):
+            return
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            return
+
+        now = time.monotonic()
+        last = getattr(self, "last_location", None)
+        if last is not None:
+            elapsed = now - last[2]
+            if elapsed < settings.DRIVER_LOCATIONS['MIN_INTERVAL']:
+                return
+            # Drop GPS jumps no vehicle could have made since the last ping.
+            if haversine_m(last[0], last[1], latitude, longitude) > settings.DRIVER_LOCATIONS['MAX_SPEED'] * elapsed:
+                return
+        self.last_location = (latitude, longitude, now)
+
+        driver_index.update(self.user.id, latitude, longitude, self.vehicle_type)
+        location_buffer.add(self.user.id, latitude, longitude)
+        location_buffer.start()
+
+    async def join_trip_groups(self, vehicle_type):
+        '''
+            Subscribe to the vehicle type group (or zone group) new trips are
+            announced on, so a booking is one group_send for all drivers.
+        '''
+        from utils.dispatch import vehicle_type_group, driver_zone
+
+        self.trip_groups = []
+        if not vehicle_type:
+            return
+        latitude = self.query.get('latitude', [None])[0]
+        longitude = self.query.get('longitude', [None])[0]
+        if settings.DISPATCH['USE_ZONES'] and latitude and longitude:
+            self.trip_groups = [vehicle_type_group(vehicle_type, driver_zone(latitude, longitude))]
+        else:
+            self.trip_groups = [vehicle_type_group(vehicle_type)]
+        for group in self.trip_groups:
+            await self.channel_layer.group_add(group, self.channel_name)
+
+    async def leave_trip_groups(self):
+        for group in getattr(self, "trip_groups", []):
+            await self.channel_layer.group_discard(group, self.channel_name)
+        self.trip_groups = []
 
     async def send_trip_update(self, event):
-        await self.send(text_data=json.dumps(event["message"]))
+        # Fanout events arrive already serialised.
+        if "text" in event:
+            await self.send(text_data=event["text"])
+        else:
+            await self.send(text_data=json.dumps(event["message"]))
+
+    async def vehicle_selected(self, event):
+        self.vehicle_type = event["vehicle_type"]
+        driver_index.set_vehicle_type(self.user.id, self.vehicle_type)
+        await self.leave_trip_groups()
+        await self.join_trip_groups(event["vehicle_type"])
 
     @staticmethod
     async def get_user(user_id):
@@ -50,3 +135,12 @@ class TripUpdateConsumer(AsyncWebsocketConsumer):
             return await User.objects.aget(id=user_id)
         except User.DoesNotExist:
             return AnonymousUser()
+
+    @staticmethod
+    async def get_vehicle_type(user_id):
+        from user.models import DriverDetail
+
+        driver = await DriverDetail.objects.select_related('in_use').filter(user_id=user_id).afirst()
+        if driver is None or driver.in_use is None:
+            return None
+        return driver.in_use.vehicle_type
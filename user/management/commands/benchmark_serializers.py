@@ -0,0 +1,67 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from utils.serializerBenchmarks import BENCHMARKS, compare, run_benchmark
+from Uber import settings
+
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the hot serializers on synthetic instances and compare against the stored baselines. "
+        "Allocation growth fails the run; timings are only comparable on the machine that recorded the "
+        "baselines, so a slowdown is reported but fails only with --fail-on-time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help=f"Serializers to run (default: all of {', '.join(BENCHMARKS)})")
+        parser.add_argument('--count', type=int, default=1000, help="Instances per run")
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per serializer; the median is kept")
+        parser.add_argument('--baseline', default=os.path.join(settings.BASE_DIR, 'serializer_baselines.json'))
+        parser.add_argument('--save', action='store_true', help="Write the results as the new baselines")
+        parser.add_argument('--time-tolerance', type=float, default=0.25, help="Allowed slowdown, 0.25 = 25%%")
+        parser.add_argument('--memory-tolerance', type=float, default=0.10, help="Allowed allocation growth, 0.10 = 10%%")
+        parser.add_argument('--fail-on-time', action='store_true', help="Also fail on a slowdown (same machine as the baselines only)")
+
+    def handle(self, *args, **options):
+        names = options['names'] or list(BENCHMARKS)
+        unknown = set(names) - set(BENCHMARKS)
+        if unknown:
+            raise CommandError(f"Unknown serializer benchmark(s): {', '.join(sorted(unknown))}")
+
+        results = {}
+        self.stdout.write(f"{'serializer':<38}{'objects/s':>11}{'us/object':>11}{'peak B/obj':>12}{'kept B/obj':>12}")
+        for name in names:
+            result = results[name] = run_benchmark(name, options['count'], options['repeat'])
+            self.stdout.write(
+                f"{name:<38}{result['objects_per_second']:>11}{result['microseconds_per_object']:>11}"
+                f"{result['peak_bytes_per_object']:>12}{result['retained_bytes_per_object']:>12}"
+            )
+
+        baselines = {}
+        if os.path.exists(options['baseline']):
+            with open(options['baseline']) as baseline_file:
+                baselines = json.load(baseline_file)
+
+        if options['save']:
+            baselines.update(results)
+            with open(options['baseline'], 'w') as baseline_file:
+                json.dump(baselines, baseline_file, indent=4, sort_keys=True)
+                baseline_file.write('\n')
+            self.stdout.write(self.style.SUCCESS(f"Baselines written to {options['baseline']}"))
+            return
+
+        try:
+            regressions = compare(results, baselines, options['time_tolerance'], options['memory_tolerance'])
+        except ValueError as error:
+            raise CommandError(f"{error}; rerun with the baseline count or --save new baselines")
+        for name, metric, baseline, current in regressions:
+            self.stderr.write(f"{name}: {metric} {baseline} -> {current}")
+        if not options['fail_on_time']:
+            regressions = [regression for regression in regressions if regression[1] != 'microseconds_per_object']
+        if regressions:
+            raise CommandError(f"{len(regressions)} serializer regression(s) against {options['baseline']}")
+        if baselines:
+            self.stdout.write(self.style.SUCCESS("No regressions against the baselines."))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from utils.roadGraph import build_from_osm
+
+
+
+class Command(BaseCommand):
+    help = "Convert an OSM XML extract into the compact road graph used by LocalGraphBackend."
+
+    def add_arguments(self, parser):
+        parser.add_argument('osm_file', help="OSM XML extract (.osm, .osm.bz2 or .osm.gz)")
+        parser.add_argument('output', help="Path of the graph file to write, e.g. road_graph.bin")
+
+    def handle(self, *args, **options):
+        graph = build_from_osm(options['osm_file'])
+        graph.save(options['output'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {options['output']}: {graph.node_count} nodes, {graph.edge_count} edges."
+        ))
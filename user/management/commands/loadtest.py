@@ -0,0 +1,69 @@
+import asyncio
+import json
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from utils.loadTest import LoadTest, create_fixtures
+from utils.routingBackends import StubRoutingBackend, set_routing_backend
+
+
+
+class Command(BaseCommand):
+    help = "Load test riders (quote -> book) and drivers (websocket, accept) against the ASGI app on a throwaway test database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--riders', type=int, default=50)
+        parser.add_argument('--drivers', type=int, default=20)
+        parser.add_argument('--trips-per-rider', type=int, default=5)
+        parser.add_argument('--vehicle-type', default='2 Wheeler')
+        parser.add_argument('--latitude', type=float, default=23.0225, help="Centre of the test area")
+        parser.add_argument('--longitude', type=float, default=72.5714, help="Centre of the test area")
+        parser.add_argument('--radius', type=float, default=3, help="Pickup / driver area radius in km")
+        parser.add_argument('--think-time', type=float, default=0.0, help="Mean seconds between a rider's bookings")
+        parser.add_argument('--ride-time', type=float, default=0.0, help="Seconds a driver spends on an accepted trip")
+        parser.add_argument('--routing-latency', type=float, default=0.05, help="Seconds the stub routing service takes per route")
+        parser.add_argument('--drain', type=float, default=10, help="Seconds to wait for outstanding trips to be accepted")
+        parser.add_argument('--keepdb', action='store_true', help="Reuse and keep the test database")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+
+    def handle(self, *args, **options):
+        from Uber.asgi import application
+
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=options['keepdb'])
+        # Lost accept races are expected; keep the 409 warnings out of the report.
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        previous_backend = set_routing_backend(StubRoutingBackend(latency=options['routing_latency']))
+        try:
+            rider_tokens, driver_tokens = create_fixtures(options['riders'], options['drivers'], options['vehicle_type'])
+            load_test = LoadTest(
+                application, rider_tokens, driver_tokens,
+                vehicle_type=options['vehicle_type'],
+                trips_per_rider=options['trips_per_rider'],
+                latitude=options['latitude'],
+                longitude=options['longitude'],
+                radius=options['radius'],
+                think_time=options['think_time'],
+                ride_time=options['ride_time'],
+                drain=options['drain'],
+            )
+            rows, counters, elapsed = asyncio.run(load_test.run())
+        finally:
+            set_routing_backend(previous_backend)
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        if options['json']:
+            self.stdout.write(json.dumps({'elapsed': round(elapsed, 2), 'counters': counters, 'endpoints': rows}, indent=2))
+            return
+
+        self.stdout.write(', '.join(f'{name}: {value}' for name, value in counters.items()) + f' in {elapsed:.1f}s')
+        header = f"{'endpoint':<34}{'count':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'req/s':>8}  statuses"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for row in rows:
+            statuses = ' '.join(f'{code}x{count}' for code, count in sorted(row['statuses'].items()))
+            self.stdout.write(
+                f"{row['name']:<34}{row['count']:>7}{row['p50']:>9}{row['p95']:>9}{row['p99']:>9}{row['max']:>9}{row['throughput']:>8}  {statuses}"
+            )
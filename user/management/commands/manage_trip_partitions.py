@@ -0,0 +1,56 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from utils.tripPartitions import add_months, archive_partition, create_partition, is_partitioned, monthly_partitions, partition_name, sync_archive_columns
+from Uber import settings
+
+
+
+class Command(BaseCommand):
+    help = "Create upcoming monthly Trip partitions and archive finished trips in months past the archive horizon."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=settings.TRIP_PARTITIONS['MONTHS_AHEAD'],
+                            help="Partitions to keep ready beyond the current month")
+        parser.add_argument('--archive-after-days', type=int, default=settings.TRIP_PARTITIONS['ARCHIVE_AFTER_DAYS'],
+                            help="Whole months older than this are archived")
+        parser.add_argument('--dry-run', action='store_true', help="Only print what would be done")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Trip partitioning needs PostgreSQL.")
+
+        with connection.cursor() as cursor:
+            if not is_partitioned(cursor):
+                raise CommandError("user_trip is not partitioned; run the user migrations first.")
+            partitions = monthly_partitions(cursor)
+
+        today = timezone.now().date()
+        current = today.replace(day=1)
+        for offset in range(options['months_ahead'] + 1):
+            month = add_months(current, offset)
+            if month in partitions:
+                continue
+            if not options['dry_run']:
+                with transaction.atomic(), connection.cursor() as cursor:
+                    create_partition(cursor, month)
+            self.stdout.write(f"Created {partition_name(month)}")
+
+        # Only months that ended before the horizon, so a partition is never half archived.
+        horizon = today - timedelta(days=options['archive_after_days'])
+        statuses = settings.TRIP_PARTITIONS['ARCHIVE_STATUSES']
+        for month, name in sorted(partitions.items()):
+            if add_months(month, 1) > horizon:
+                continue
+            if options['dry_run']:
+                self.stdout.write(f"Would archive {name}")
+                continue
+            with transaction.atomic(), connection.cursor() as cursor:
+                sync_archive_columns(cursor)
+                moved, dropped = archive_partition(cursor, name, statuses)
+            self.stdout.write(f"Archived {moved} trips from {name}" + (", partition dropped" if dropped else ""))
+
+        self.stdout.write(self.style.SUCCESS("Trip partitions are up to date."))
@@ -0,0 +1,25 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from utils.outbox import outbox_relay
+
+
+
+class Command(BaseCommand):
+    help = "Relay outbox messages to their handlers (use with a shared channel layer and OUTBOX['IN_PROCESS'] off)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Deliver what is due and exit")
+
+    def handle(self, *args, **options):
+        asyncio.run(self.relay(options['once']))
+
+    async def relay(self, once):
+        if once:
+            total = 0
+            while count := await outbox_relay.relay_once():
+                total += count
+            self.stdout.write(self.style.SUCCESS(f"Relayed {total} message(s)."))
+            return
+        await outbox_relay.start()
@@ -0,0 +1,48 @@
+from datetime import timedelta
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from user.models import Trip, TripStatus
+from utils.etaModel import EtaModel, hour_of_week
+from Uber import settings
+
+
+
+class Command(BaseCommand):
+    help = "Fit the historical distance / duration model from completed trips."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90, help="Only use trips from the last N days")
+        parser.add_argument('--output', default=str(settings.ETA_MODEL['PATH']), help="Where to write the model")
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days'])
+        trips = (
+            Trip.objects
+            .filter(status=TripStatus.COMPLETED, created_at__gte=since,
+                    pickup_location_latitude__isnull=False, drop_location_latitude__isnull=False)
+            .annotate(started_at=Coalesce('pickup_time', 'created_at'))
+            .values_list('pickup_location_latitude', 'pickup_location_longitude', 'drop_location_latitude',
+                         'drop_location_longitude', 'distance', 'estimated_time', 'started_at')
+        )
+
+        columns, hours = [], []
+        for row in trips.iterator(chunk_size=10000):
+            columns.append(row[:6])
+            hours.append(hour_of_week(timezone.localtime(row[6])))
+        if not columns:
+            raise CommandError("No completed trips with coordinates to train on.")
+
+        data = np.array(columns, dtype=np.float64)
+        try:
+            model = EtaModel.fit(*data.T, hours, cell_size=settings.ETA_MODEL['CELL_SIZE'], min_samples=settings.ETA_MODEL['MIN_SAMPLES'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        model.save(options['output'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {options['output']} from {len(data)} trips: {len(model.pair_hour)} cell pair / hour groups, "
+            f"{len(model.pair)} cell pairs, {len(model.hour)} hours of week."
+        ))
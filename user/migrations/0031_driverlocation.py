@@ -0,0 +1,29 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:22
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0030_trip_vehicle_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DriverLocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('latitude', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('longitude', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('recorded_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('driver', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='locations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['driver', 'recorded_at'], name='user_driver_driver__1d567d_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0031_driverlocation'),
+        ('vehicle', '0011_alter_vehicle_vehicle_type_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['vehicle_type', 'status', 'created_at'], name='user_trip_vehicle_b75ef9_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0032_trip_pending_feed_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='driverrequest',
+            index=models.Index(fields=['created_at', 'id'], name='user_driver_created_718f6a_idx'),
+        ),
+    ]
@@ -0,0 +1,112 @@
+from datetime import date
+
+from django.db import migrations
+
+
+# PostgreSQL only: user_trip becomes a table range partitioned by month on
+# created_at (primary key (id, created_at), ids from a plain sequence), plus
+# a default partition and the user_trip_archive table used by
+# `manage_trip_partitions`. Other backends keep the plain table.
+
+MONTHS_AHEAD = 3
+
+
+def add_months(month, count):
+    years, month_index = divmod(month.month - 1 + count, 12)
+    return date(month.year + years, month_index + 1, 1)
+
+
+def table_definition(cursor, table):
+    '''
+        Index and foreign key DDL of `table`, to replay on the rebuilt table.
+    '''
+    cursor.execute(
+        "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname <> %s",
+        [table, f'{table}_pkey'],
+    )
+    indexes = [row[0].replace(' ON ONLY ', ' ON ') for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+        [table],
+    )
+    return indexes, cursor.fetchall()
+
+
+def restore_definition(cursor, indexes, foreign_keys):
+    cursor.execute("CREATE SEQUENCE user_trip_id_seq AS bigint OWNED BY user_trip.id")
+    cursor.execute("SELECT setval('user_trip_id_seq', COALESCE(MAX(id), 0) + 1, false) FROM user_trip")
+    cursor.execute("ALTER TABLE user_trip ALTER COLUMN id SET DEFAULT nextval('user_trip_id_seq')")
+    for index in indexes:
+        cursor.execute(index)
+    for name, definition in foreign_keys:
+        cursor.execute(f'ALTER TABLE user_trip ADD CONSTRAINT "{name}" {definition}')
+
+
+def partition_trips(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        indexes, foreign_keys = table_definition(cursor, 'user_trip')
+        cursor.execute("SELECT MIN(created_at)::date FROM user_trip")
+        oldest = cursor.fetchone()[0] or date.today()
+
+        cursor.execute("ALTER TABLE user_trip RENAME TO user_trip_legacy")
+        cursor.execute(
+            "CREATE TABLE user_trip (LIKE user_trip_legacy INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+            "PARTITION BY RANGE (created_at)"
+        )
+        cursor.execute("ALTER TABLE user_trip ALTER COLUMN id DROP DEFAULT")
+        cursor.execute("CREATE TABLE user_trip_default PARTITION OF user_trip DEFAULT")
+
+        month, last = date(oldest.year, oldest.month, 1), add_months(date.today().replace(day=1), MONTHS_AHEAD)
+        while month <= last:
+            cursor.execute(
+                f"CREATE TABLE user_trip_p{month:%Y_%m} PARTITION OF user_trip "
+                f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{add_months(month, 1).isoformat()} 00:00:00+00')"
+            )
+            month = add_months(month, 1)
+
+        cursor.execute("INSERT INTO user_trip SELECT * FROM user_trip_legacy")
+        cursor.execute("DROP TABLE user_trip_legacy")
+        cursor.execute("ALTER TABLE user_trip ADD CONSTRAINT user_trip_pkey PRIMARY KEY (id, created_at)")
+        restore_definition(cursor, indexes, foreign_keys)
+
+        cursor.execute("CREATE TABLE user_trip_archive (LIKE user_trip INCLUDING CONSTRAINTS)")
+        cursor.execute("ALTER TABLE user_trip_archive ADD CONSTRAINT user_trip_archive_pkey PRIMARY KEY (id)")
+        cursor.execute("CREATE INDEX user_trip_archive_created_at ON user_trip_archive (created_at)")
+        cursor.execute("CREATE INDEX user_trip_archive_customer_id ON user_trip_archive (customer_id)")
+        cursor.execute("CREATE INDEX user_trip_archive_driver_id ON user_trip_archive (driver_id)")
+
+
+def unpartition_trips(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        indexes, foreign_keys = table_definition(cursor, 'user_trip')
+
+        cursor.execute("ALTER TABLE user_trip RENAME TO user_trip_partitioned")
+        cursor.execute("CREATE TABLE user_trip (LIKE user_trip_partitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cursor.execute("ALTER TABLE user_trip ALTER COLUMN id DROP DEFAULT")
+
+        cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'user_trip' ORDER BY ordinal_position")
+        columns = ', '.join(f'"{row[0]}"' for row in cursor.fetchall())
+        cursor.execute(f"INSERT INTO user_trip ({columns}) SELECT {columns} FROM user_trip_partitioned")
+        cursor.execute(f"INSERT INTO user_trip ({columns}) SELECT {columns} FROM user_trip_archive")
+        cursor.execute("DROP TABLE user_trip_partitioned CASCADE")
+        cursor.execute("DROP TABLE user_trip_archive")
+
+        cursor.execute("ALTER TABLE user_trip ADD CONSTRAINT user_trip_pkey PRIMARY KEY (id)")
+        restore_definition(cursor, indexes, foreign_keys)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0033_keyset_pagination_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_trips, unpartition_trips),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 19:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0036_tokenuser'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trip',
+            name='quote_nonce',
+            field=models.CharField(blank=True, max_length=16, null=True),
+        ),
+    ]
@@ -4,6 +4,7 @@ from django.db.models.signals import pre_save
 from django.dispatch import receiver
 from django.utils.timezone import now
 from django.core.validators import MaxValueValidator, MinValueValidator
+from django.core.serializers.json import DjangoJSONEncoder
 
 from utils.baseModel import BaseModel
 from Uber import settings
@@ -51,6 +52,37 @@ class User(AbstractUser, BaseModel):
 
 
     USERNAME_FIELD = 'mobile_number'
+    # A change to any of these revokes the user's tokens (utils/tokens.py).
+    ACCESS_FIELDS = ('user_type', 'role_id', 'is_active')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_access = {name: value for name, value in zip(field_names, values) if name in cls.ACCESS_FIELDS}
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using, fields, from_queryset)
+        loaded = self.__dict__.setdefault('_loaded_access', {})
+        for name in self.ACCESS_FIELDS:
+            if name in self.__dict__ and (fields is None or name in fields or name.removesuffix('_id') in fields):
+                loaded[name] = self.__dict__[name]
+
+
+class TokenUser(User):
+    '''
+        User built from JWT claims by utils.tokens.TokenUserAuthentication.
+        Only id, user_type and role_id are set; the first read of any other
+        column loads all of them in one query.
+    '''
+    class Meta:
+        proxy = True
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred:
+            fields = deferred | set(fields)
+        super().refresh_from_db(using, fields, from_queryset)
 
 
 class Language(BaseModel):
@@ -94,6 +126,12 @@ class DriverRequest(BaseModel):
     action_at = models.DateTimeField(null = True, blank=True)
     verification_documents = models.ManyToManyField('DocumentRequired', related_name='driver_request_documents')
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of the admin lists.
+            models.Index(fields=['created_at', 'id']),
+        ]
+
 
 class DocumentRequired(BaseModel):
     document_name = models.ForeignKey('DocumentType', on_delete=models.PROTECT, related_name='documents')
@@ -141,6 +179,15 @@ class TripStatus(models.TextChoices):
     CANCELLED = 'cancelled', 'Cancelled'
 
 
+# action: (statuses it may start from, status it moves the trip to)
+TRIP_TRANSITIONS = {
+    'accept': ((TripStatus.PENDING,), TripStatus.ACCEPTED),
+    'start': ((TripStatus.ACCEPTED,), TripStatus.ON_GOING),
+    'complete': ((TripStatus.ON_GOING,), TripStatus.COMPLETED),
+    'cancel': ((TripStatus.PENDING, TripStatus.ACCEPTED), TripStatus.CANCELLED),
+}
+
+
 class WheelerChoices(models.TextChoices):
     TWO_WHEELER = '2 Wheeler', '2 Wheeler'
     THREE_WHEELER = '3 Wheeler', '3 Wheeler'
@@ -168,6 +215,13 @@ class Trip(BaseModel):
     rating = models.IntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)], null=True, blank=True)
     cancelled_by = models.CharField(max_length=20, choices=CancelByStatus, null=True, blank=True)
     cancelled_at = models.DateTimeField(null=True, blank=True)
+    quote_nonce = models.CharField(max_length=16, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Pending trip feed: equality on type and status, range on age.
+            models.Index(fields=['vehicle_type', 'status', 'created_at']),
+        ]
 
 
 class TripFare(BaseModel):
@@ -180,4 +234,36 @@ class TripFare(BaseModel):
     peak_time_morning_starting = models.TimeField()
     peak_time_morning_ending = models.TimeField()
     peak_time_evening_starting = models.TimeField()
-    peak_time_evening_ending = models.TimeField()
\ No newline at end of file
+    peak_time_evening_ending = models.TimeField()
+
+class DriverLocation(models.Model):
+    '''
+        Append-only trail of driver location pings, written in batches.
+    '''
+    driver = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="locations", db_index=False)
+    latitude = models.DecimalField(max_digits=9, decimal_places=6)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6)
+    recorded_at = models.DateTimeField(default=now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['driver', 'recorded_at']),
+        ]
+
+
+class OutboxMessage(models.Model):
+    '''
+        Side effect recorded in the same transaction as the change causing it
+        and delivered later by the outbox relay (at least once).
+    '''
+    topic = models.CharField(max_length=50)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=now)
+    available_at = models.DateTimeField(default=now)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['available_at', 'id'], name='outbox_available_idx'),
+        ]
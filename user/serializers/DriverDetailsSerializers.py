@@ -36,7 +36,7 @@ class VerificationRequestSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         if validated_data['profile_pic']:
-            user = User.objects.filter(mobile_number=self.context['user']).first()
+            user = self.context['user']
             if validated_data['profile_pic'].content_type not in ["image/jpeg", "image/png", "image/jpg", "image/webp"]:
                 errors = {"profile_pic":"Profile Picture must be an image."}
                 raise CustomValidationError(errors)
@@ -187,7 +187,12 @@ class ImpersonationSerializer(serializers.Serializer):
 class DriverTripPendingSerializer(serializers.ModelSerializer):
     first_name = serializers.CharField(source='customer.first_name')
     last_name = serializers.CharField(source='customer.last_name')
+    pickup_distance = serializers.SerializerMethodField()
 
     class Meta:
         model = Trip
-        fields = ('id', 'pickup_location', 'drop_location', 'vehicle_type', 'distance', 'fare', 'first_name', 'last_name')
+        fields = ('id', 'pickup_location', 'drop_location', 'vehicle_type', 'distance', 'fare', 'first_name', 'last_name', 'pickup_distance')
+
+    def get_pickup_distance(self, obj):
+        distance = getattr(obj, 'pickup_distance', None)
+        return round(distance / 1000, 2) if distance is not None else None
@@ -5,8 +5,9 @@ from django.utils import timezone
 from rest_framework import serializers
 from rest_framework.exceptions import APIException
 from ..models import User, DriverRequest
+from utils.otpStore import get_otp_store, OtpRateLimited, VERIFIED, EXPIRED, TOO_MANY_ATTEMPTS
 
-import secrets, random
+import secrets
 
 
 
@@ -22,6 +23,18 @@ class CustomValidationError(APIException):
         }
 
 
+class OtpRateLimitError(CustomValidationError):
+    status_code = 429
+
+
+def issue_otp(mobile_number):
+    try:
+        return get_otp_store().issue(mobile_number)
+    except OtpRateLimited as e:
+        errors = {"mobile_number": f"Too many OTP requests. Try again in {e.retry_after} seconds."}
+        raise OtpRateLimitError(errors)
+
+
 class mobileNumberSerializer(serializers.Serializer):
     mobile_number = serializers.CharField(max_length=18)
 
@@ -44,14 +57,8 @@ class mobileNumberSerializer(serializers.Serializer):
 
     def create(self, validated_data):
         mobile_number = validated_data['mobile_number']
-        otp = random.randint(1000, 9999)
-        user = User.objects.get(
-            mobile_number=mobile_number
-        )
-        user.otp = otp
-        user.otp_created_at = timezone.now().time()
-        user.save()
-        return {"message": "OTP generated successfully", "mobile_number" : mobile_number, "otp": otp, "user": user}
+        otp = issue_otp(mobile_number)
+        return {"message": "OTP generated successfully", "mobile_number" : mobile_number, "otp": otp}
 
 
 class OtpVerificationSerializer(serializers.Serializer):
@@ -61,12 +68,6 @@ class OtpVerificationSerializer(serializers.Serializer):
     def validate(self, data):
         otp = data["otp"]
         mobile_number = data["mobile_number"]
-        user = User.objects.get(mobile_number=mobile_number)
-        otp_age = (timezone.now() - timedelta(minutes=2)).time()
-        if user.otp_created_at < otp_age:
-            errors = {"otp":"OTP has expired. Please request a new one."}
-            raise CustomValidationError(errors)
-
         if not otp.isdigit():
             errors = {"otp": "OTP must contain only numeric characters."}
             raise CustomValidationError(errors)
@@ -75,17 +76,29 @@ class OtpVerificationSerializer(serializers.Serializer):
             errors = {"otp": "OTP must be exactly 4 digits long."}
             raise CustomValidationError(errors)
 
-        otp = int(otp)
-        user = User.objects.filter(mobile_number = mobile_number).first()
+        result = get_otp_store().verify(mobile_number, otp)
+        if result == EXPIRED:
+            errors = {"otp":"OTP has expired. Please request a new one."}
+            raise CustomValidationError(errors)
+
+        if result == TOO_MANY_ATTEMPTS:
+            errors = {"otp": "Too many attempts. Please request a new OTP."}
+            raise CustomValidationError(errors)
 
-        if user.otp != otp:
+        if result != VERIFIED:
             errors = {"otp":  "Invalid OTP."}
             raise CustomValidationError(errors)
 
-        if DriverRequest.objects.filter(user = user).exists():
-            if DriverRequest.objects.filter(user = user, status='pending').exists():
-                errors = {"login":  "Your application is under verification."}
-                raise CustomValidationError(errors)
+        # The User table is only read once the code checks out.
+        user = User.objects.filter(mobile_number = mobile_number).first()
+        if user is None:
+            errors = {"mobile_number": "Mobile number does not exist!"}
+            raise CustomValidationError(errors)
+
+        data["user"] = user
+        if DriverRequest.objects.filter(user = user, status='pending').exists():
+            errors = {"login":  "Your application is under verification."}
+            raise CustomValidationError(errors)
 
 
         return data
@@ -142,14 +155,7 @@ class CustomUserSerializer(serializers.ModelSerializer):
         return data
 
     def create(self, validated_data):
-        user = User.objects.create(**validated_data)
-        user.verification_code = secrets.token_hex(32)
-        user.verification_code_created_at = timezone.now()
-        otp = random.randint(1000,9999)
-        user.otp = otp
-        user.otp_created_at = timezone.now().time()
-        user.save()
-        return user
+        return User.objects.create(**validated_data, verification_code=secrets.token_hex(32), verification_code_created_at=timezone.now())
 
 
 class LoginSerializer(serializers.Serializer):
@@ -191,7 +197,6 @@ class ChangePasswordSerializer(serializers.Serializer):
 
     def validate(self, data):
         user = self.context["user"]
-        user = User.objects.get(mobile_number = user)
         if not check_password(data['old_password'], user.password):
             errors = {"password":  "old Password is incorrect."}
             raise CustomValidationError(errors)
@@ -207,7 +212,7 @@ class ChangePasswordSerializer(serializers.Serializer):
         return data
 
     def update(self , instance, validated_data):
-        user = User.objects.get(mobile_number = self.context['user'])
+        user = self.context['user']
         user.set_password(validated_data['new_password'])
         user.save()
         return validated_data
@@ -1,9 +1,18 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.utils import timezone
 from rest_framework import serializers
 from rest_framework.exceptions import APIException
 
 from ..models import Trip, User
+from utils.quotes import read_quote, QuoteError
+from Uber import settings
+
 
 
+CENTS = Decimal('0.01')
+
 
 class CustomValidationError(APIException):
     status_code = 400
@@ -18,27 +27,23 @@ class CustomValidationError(APIException):
 
 
 class TripSerializer(serializers.ModelSerializer):
+    quote = serializers.CharField(write_only=True)
 
     class Meta:
         model = Trip
-        fields = ('drop_location_latitude', 'drop_location_longitude', 'vehicle_type', 'pickup_location_latitude', 'pickup_location_longitude', 'pickup_location', 'drop_location', 'distance', 'estimated_time', 'fare',)
+        fields = ('quote', 'drop_location_latitude', 'drop_location_longitude', 'vehicle_type', 'pickup_location_latitude', 'pickup_location_longitude', 'pickup_location', 'drop_location', 'distance', 'estimated_time', 'fare',)
+        read_only_fields = ('drop_location_latitude', 'drop_location_longitude', 'pickup_location_latitude', 'pickup_location_longitude', 'distance', 'estimated_time', 'fare',)
 
     def validate(self, data):
         user = self.context['user']
-        if not User.objects.filter(id=user.id, user_type='customer').exists():
+        if user.user_type != 'customer':
             errors = {"user": "Only rider can do this action! if Registered."}
             raise CustomValidationError(errors)
 
         required_fields = [
-            'drop_location_latitude',
-            'drop_location_longitude',
-            'pickup_location_latitude',
-            'pickup_location_longitude',
+            'quote',
             'pickup_location',
             'drop_location',
-            'distance',
-            'estimated_time',
-            'fare',
             'vehicle_type',
         ]
 
@@ -46,10 +51,53 @@ class TripSerializer(serializers.ModelSerializer):
             if not data.get(field):
                 raise CustomValidationError({field: f"{field} is required."})
 
+        # Route and fare come from the signed quote issued by tripDetails,
+        # never from the client.
+        try:
+            quote = read_quote(data.pop('quote'), user.id)
+        except QuoteError as e:
+            raise CustomValidationError({"quote": str(e)})
+
+        fare = quote['f'].get(data['vehicle_type'].lower())
+        if fare is None:
+            raise CustomValidationError({"vehicle_type": "No fare quoted for this vehicle type."})
+
+        data['pickup_location_latitude'], data['pickup_location_longitude'] = (Decimal(value) for value in quote['p'])
+        data['drop_location_latitude'], data['drop_location_longitude'] = (Decimal(value) for value in quote['d'])
+        data['distance'] = Decimal(quote['km']).quantize(CENTS)
+        data['estimated_time'] = Decimal(quote['min']).quantize(CENTS)
+        data['fare'] = Decimal(fare).quantize(CENTS)
+        data['quote_nonce'] = quote['n']
         return data
 
 
     def create(self, validated_data):
+        '''
+            Call inside a transaction: the customer row is locked so two
+            bookings of the same quote run in turn and the second one sees
+            the first trip. Only trips younger than the quote TTL can hold
+            the nonce, which keeps the lookup to the newest partitions.
+        '''
         user = self.context.get('user')
+        list(User.objects.select_for_update().filter(id=user.id).values_list('id', flat=True))
+        booked_since = timezone.now() - timedelta(seconds=settings.TRIP_QUOTE['TTL'])
+        if Trip.objects.filter(customer_id=user.id, quote_nonce=validated_data['quote_nonce'], created_at__gte=booked_since).exists():
+            raise CustomValidationError({"quote": "Quote has already been used."})
         trip = Trip.objects.create(customer=user, **validated_data)
-        return trip
\ No newline at end of file
+        return trip
+
+
+class TripQuoteBatchSerializer(serializers.Serializer):
+    pairs = serializers.ListField(
+        child=serializers.ListField(child=serializers.FloatField(), min_length=4, max_length=4),
+        allow_empty=False,
+        max_length=settings.TRIP_QUOTE_BATCH['MAX_PAIRS'],
+    )
+
+    def validate_pairs(self, pairs):
+        for index, (pickup_lat, pickup_long, drop_lat, drop_long) in enumerate(pairs):
+            if not (-90 <= pickup_lat <= 90 and -90 <= drop_lat <= 90):
+                raise CustomValidationError({"pairs": f"Latitude out of range at index {index}."})
+            if not (-180 <= pickup_long <= 180 and -180 <= drop_long <= 180):
+                raise CustomValidationError({"pairs": f"Longitude out of range at index {index}."})
+        return pairs
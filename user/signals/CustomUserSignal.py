@@ -1,52 +1,70 @@
-from django.db.models.signals import pre_save, post_save
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
-from user.models import User
+from user.models import User, TokenUser
+from user.tasks import generate_profile_thumbnails
+from utils.tokens import revoke_user_tokens
 from django.utils import timezone
-from PIL import Image
-import os
 
+# TokenUser is a proxy, so saves through request.user signal with it as sender.
 @receiver(pre_save, sender=User)
+@receiver(pre_save, sender=TokenUser)
 def updated_at_pre_save(sender,instance, **kwargs):
     instance.updated_at = timezone.now()
 
-@receiver(post_save, sender=User)
-
-def create_thumbnail(sender, instance, **kwargs):
-    if instance.profile_pic and not instance.thumbnail_pic:
-        thumbnail_size = (100, 100)
-        profile_pic_path = instance.profile_pic.path
-        file_name = os.path.basename(profile_pic_path)
-        thumbnail_pic_path = os.path.join('media/', 'thumbnail_pics/', file_name)
-
-        # Create directory for the thumbnail if it doesn't exist
-        os.makedirs(os.path.dirname(thumbnail_pic_path), exist_ok=True)
-
-        with Image.open(profile_pic_path) as img:
-            img.thumbnail(thumbnail_size)
-            img.save(thumbnail_pic_path)
-
-        # Save the thumbnail path (remove "media/" prefix)
-        instance.thumbnail_pic = thumbnail_pic_path.split("media/", 1)[1]
-        instance.save()
-
-    # Check if both profile_pic and thumbnail_pic exist and if they are the same
-    elif instance.profile_pic and instance.thumbnail_pic:
-        profile_pic_filename = os.path.basename(instance.profile_pic.path)
-        thumbnail_pic_filename = os.path.basename(instance.thumbnail_pic.path)
+@receiver(pre_save, sender=User)
+@receiver(pre_save, sender=TokenUser)
+def note_new_profile_pic(sender, instance, update_fields=None, **kwargs):
+    # A freshly assigned upload is uncommitted until the field's own
+    # pre_save stores it; any other save leaves the picture unchanged.
+    # The __dict__ check keeps a deferred picture from being loaded.
+    instance._profile_pic_changed = False
+    if update_fields is not None and 'profile_pic' not in update_fields:
+        return
+    if 'profile_pic' not in instance.__dict__:
+        return
+    picture = instance.profile_pic
+    instance._profile_pic_changed = bool(picture) and not picture._committed
 
-        # If both files are different, create a new thumbnail
-        if profile_pic_filename != thumbnail_pic_filename:
-            thumbnail_size = (100, 100)
-            profile_pic_path = instance.profile_pic.path
-            file_name = os.path.basename(profile_pic_path)
-            thumbnail_pic_path = os.path.join('media/', 'thumbnail_pics/', file_name)
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=TokenUser)
+def queue_thumbnails(sender, instance, **kwargs):
+    # Rendered by a Celery worker once the picture is committed; the task
+    # skips pictures whose content it has already processed. robust=True
+    # logs a broker failure instead of failing the request after commit.
+    if not getattr(instance, '_profile_pic_changed', False):
+        return
+    instance._profile_pic_changed = False
+    transaction.on_commit(lambda: generate_profile_thumbnails.delay(instance.id), robust=True)
 
-            os.makedirs(os.path.dirname(thumbnail_pic_path), exist_ok=True)
+def revoke_tokens(user_id):
+    # Now, so no request trusts the old claims while the change commits, and
+    # again after commit, so a token refreshed from the old row in between
+    # is rejected too.
+    revoke_user_tokens(user_id)
+    transaction.on_commit(partial(revoke_user_tokens, user_id), robust=True)
 
-            with Image.open(profile_pic_path) as img:
-                img.thumbnail(thumbnail_size)
-                img.save(thumbnail_pic_path)
+@receiver(pre_save, sender=User)
+@receiver(pre_save, sender=TokenUser)
+def revoke_tokens_on_access_change(sender, instance, update_fields=None, **kwargs):
+    # Tokens carry user_type and role_id as claims; compared with the values
+    # the instance was loaded with, so no query is needed.
+    names = [
+        name for name in User.ACCESS_FIELDS
+        if name in instance.__dict__ and (update_fields is None or name in update_fields or name.removesuffix('_id') in update_fields)
+    ]
+    current = {name: instance.__dict__[name] for name in names}
+    loaded = instance.__dict__.get('_loaded_access')
+    if instance._state.adding:
+        instance._loaded_access = current
+        return
+    if loaded is None or any(name not in loaded or loaded[name] != value for name, value in current.items()):
+        revoke_tokens(instance.pk)
+        instance._loaded_access = {**(loaded or {}), **current}
 
-            # Save the thumbnail path (remove "media/" prefix)
-            instance.thumbnail_pic = thumbnail_pic_path.split("media/", 1)[1]
-            instance.save()
\ No newline at end of file
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=TokenUser)
+def revoke_tokens_on_delete(sender, instance, **kwargs):
+    revoke_tokens(instance.pk)
@@ -0,0 +1,18 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from user.models import Role, Permission, RolePermission
+from utils.rolePermissions import invalidate_role_permissions
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+@receiver(post_save, sender=RolePermission)
+@receiver(post_delete, sender=RolePermission)
+@receiver(m2m_changed, sender=RolePermission.permissions.through)
+def refresh_role_permissions(sender, **kwargs):
+    # Drop the stale registry now and again once committed, so a check that
+    # recompiled mid-transaction does not keep the old permissions.
+    invalidate_role_permissions()
+    transaction.on_commit(invalidate_role_permissions)
@@ -0,0 +1,11 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from user.models import TripFare
+from utils.fareSchedule import rebuild_fare_schedule
+
+@receiver(post_save, sender=TripFare)
+@receiver(post_delete, sender=TripFare)
+def refresh_fare_schedule(sender, instance, **kwargs):
+    # Recompile once the change is committed so the new table sees it.
+    transaction.on_commit(rebuild_fare_schedule)
@@ -0,0 +1,76 @@
+import hashlib
+import os
+from io import BytesIO
+
+from celery import shared_task
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from Uber import settings
+from .models import User
+
+
+THUMBNAIL_FOLDER = 'thumbnail_pics'
+
+
+
+def thumbnail_names(digest, size, has_alpha):
+    base = os.path.join(THUMBNAIL_FOLDER, digest, str(size))
+    return base + ('.png' if has_alpha else '.jpg'), base + '.webp'
+
+
+def render_thumbnails(image, digest, storage):
+    '''
+        Write every configured size plus its WebP copy; returns the name of
+        the smallest one. Files already written for this digest are kept.
+    '''
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    names = []
+    for size in sorted(settings.THUMBNAILS['SIZES']):
+        name, webp_name = thumbnail_names(digest, size, has_alpha)
+        names.append(name)
+        if storage.exists(name) and storage.exists(webp_name):
+            continue
+        thumbnail = image.copy()
+        thumbnail.thumbnail((size, size), Image.LANCZOS)
+        for file_name, format, options in (
+            (name, 'PNG' if has_alpha else 'JPEG', {'optimize': True} if has_alpha else {'quality': settings.THUMBNAILS['QUALITY'], 'optimize': True}),
+            (webp_name, 'WEBP', {'quality': settings.THUMBNAILS['WEBP_QUALITY']}),
+        ):
+            buffer = BytesIO()
+            thumbnail.save(buffer, format, **options)
+            if storage.exists(file_name):
+                storage.delete(file_name)
+            storage.save(file_name, ContentFile(buffer.getvalue()))
+    return names[0]
+
+
+@shared_task
+def generate_profile_thumbnails(user_id):
+    '''
+        Thumbnails for a user's profile picture, stored under the sha256 of
+        its content so an unchanged picture is never decoded again. The
+        result is written with .update(), which sends no save signals.
+    '''
+    row = User.objects.filter(id=user_id).values('profile_pic', 'thumbnail_pic').first()
+    if row is None or not row['profile_pic']:
+        return None
+
+    storage = User._meta.get_field('profile_pic').storage
+    with storage.open(row['profile_pic'], 'rb') as picture:
+        content = picture.read()
+    digest = hashlib.sha256(content).hexdigest()[:32]
+
+    current = row['thumbnail_pic'] or ''
+    if current.startswith(os.path.join(THUMBNAIL_FOLDER, digest, '')) and storage.exists(current):
+        return current
+
+    with Image.open(BytesIO(content)) as image:
+        thumbnail_pic = render_thumbnails(image, digest, storage)
+
+    # Skip the write if the picture was replaced while this ran; that save queued its own task.
+    User.objects.filter(id=user_id, profile_pic=row['profile_pic']).update(thumbnail_pic=thumbnail_pic)
+    return thumbnail_pic
@@ -1,3 +1,1688 @@
-from django.test import TestCase
+import asyncio
+import base64
+import json
+import math
+import os
+import random
+import shutil
+import tempfile
+import time
+from contextlib import nullcontext
+from datetime import date, datetime, time as clock, timedelta
+from decimal import Decimal
+from io import BytesIO
+from itertools import count, permutations, product
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+import requests
+from rest_framework.exceptions import AuthenticationFailed, NotFound
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from user import urls
+from user.models import (
+    User, Role, Permission, RolePermission, DriverDetail, DriverRequest, DocumentType, DocumentRequired,
+    DriverLocation, Language, OutboxMessage, Trip, TripFare, TripStatus,
+)
+from user.tasks import generate_profile_thumbnails
+from vehicle.models import Vehicle
+from utils.assignment import SOLVERS, UNREACHABLE, greedy, hungarian
+from utils.driverIndex import DriverIndex, driver_index
+from utils.etaModel import EtaModel, straight_km
+from utils.helper import aroute_or_estimate
+from utils.fareSchedule import FareSchedule, rebuild_fare_schedule
+from utils.locationBuffer import LocationBuffer
+from utils.matching import MatchingEngine
+from utils.pagination import KeysetPagination, NearestFirstCursorPagination
+from utils.outbox import HANDLERS, OutboxRelay
+from utils.otpStore import CacheOtpStore, LocalOtpStore, OtpRateLimited, get_otp_store, set_otp_store, VERIFIED, INVALID, EXPIRED, TOO_MANY_ATTEMPTS
+from utils.queryBudget import QueryBudgetMixin, unbudgeted_routes
+from utils import rolePermissions
+from utils.rolePermissions import get_role_permissions, invalidate_role_permissions, rebuild_role_permissions
+from utils.tokens import PermissionRefreshToken, TokenUserAuthentication
+from utils.quotes import QuoteError, read_quote, sign_quote
+from utils.routeCache import RouteCache, route_cache
+from utils.roadGraph import NoRouteFound, RoadGraph, haversine_m
+from utils.surge import SlidingCounter, SurgeEngine, surge_engine
+from utils.routingBackends import LocalGraphBackend, OpenRouteServiceBackend, RoutingBackend, RoutingError, StubRoutingBackend, set_routing_backend
+from utils.serializerBenchmarks import compare
+
+
+PERMISSIONS = [
+    'user_view', 'user_edit', 'vehicle_view', 'vehicle_edit',
+    'add_team_member', 'view_team_members', 'edit_team_member', 'remove_team_member',
+]
+PASSWORD = 'Secret#123'
+PICKUP = (Decimal('23.022500'), Decimal('72.571400'))
+DROP = (Decimal('23.100000'), Decimal('72.600000'))
+
+sequence = count(1)
+
+
+
+def create_users(rows, user_type='customer', **fields):
+    return User.objects.bulk_create([
+        User(mobile_number=f'+91{next(sequence):010d}', first_name='Test', last_name=str(index), user_type=user_type, **fields)
+        for index in range(rows)
+    ])
+
+
+def create_drivers(rows, vehicle_type='2 Wheeler'):
+    '''
+        Drivers with a verified vehicle in use.
+    '''
+    users = create_users(rows, 'driver')
+    details = DriverDetail.objects.bulk_create([DriverDetail(user=user, dob=date(1990, 1, 1)) for user in users])
+    vehicles = Vehicle.objects.bulk_create([
+        Vehicle(driver=detail, vehicle_number=f'GJ{next(sequence):08d}', vehicle_type=vehicle_type, verified_at=timezone.now())
+        for detail in details
+    ])
+    for detail, vehicle in zip(details, vehicles):
+        detail.in_use = vehicle
+    DriverDetail.objects.bulk_update(details, ['in_use'])
+    return users
+
+
+def create_trips(rows, customer, status=TripStatus.PENDING, driver=None, vehicle_type='2 Wheeler'):
+    return Trip.objects.bulk_create([
+        Trip(customer=customer, driver=driver, vehicle_type=vehicle_type, status=status, pickup_location='A', drop_location='B',
+             pickup_location_latitude=PICKUP[0], pickup_location_longitude=PICKUP[1],
+             drop_location_latitude=DROP[0], drop_location_longitude=DROP[1],
+             distance=Decimal('10.00'), estimated_time=Decimal('20.00'), fare=Decimal('75.00'))
+        for _ in range(rows)
+    ])
+
+
+def create_driver_requests(rows, status='pending', documents=2):
+    document_type = DocumentType.objects.get_or_create(document_key='aadhar_number', defaults={'document_label': 'Aadhar', 'field_type': 'text'})[0]
+    requests = DriverRequest.objects.bulk_create([DriverRequest(user=user, dob=date(1990, 1, 1), status=status) for user in create_users(rows, 'driver')])
+    for request in requests:
+        request.verification_documents.set(DocumentRequired.objects.bulk_create([
+            DocumentRequired(document_name=document_type, document_text=f'{next(sequence):012d}') for _ in range(documents)
+        ]))
+    return requests
+
+
+class UserQueryBudgetTests(QueryBudgetMixin, TestCase):
+    '''
+        Every user endpoint stays within the QUERY_BUDGETS in user/urls.py,
+        whatever the number of rows behind it.
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        permissions = Permission.objects.bulk_create([Permission(permission_name=name, description=name) for name in PERMISSIONS])
+        cls.role = Role.objects.create(role_name='CEO', description='Everything')
+        RolePermission.objects.create(role=cls.role).permissions.set(permissions)
+        cls.admin = create_users(1, 'admin', role=cls.role, email='admin@example.com')[0]
+        cls.admin.set_password(PASSWORD)
+        cls.admin.save()
+        cls.customer = create_users(1, 'customer')[0]
+        TripFare.objects.bulk_create([
+            TripFare(vehicle_type=vehicle_type, normal_fare=rate, night_time_fare=3, peak_time_fare=Decimal('2.5'),
+                     night_time_starting=clock(22, 30), night_time_ending=clock(7, 0),
+                     peak_time_morning_starting=clock(9, 0), peak_time_morning_ending=clock(11, 0),
+                     peak_time_evening_starting=clock(18, 0), peak_time_evening_ending=clock(20, 0))
+            for vehicle_type, rate in (('2 Wheeler', 7), ('3 Wheeler', 10), ('4 Wheeler', 15))
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        get_role_permissions()
+        rebuild_fare_schedule()
+        self.previous_backend = set_routing_backend(StubRoutingBackend())
+        self.previous_otp_store = set_otp_store(LocalOtpStore())
+
+    def tearDown(self):
+        set_routing_backend(self.previous_backend)
+        set_otp_store(self.previous_otp_store)
+
+    def login(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {PermissionRefreshToken.for_user(user).access_token}')
+
+    def test_every_route_has_a_budget(self):
+        self.assertEqual(unbudgeted_routes(urls), [])
+
+    # Signup and login
+
+    def test_login(self):
+        self.assertQueryBudget(lambda _: self.client.post('/login', {'email': 'admin@example.com', 'password': PASSWORD}, format='json'))
+
+    def test_signup(self):
+        def request(_):
+            mobile_number = f'+91{next(sequence):010d}'
+            return self.client.post('/signup', {'first_name': 'New', 'last_name': 'Rider', 'mobile_number': mobile_number, 'user_type': 'customer',
+                                                'dob': '1990-01-01', 'address': 'Street'}, format='json')
+        self.assertQueryBudget(request)
+
+    def test_mobile_number(self):
+        self.assertQueryBudget(lambda _: self.client.post('/mobile_number', {'mobile_number': self.customer.mobile_number}, format='json'))
+
+    def test_otp_verification(self):
+        def scale(rows):
+            user = create_users(1)[0]
+            create_trips(rows, user, TripStatus.COMPLETED)
+            return user, get_otp_store().issue(user.mobile_number)
+        self.assertQueryBudget(lambda target: self.client.post('/otp-verification', {'mobile_number': target[0].mobile_number, 'otp': str(target[1])}, format='json'), scale)
+
+    def test_resend_otp(self):
+        self.assertQueryBudget(lambda _: self.client.put('/resendOtpView', {'mobile_number': self.customer.mobile_number}, format='json'))
+
+    def test_token(self):
+        self.assertQueryBudget(lambda _: self.client.post('/api/token/', {'mobile_number': self.admin.mobile_number, 'password': PASSWORD}, format='json'))
+
+    def test_token_refresh(self):
+        self.assertQueryBudget(lambda _: self.client.post('/api/token/refresh/', {'refresh': str(RefreshToken.for_user(self.admin))}, format='json'))
+
+    # Team members, roles and permissions
+
+    def test_add_team_member(self):
+        def request(_):
+            self.login(self.admin)
+            number = next(sequence)
+            return self.client.post('/addTeamMemberView', {'first_name': 'Team', 'last_name': 'Member', 'mobile_number': f'+91{number:010d}',
+                                                           'email': f'member{number}@example.com', 'password': PASSWORD, 'role': self.role.id}, format='json')
+        self.assertQueryBudget(request)
+
+    def test_list_team_members(self):
+        self.login(self.admin)
+        self.assertQueryBudget(lambda _: self.client.get('/listTeamMemberView'), lambda rows: create_users(rows, 'admin', role=self.role))
+
+    def test_update_team_member(self):
+        member = create_users(1, 'admin', role=self.role)[0]
+        self.assertQueryBudget(lambda _: self.client.patch(f'/updateTeamMemberView/{member.id}', {'first_name': 'Renamed'}, format='json'))
+
+    def test_destroy_team_member(self):
+        self.login(self.admin)
+        self.assertQueryBudget(
+            lambda member: self.client.delete(f'/destroyTeamMemberView/{member.id}'),
+            lambda rows: create_users(1, 'admin', role=self.role)[0],
+        )
+
+    def test_admin_rights(self):
+        self.login(self.admin)
+        member = create_users(1, 'admin', role=self.role, verification_code='c' * 64)[0]
+        self.assertQueryBudget(lambda _: self.client.get(f'/adminRights/{member.verification_code}'))
+
+    def test_create_role(self):
+        self.assertQueryBudget(lambda _: self.client.post('/createRoles', {'role_name': f'Role {next(sequence)}', 'description': 'Role'}, format='json'))
+
+    def test_retrieve_role(self):
+        self.assertQueryBudget(lambda _: self.client.get(f'/retrieveUpdateDestroyRoles/{self.role.id}'))
+
+    def test_role_list(self):
+        self.assertQueryBudget(
+            lambda _: self.client.get('/roleListView'),
+            lambda rows: Role.objects.bulk_create([Role(role_name=f'Role {next(sequence)}', description='Role') for _ in range(rows)]),
+        )
+
+    def test_create_permission(self):
+        self.assertQueryBudget(lambda _: self.client.post('/createPermission', {'permission_name': f'permission_{next(sequence)}', 'description': 'Permission'}, format='json'))
+
+    def test_retrieve_permission(self):
+        permission = Permission.objects.first()
+        self.assertQueryBudget(lambda _: self.client.get(f'/retrieveUpdateDestroyPermission/{permission.id}'))
+
+    # Profile and passwords
+
+    def test_profile(self):
+        self.login(self.customer)
+        self.assertQueryBudget(lambda _: self.client.get('/ProfileView'))
+
+    def test_update_profile(self):
+        self.login(self.customer)
+        self.assertQueryBudget(lambda _: self.client.patch('/updateProfileView', {'first_name': 'Renamed'}, format='json'))
+
+    def test_change_password(self):
+        def scale(rows):
+            user = create_users(1, 'admin', role=self.role)[0]
+            user.set_password(PASSWORD)
+            user.save()
+            return user
+
+        def request(user):
+            self.login(user)
+            return self.client.put('/changePasswordView', {'old_password': PASSWORD, 'new_password': 'Other#123', 'confirm_password': 'Other#123'}, format='json')
+        self.assertQueryBudget(request, scale)
+
+    def test_forgot_password(self):
+        self.assertQueryBudget(lambda _: self.client.post('/forgotpassword', {'email': 'admin@example.com'}, format='json'))
+
+    def test_reset_password(self):
+        def scale(rows):
+            return create_users(1, 'admin', role=self.role, verification_code=f'{next(sequence):064d}', verification_code_created_at=timezone.now())[0]
+        self.assertQueryBudget(
+            lambda user: self.client.put(f'/forgot-password/{user.verification_code}', {'password': 'Other#123', 'confirm_password': 'Other#123'}, format='json'),
+            scale,
+        )
+
+    # Drivers
+
+    def test_admin_driver_status_list(self):
+        self.login(self.admin)
+        self.assertQueryBudget(lambda _: self.client.get('/adminDriverStatusList'), create_driver_requests)
+
+    def test_driver_document_types(self):
+        self.login(self.customer)
+        self.assertQueryBudget(
+            lambda _: self.client.get('/add-driver-details'),
+            lambda rows: DocumentType.objects.bulk_create([
+                DocumentType(document_key=f'document_{next(sequence)}', document_label='Document', field_type='text') for _ in range(rows)
+            ]),
+        )
+
+    def test_admin_verify_driver(self):
+        self.login(self.admin)
+        self.assertQueryBudget(
+            lambda request: self.client.patch(f'/admin-verify-driver/{request.id}', {'is_approved': 'true'}, format='json'),
+            lambda rows: create_driver_requests(1, documents=rows)[0],
+        )
+
+    def test_impersonation(self):
+        self.login(self.admin)
+        self.assertQueryBudget(
+            lambda request: self.client.post('/ImpersonationView', {'id': request.id, 'type': 'driver'}, format='json'),
+            lambda rows: create_driver_requests(1, documents=rows)[0],
+        )
+
+    def test_driver_personal_details(self):
+        self.login(self.admin)
+        self.assertQueryBudget(
+            lambda request: self.client.get(f'/driverPersonalDetailView/{request.id}'),
+            lambda rows: create_driver_requests(1, 'approved', documents=rows)[0],
+        )
+
+    def test_driver_draft(self):
+        self.login(self.admin)
+        self.assertQueryBudget(lambda _: self.client.get('/driverDraftView'), lambda rows: create_users(rows, 'driver'))
+
+    def test_driver_list(self):
+        self.login(self.admin)
+        self.assertQueryBudget(lambda _: self.client.get('/driverListView'), lambda rows: create_driver_requests(rows, 'approved'))
+
+    def test_languages(self):
+        self.assertQueryBudget(
+            lambda _: self.client.get('/languagesListView'),
+            lambda rows: Language.objects.bulk_create([Language(name=f'Language {next(sequence)}') for _ in range(rows)]),
+        )
+
+    def test_user_count(self):
+        self.login(self.admin)
+        self.assertQueryBudget(lambda _: self.client.get('/userCountView'), lambda rows: create_driver_requests(rows))
+
+    def test_driver_trip_pending(self):
+        driver = create_drivers(1)[0]
+        self.login(driver)
+        self.assertQueryBudget(lambda _: self.client.get('/driverTripPendingView'), lambda rows: create_trips(rows, self.customer))
+
+    # Trips
+
+    def test_trip_details(self):
+        self.login(self.customer)
+        self.assertQueryBudget(lambda _: self.client.post('/tripDetails', {
+            'pickup_location_latitude': str(PICKUP[0]), 'pickup_location_longitude': str(PICKUP[1]),
+            'drop_location_latitude': str(DROP[0]), 'drop_location_longitude': str(DROP[1]),
+            'pickup_location': 'A', 'drop_location': 'B',
+        }, format='json'))
+
+    def test_trip_details_batch(self):
+        self.login(self.customer)
+        self.assertQueryBudget(
+            lambda rows: self.client.post('/tripDetailsBatch', {'pairs': [[float(PICKUP[0]), float(PICKUP[1]), float(DROP[0]) + index / 1000, float(DROP[1])] for index in range(rows)]}, format='json'),
+            lambda rows: rows,
+        )
+
+    def test_add_trip(self):
+        self.login(self.customer)
+
+        def scale(rows):
+            for driver in create_drivers(rows):
+                driver_index.update(driver.id, float(PICKUP[0]), float(PICKUP[1]), '2 Wheeler')
+            return sign_quote(self.customer.id, PICKUP, DROP, Decimal('10'), Decimal('20'), {'2 Wheeler': Decimal('75')})[0]
+
+        try:
+            self.assertQueryBudget(
+                lambda quote: self.client.post('/addTripDetails', {'quote': quote, 'vehicle_type': '2 Wheeler', 'pickup_location': 'A', 'drop_location': 'B'}, format='json'),
+                scale,
+            )
+        finally:
+            for driver_id, _, _ in driver_index.snapshot():
+                driver_index.remove(driver_id)
+
+    def transition(self, action, status, assigned):
+        def scale(rows):
+            driver = create_drivers(1)[0]
+            trips = create_trips(rows, self.customer, status, driver if assigned else None)
+            return driver, trips[-1]
+
+        def request(target):
+            driver, trip = target
+            self.login(driver)
+            return self.client.post(f'/{action}/{trip.id}')
+        response = self.assertQueryBudget(request, scale)
+        self.assertEqual(response.status_code, 200)
+
+    def test_accept_trip(self):
+        self.transition('acceptTrip', TripStatus.PENDING, assigned=False)
+
+    def test_start_trip(self):
+        self.transition('startTrip', TripStatus.ACCEPTED, assigned=True)
+
+    def test_complete_trip(self):
+        self.transition('completeTrip', TripStatus.ON_GOING, assigned=True)
+
+    def test_cancel_trip(self):
+        self.transition('cancelTrip', TripStatus.ACCEPTED, assigned=True)
+
+
+class KeysetPaginationTests(TestCase):
+    '''
+        Walking forward and back through every page visits each row once,
+        in order, including ties and NULL ordering keys.
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        dobs = [date(1990, 1, 1), None, date(1985, 6, 1), date(1990, 1, 1), None, date(1985, 6, 1), date(1990, 1, 1), date(1970, 3, 3), None]
+        cls.users = create_users(len(dobs))
+        for user, dob in zip(cls.users, dobs):
+            user.dob = dob
+        User.objects.bulk_update(cls.users, ['dob'])
+
+    def page(self, ordering, cursor=None, page_size=2):
+        paginator = KeysetPagination()
+        view = type('View', (), {'ordering': ordering})()
+        query = {'page_size': page_size, **({'cursor': cursor} if cursor else {})}
+        request = Request(APIRequestFactory().get('/users', query))
+        page = paginator.paginate_queryset(User.objects.filter(id__in=[user.id for user in self.users]), request, view)
+        links = paginator.get_paginated_response([]).data
+        return [user.id for user in page], self.cursor(links['next']), self.cursor(links['previous'])
+
+    @staticmethod
+    def cursor(link):
+        return parse_qs(urlparse(link).query)['cursor'][0] if link else None
+
+    def expected(self, descending):
+        dated = sorted((user for user in self.users if user.dob), key=lambda user: (user.dob, user.id), reverse=descending)
+        undated = sorted((user for user in self.users if not user.dob), key=lambda user: user.id, reverse=descending)
+        return [user.id for user in dated + undated]
+
+    def test_forward_and_back(self):
+        for ordering in ('-dob', 'dob'):
+            with self.subTest(ordering):
+                pages, cursor = [], None
+                while True:
+                    ids, cursor, previous = self.page(ordering, cursor)
+                    self.assertEqual(previous is None, not pages)
+                    pages.append((ids, previous))
+                    if cursor is None:
+                        break
+                self.assertEqual([user_id for ids, _ in pages for user_id in ids], self.expected(ordering.startswith('-')))
+
+                # Each page's previous link leads back to the page before it.
+                for (earlier, _), (_, previous) in zip(pages, pages[1:]):
+                    self.assertEqual(self.page(ordering, previous)[0], earlier)
+
+    def test_page_inside_null_block(self):
+        expected = self.expected(True)
+        ids, cursor, _ = self.page('-dob', page_size=7)
+        self.assertEqual(ids, expected[:7])
+        ids, cursor, previous = self.page('-dob', cursor, page_size=7)
+        self.assertEqual((ids, cursor), (expected[7:], None))
+        self.assertEqual(self.page('-dob', previous, page_size=7)[0], expected[:7])
+
+    def test_invalid_cursor(self):
+        _, cursor, _ = self.page('-dob')
+        with self.assertRaises(NotFound):
+            self.page('-created_at', cursor)
+        with self.assertRaises(NotFound):
+            self.page('-dob', 'not-a-cursor')
+
+        # Values are checked against the ordering field before reaching a filter.
+        for ordering, value in (('-dob', 'garbage'), ('-created_at', 'garbage'), ('-dob', [1, 2]), ('-id', {'a': 1})):
+            with self.subTest(ordering=ordering, value=value), self.assertRaises(NotFound):
+                field = ordering.lstrip('-')
+                self.page(ordering, base64.urlsafe_b64encode(json.dumps({'value': value, 'id': 1, 'field': field, 'previous': False}).encode()).decode())
+
+        # A well-formed value for the field still works.
+        cursor = base64.urlsafe_b64encode(json.dumps({'value': '1990-01-01', 'id': 0, 'field': 'dob', 'previous': False}).encode()).decode()
+        self.assertEqual(self.page('dob', cursor, page_size=9)[0], self.expected(False)[self.expected(False).index(self.users[0].id):])
+
+
+class NearestFirstPaginationTests(TestCase):
+    '''
+        The driver pending trip feed: nearest pickup first, ties newest
+        first, unknown distances last, bounded by MAX_AGE and MAX_TRIPS.
+    '''
+    # Pickup offsets in degrees of latitude from PICKUP; None has no coordinates.
+    OFFSETS = [0.002, 0.001, 0.001, 0.001, 0.003, None]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = create_users(1)[0]
+        cls.driver = create_drivers(1)[0]
+        now = timezone.now()
+        cls.trips = create_trips(len(cls.OFFSETS) + 1, cls.customer)
+        for index, (trip, offset) in enumerate(zip(cls.trips, cls.OFFSETS + [0.0005])):
+            trip.created_at = now - timedelta(seconds=len(cls.trips) - index)
+            trip.pickup_location_latitude = PICKUP[0] + Decimal(str(offset)) if offset is not None else None
+        # The last trip is the nearest but older than MAX_AGE.
+        cls.trips[-1].created_at = now - timedelta(seconds=settings.PENDING_TRIP_FEED['MAX_AGE'] + 60)
+        Trip.objects.bulk_update(cls.trips, ['created_at', 'pickup_location_latitude'])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.driver)
+
+    def tearDown(self):
+        driver_index.remove(self.driver.id)
+
+    def walk(self, moved_to=None):
+        ids, link = [], '/driverTripPendingView'
+        while link:
+            response = self.client.get(link)
+            self.assertEqual(response.status_code, 200)
+            ids.append([trip['id'] for trip in response.data['results']])
+            link = response.data['next']
+            if moved_to is not None:
+                driver_index.update(self.driver.id, *moved_to)
+        return ids
+
+    def test_nearest_first(self):
+        driver_index.update(self.driver.id, float(PICKUP[0]), float(PICKUP[1]))
+        trip = [trip.id for trip in self.trips]
+        expected = [trip[3], trip[2], trip[1], trip[0], trip[4], trip[5]]
+        with mock.patch.object(NearestFirstCursorPagination, 'page_size', 2):
+            self.assertEqual(self.walk(), [expected[:2], expected[2:4], expected[4:]])
+            # The cursor keeps the first page's origin after the driver moves.
+            driver_index.update(self.driver.id, float(PICKUP[0]), float(PICKUP[1]))
+            self.assertEqual(self.walk(moved_to=(float(PICKUP[0]) + 0.01, float(PICKUP[1]))), [expected[:2], expected[2:4], expected[4:]])
+
+    def test_unknown_position_is_newest_first(self):
+        trips = [trip.id for trip in self.trips[:-1]]
+        with mock.patch.object(NearestFirstCursorPagination, 'page_size', 4):
+            self.assertEqual(self.walk(), [trips[::-1][:4], trips[::-1][4:]])
+
+    def test_max_trips(self):
+        driver_index.update(self.driver.id, float(PICKUP[0]), float(PICKUP[1]))
+        trip = [trip.id for trip in self.trips]
+        with mock.patch.dict(settings.PENDING_TRIP_FEED, {'MAX_TRIPS': 3}):
+            self.assertEqual(self.walk(), [[trip[3], trip[4], trip[5]]])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/driverTripPendingView', {'cursor': 'not-a-cursor'}).status_code, 404)
+
+
+class TripTransitionTests(TestCase):
+    '''
+        A transition from the wrong state, or by someone outside the trip, is a 409.
+    '''
+    def setUp(self):
+        self.customer = create_users(1, 'customer')[0]
+        self.driver, self.other_driver = create_drivers(2)
+        self.client = APIClient()
+
+    def post(self, user, action, trip, data=None):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {PermissionRefreshToken.for_user(user).access_token}')
+        return self.client.post(f'/{action}/{trip.id}', data or {}, format='json')
+
+    def test_accept_taken_trip(self):
+        trip = create_trips(1, self.customer)[0]
+        self.assertEqual(self.post(self.driver, 'acceptTrip', trip).status_code, 200)
+        response = self.post(self.other_driver, 'acceptTrip', trip)
+        self.assertEqual((response.status_code, response.data['message']), (409, 'Trip is no longer available'))
+        trip.refresh_from_db()
+        self.assertEqual((trip.status, trip.driver_id), (TripStatus.ACCEPTED, self.driver.id))
+
+    def test_accept_with_active_trip(self):
+        create_trips(1, self.customer, TripStatus.ON_GOING, self.driver)
+        trip = create_trips(1, self.customer)[0]
+        self.assertEqual(self.post(self.driver, 'acceptTrip', trip).status_code, 409)
+
+    def test_start_from_wrong_state(self):
+        for trip_status in (TripStatus.PENDING, TripStatus.ON_GOING, TripStatus.COMPLETED, TripStatus.CANCELLED):
+            with self.subTest(trip_status):
+                trip = create_trips(1, self.customer, trip_status, self.driver)[0]
+                self.assertEqual(self.post(self.driver, 'startTrip', trip).status_code, 409)
+                trip.refresh_from_db()
+                self.assertEqual(trip.status, trip_status)
+
+    def test_start_by_other_driver(self):
+        trip = create_trips(1, self.customer, TripStatus.ACCEPTED, self.driver)[0]
+        self.assertEqual(self.post(self.other_driver, 'startTrip', trip).status_code, 409)
+
+    def test_cancel_by_customer(self):
+        trip = create_trips(1, self.customer, TripStatus.ACCEPTED, self.driver)[0]
+        self.assertEqual(self.post(self.customer, 'cancelTrip', trip, {'description': 'Changed plans'}).status_code, 200)
+        trip.refresh_from_db()
+        self.assertEqual((trip.status, trip.cancelled_by, trip.description), (TripStatus.CANCELLED, 'customer', 'Changed plans'))
+
+    def test_cancel_frees_the_driver(self):
+        zone = surge_engine.zone(*PICKUP)
+        driver_index.update(self.driver.id, float(PICKUP[0]), float(PICKUP[1]))
+        self.addCleanup(driver_index.remove, self.driver.id)
+        self.addCleanup(surge_engine.driver_free, self.driver.id)
+
+        trip = create_trips(1, self.customer)[0]
+        self.assertEqual(self.post(self.driver, 'acceptTrip', trip).status_code, 200)
+        self.assertNotIn(zone, surge_engine.idle_supply())
+        self.assertEqual(self.post(self.customer, 'cancelTrip', trip).status_code, 200)
+        self.assertEqual(surge_engine.idle_supply()[zone], 1)
+
+    def test_cancel_by_driver(self):
+        trip = create_trips(1, self.customer, TripStatus.ACCEPTED, self.driver)[0]
+        self.assertEqual(self.post(self.other_driver, 'cancelTrip', trip).status_code, 409)
+        self.assertEqual(self.post(self.driver, 'cancelTrip', trip).status_code, 200)
+        trip.refresh_from_db()
+        self.assertEqual((trip.status, trip.cancelled_by), (TripStatus.CANCELLED, 'driver'))
+        self.assertEqual(self.post(self.customer, 'cancelTrip', trip).status_code, 409)
+
+
+class FareScheduleTests(SimpleTestCase):
+    '''
+        Minute-of-day rates at the edges of the night and peak windows.
+    '''
+    def schedule(self, **windows):
+        fare = TripFare(vehicle_type='2 Wheeler', normal_fare=Decimal('7'), night_time_fare=Decimal('3'), peak_time_fare=Decimal('2.5'), **{
+            'night_time_starting': clock(22, 30), 'night_time_ending': clock(7, 0),
+            'peak_time_morning_starting': clock(9, 0), 'peak_time_morning_ending': clock(11, 0),
+            'peak_time_evening_starting': clock(18, 0), 'peak_time_evening_ending': clock(20, 0),
+            **windows,
+        })
+        return FareSchedule([fare])
+
+    def assertRates(self, schedule, expected):
+        for (hour, minute), rate in expected.items():
+            with self.subTest(f'{hour:02d}:{minute:02d}'):
+                self.assertEqual(schedule.rates_at(clock(hour, minute)), (('2 Wheeler', Decimal(rate)),))
+
+    def test_night_across_midnight(self):
+        self.assertRates(self.schedule(), {
+            (22, 29): '7', (22, 30): '10', (23, 59): '10', (0, 0): '10', (6, 59): '10', (7, 0): '7',
+        })
+
+    def test_night_within_day(self):
+        self.assertRates(self.schedule(night_time_starting=clock(0, 0), night_time_ending=clock(5, 0)), {
+            (23, 59): '7', (0, 0): '10', (4, 59): '10', (5, 0): '7',
+        })
+
+    def test_peak_boundaries(self):
+        # Both ends of a peak window are charged.
+        self.assertRates(self.schedule(), {
+            (8, 59): '7', (9, 0): '9.5', (11, 0): '9.5', (11, 1): '7',
+            (17, 59): '7', (18, 0): '9.5', (20, 0): '9.5', (20, 1): '7',
+        })
+
+    def test_whole_evening_peak(self):
+        # The evening peak used to be charged only at peak_time_evening_starting.
+        schedule = self.schedule()
+        self.assertEqual({schedule.rates_at(clock(18, minute))[0][1] for minute in range(60)}, {Decimal('9.5')})
+        self.assertRates(schedule, {(18, 1): '9.5', (19, 0): '9.5', (19, 59): '9.5'})
+
+    def test_night_wins_over_peak(self):
+        self.assertRates(self.schedule(peak_time_evening_starting=clock(21, 0), peak_time_evening_ending=clock(23, 0)), {
+            (22, 29): '9.5', (22, 30): '10', (23, 0): '10', (23, 1): '10',
+        })
+
+    def test_quote_many_matches_quote(self):
+        schedule = self.schedule()
+        moment = clock(19, 15)
+        fares = schedule.quote_many([10, 2.5, math.nan], moment)
+        self.assertEqual(fares[:2, 0].tolist(), [float(schedule.quote(Decimal(distance), moment)['2 Wheeler']) for distance in ('10', '2.5')])
+        self.assertTrue(math.isnan(fares[2, 0]))
+
+
+class QuoteTests(TestCase):
+    '''
+        A quote only books for its customer, unaltered, before it expires, once.
+    '''
+    def setUp(self):
+        self.customer, self.other = create_users(2)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {PermissionRefreshToken.for_user(self.customer).access_token}')
+
+    def quote(self, fare='75'):
+        return sign_quote(self.customer.id, PICKUP, DROP, Decimal('10'), Decimal('20'), {'2 Wheeler': Decimal(fare)})[0]
+
+    def test_read(self):
+        payload = read_quote(self.quote(), self.customer.id)
+        self.assertEqual((payload['p'], payload['f']), ([str(PICKUP[0]), str(PICKUP[1])], {'2 wheeler': '75'}))
+
+    def test_tampered(self):
+        token = self.quote()
+        cheaper = self.quote('1').split(':')[0]
+        for forged in (cheaper + token[token.index(':'):], token[:-1] + ('A' if token[-1] != 'A' else 'B')):
+            with self.assertRaisesMessage(QuoteError, 'Quote is invalid.'):
+                read_quote(forged, self.customer.id)
+
+    def test_wrong_customer(self):
+        with self.assertRaisesMessage(QuoteError, 'Quote was issued to another user.'):
+            read_quote(self.quote(), self.other.id)
+
+    def test_expired(self):
+        token = self.quote()
+        with mock.patch('utils.quotes.time.time', return_value=time.time() + settings.TRIP_QUOTE['TTL'] + 1):
+            with self.assertRaisesMessage(QuoteError, 'Quote has expired.'):
+                read_quote(token, self.customer.id)
+
+    def test_books_one_trip(self):
+        data = {'quote': self.quote(), 'vehicle_type': '2 Wheeler', 'pickup_location': 'A', 'drop_location': 'B'}
+        self.assertEqual(self.client.post('/addTripDetails', data, format='json').status_code, 201)
+        response = self.client.post('/addTripDetails', data, format='json')
+        self.assertEqual((response.status_code, response.data['errors']), (400, {'quote': 'Quote has already been used.'}))
+        self.assertEqual(Trip.objects.filter(customer=self.customer).count(), 1)
+
+
+class TripQuoteInputTests(TestCase):
+    '''
+        Quote endpoints reject malformed coordinates with a 400 and count
+        every quoted pickup towards surge.
+    '''
+    def setUp(self):
+        self.previous_backend = set_routing_backend(StubRoutingBackend())
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {PermissionRefreshToken.for_user(create_users(1)[0]).access_token}')
+
+    def tearDown(self):
+        set_routing_backend(self.previous_backend)
+
+    def test_trip_details_coordinates(self):
+        for latitude, message in (('north', 'Latitude and longitude must be numbers.'), ('91', 'Latitude or longitude out of range.'), ('nan', 'Latitude or longitude out of range.')):
+            with self.subTest(latitude):
+                response = self.client.post('/tripDetails', {
+                    'pickup_location_latitude': latitude, 'pickup_location_longitude': '72.5714',
+                    'drop_location_latitude': '23.1', 'drop_location_longitude': '72.6',
+                    'pickup_location': 'A', 'drop_location': 'B',
+                }, format='json')
+                self.assertEqual((response.status_code, response.json()['errors']), (400, {'coordinates': message}))
+
+    def test_eta_model_coordinates(self):
+        model = EtaModel(0.05, {}, {}, {}, (1.3, 2.0))
+        moment = timezone.now()
+        self.assertEqual(model.estimate('23.0', '72.5', '23.1', '72.6', moment), model.estimate(23.0, 72.5, 23.1, 72.6, moment))
+        for latitude in ('north', None, 'nan', float('inf')):
+            with self.subTest(latitude):
+                self.assertIsNone(model.estimate(latitude, 72.5, 23.1, 72.6, moment))
+
+    def test_batch_coordinates(self):
+        response = self.client.post('/tripDetailsBatch', {'pairs': [[23.0, 72.5, 95.0, 72.6]]}, format='json')
+        self.assertEqual((response.status_code, response.json()['errors']), (400, {'pairs': 'Latitude out of range at index 0.'}))
+        self.assertEqual(self.client.post('/tripDetailsBatch', {'pairs': [['x', 72.5, 23.1, 72.6]]}, format='json').status_code, 400)
+
+    def test_batch_records_quotes(self):
+        pickup = (11.5, 76.5)
+        zone = surge_engine.zone(*pickup)
+        before = surge_engine.quotes.totals().get(zone, 0)
+        response = self.client.post('/tripDetailsBatch', {'pairs': [[*pickup, 11.6, 76.6], [*pickup, 11.7, 76.7]]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(surge_engine.quotes.totals().get(zone, 0) - before, 2)
+
+
+class UnreachableBackend(RoutingBackend):
+    def route(self, start_lat, start_lon, end_lat, end_lon):
+        raise RoutingError("OpenRouteService unreachable")
+
+    def route_many(self, pairs):
+        raise RoutingError("OpenRouteService unreachable")
+
+
+class RoutingFailureTests(TestCase):
+    '''
+        Routing outages reach the client as a 503, never a 500.
+    '''
+    def setUp(self):
+        self.previous_backend = set_routing_backend(UnreachableBackend())
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {PermissionRefreshToken.for_user(create_users(1)[0]).access_token}')
+
+    def tearDown(self):
+        set_routing_backend(self.previous_backend)
+
+    def test_trip_details(self):
+        # Coordinates no other test routes, so the route cache cannot answer.
+        response = self.client.post('/tripDetails', {
+            'pickup_location_latitude': '11.000000', 'pickup_location_longitude': '75.000000',
+            'drop_location_latitude': '11.050000', 'drop_location_longitude': '75.050000',
+            'pickup_location': 'A', 'drop_location': 'B',
+        }, format='json')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['errors'], {'route': 'Could not find a route right now, please try again.'})
+
+    def test_trip_details_batch(self):
+        response = self.client.post('/tripDetailsBatch', {'pairs': [[11.0, 75.0, 11.05, 75.05]]}, format='json')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['errors'], {'pairs': 'Could not find routes right now, please try again.'})
+
+    def test_matrix_per_pickup(self):
+        bodies = []
+
+        def post(url, body):
+            bodies.append(body)
+            drops = len(body['destinations'])
+            return {'distances': [[1000.0 * (column + 1) for column in range(drops)]], 'durations': [[60.0] * drops]}
+
+        backend = OpenRouteServiceBackend('key')
+        pairs = [(11.0, 75.0, 11.1, 75.1), (12.0, 76.0, 12.1, 76.1), (11.0, 75.0, 11.2, 75.2), (11.0, 75.0, 11.1, 75.1)]
+        with mock.patch.object(backend, '_post', side_effect=post):
+            routes = backend.route_many(pairs)
+        self.assertEqual([body['locations'] for body in bodies], [
+            [[75.0, 11.0], [75.1, 11.1], [75.2, 11.2]],
+            [[76.0, 12.0], [76.1, 12.1]],
+        ])
+        self.assertEqual([(body['sources'], body['destinations']) for body in bodies], [([0], [1, 2]), ([0], [1])])
+        self.assertEqual(routes, [(1.0, 1.0), (1.0, 1.0), (2.0, 1.0), (1.0, 1.0)])
+
+    def test_retry_any_5xx_and_reject_html(self):
+        def answer(status_code, content):
+            response = requests.Response()
+            response.status_code, response._content = status_code, content
+            return response
+
+        backend = OpenRouteServiceBackend('key', retries=1, backoff=0)
+        with mock.patch.object(backend.session, 'post', side_effect=[answer(500, b'<html>'), answer(200, b'{"routes": []}')]) as post:
+            self.assertEqual(backend._post(backend.url, {}), {'routes': []})
+        self.assertEqual(post.call_count, 2)
+
+        with mock.patch.object(backend.session, 'post', return_value=answer(502, b'<html>Bad Gateway</html>')):
+            with self.assertRaisesMessage(RoutingError, 'answered 502 without JSON'):
+                backend.route(11, 75, 11.05, 75.05)
+
+
+class AssignmentTests(SimpleTestCase):
+    '''
+        Both solvers return valid pairs; hungarian's total cost is minimal.
+    '''
+    def brute_force(self, cost):
+        rows, columns = len(cost), len(cost[0])
+        if rows <= columns:
+            return min(sum(cost[row][column] for row, column in enumerate(picked)) for picked in permutations(range(columns), rows))
+        return min(sum(cost[row][column] for column, row in enumerate(picked)) for picked in permutations(range(rows), columns))
+
+    def test_optimal_cost(self):
+        generator = random.Random(7)
+        for rows, columns in product(range(1, 6), repeat=2):
+            for _ in range(5):
+                cost = [[generator.randint(0, 50) for _ in range(columns)] for _ in range(rows)]
+                with self.subTest(cost=cost):
+                    pairs = hungarian(cost)
+                    self.assertEqual(len(pairs), min(rows, columns))
+                    self.assertEqual(len({row for row, _ in pairs}), len(pairs))
+                    self.assertEqual(len({column for _, column in pairs}), len(pairs))
+                    self.assertEqual(sum(cost[row][column] for row, column in pairs), self.brute_force(cost))
+
+    def test_greedy_is_not_optimal(self):
+        cost = [[1, 2], [2, 100]]
+        self.assertEqual(hungarian(cost), [(0, 1), (1, 0)])
+        self.assertEqual(greedy(cost), [(0, 0), (1, 1)])
+
+    def test_rectangular(self):
+        self.assertEqual(hungarian([[5, 1, 9]]), [(0, 1)])
+        self.assertEqual(hungarian([[5], [1], [9]]), [(1, 0)])
+        self.assertEqual(hungarian([[4, 1, 3], [2, 0, 5]]), [(0, 1), (1, 0)])
+        self.assertEqual(hungarian([[4, 2], [1, 0], [3, 5]]), [(0, 1), (1, 0)])
+        self.assertEqual(hungarian([]), [])
+        self.assertEqual(hungarian([[]]), [])
+
+    def test_infeasible_pairs(self):
+        for solver in SOLVERS.values():
+            with self.subTest(solver.__name__):
+                self.assertEqual(solver([[UNREACHABLE, UNREACHABLE], [UNREACHABLE, UNREACHABLE]]), [])
+                self.assertEqual(solver([[1, UNREACHABLE], [UNREACHABLE, UNREACHABLE]]), [(0, 0)])
+                self.assertEqual(solver([[UNREACHABLE, 1], [1, UNREACHABLE]]), [(0, 1), (1, 0)])
+                self.assertEqual(solver([[UNREACHABLE, UNREACHABLE], [3, 1], [2, UNREACHABLE]]), [(1, 1), (2, 0)])
+
+
+class MatchingEngineTests(TestCase):
+    '''
+        One window assigns the waiting trips together; lapsed offers and
+        taken trips are handled on the next one.
+    '''
+    # Along one latitude, 0.005 degrees of longitude is ~510 m.
+    STEP = 0.005
+
+    def setUp(self):
+        customer = create_users(1)[0]
+        self.near, self.far = create_trips(2, customer)
+        self.ahead, self.behind = create_drivers(2)
+        latitude, longitude = float(PICKUP[0]), float(PICKUP[1])
+        for trip, offset in ((self.near, 0), (self.far, 3)):
+            trip.pickup_location_longitude = Decimal(f'{longitude + offset * self.STEP:.6f}')
+        driver_index.update(self.ahead.id, latitude, longitude + self.STEP, '2 Wheeler')
+        driver_index.update(self.behind.id, latitude, longitude - self.STEP, '2 Wheeler')
+
+    def tearDown(self):
+        for driver_id, _, _ in driver_index.snapshot():
+            driver_index.remove(driver_id)
+
+    async def match(self, engine, *trips):
+        engine.start()
+        try:
+            for trip in trips:
+                engine.submit(trip, {'id': trip.id})
+            return await engine.match_once()
+        finally:
+            engine._task.cancel()
+
+    async def test_window_is_solved_together(self):
+        # Greedy gives the near trip the driver ahead (~510 m each way) and
+        # leaves the far one ~2 km away; solving the window costs ~1.5 km.
+        engine = MatchingEngine(window=3600, solver='hungarian')
+        self.assertEqual(sorted(await self.match(engine, self.near, self.far)), [(self.near.id, self.behind.id), (self.far.id, self.ahead.id)])
+        engine = MatchingEngine(window=3600, solver='greedy')
+        self.assertEqual(sorted(await self.match(engine, self.near, self.far)), [(self.near.id, self.ahead.id), (self.far.id, self.behind.id)])
+
+    async def test_lapsed_offer_goes_to_another_driver(self):
+        engine = MatchingEngine(window=3600, offer_ttl=0)
+        first = await self.match(engine, self.near)
+        self.assertEqual(len(first), 1)
+        second = await engine.match_once()
+        self.assertEqual(len(second), 1)
+        self.assertNotEqual(second[0][1], first[0][1])
+
+    async def test_taken_trip_is_dropped(self):
+        engine = MatchingEngine(window=3600, offer_ttl=0)
+        await self.match(engine, self.near)
+        await Trip.objects.filter(id=self.near.id).aupdate(status=TripStatus.ACCEPTED)
+        self.assertEqual(await engine.match_once(), [])
+        self.assertEqual(engine._pending, {})
+
+
+class OutboxTests(TestCase):
+    '''
+        Claiming leases due rows in order; settling deletes delivered rows
+        and backs failed ones off until they run out of attempts.
+    '''
+    def setUp(self):
+        self.relay = OutboxRelay(batch_size=2, lease=30, max_attempts=3, retry_backoff=2)
+
+    def message(self, **fields):
+        return OutboxMessage.objects.create(topic='trip.taken', payload={'id': next(sequence), 'vehicle_type': '2 Wheeler'}, **fields)
+
+    def test_claim(self):
+        now = timezone.now()
+        first, second, third = (self.message(available_at=now - timedelta(seconds=seconds)) for seconds in (30, 20, 10))
+        self.message(available_at=now + timedelta(minutes=1))
+        self.message(attempts=3)
+
+        self.assertEqual([message.id for message in self.relay.claim()], [first.id, second.id])
+        first.refresh_from_db()
+        self.assertGreater(first.available_at, now + timedelta(seconds=25))
+        # Leased rows are skipped until the lease runs out.
+        self.assertEqual([message.id for message in self.relay.claim()], [third.id])
+        self.assertEqual(self.relay.claim(), [])
+
+    def test_settle(self):
+        delivered, failed = self.message(), self.message()
+        claimed = {message.id: message for message in self.relay.claim()}
+        before = timezone.now()
+        self.relay.settle([delivered.id], [(claimed[failed.id], 'ConnectionError()')])
+
+        self.assertFalse(OutboxMessage.objects.filter(id=delivered.id).exists())
+        failed.refresh_from_db()
+        self.assertEqual((failed.attempts, failed.last_error), (1, 'ConnectionError()'))
+        self.assertGreaterEqual(failed.available_at, before + timedelta(seconds=2))
+        self.assertLess(failed.available_at, before + timedelta(seconds=30))
+
+    def test_retry_until_max_attempts(self):
+        message = self.message()
+        for attempt in range(1, 4):
+            claimed = self.relay.claim()
+            self.assertEqual([row.id for row in claimed], [message.id])
+            with self.assertLogs('utils.outbox', 'ERROR') if attempt == 3 else nullcontext():
+                self.relay.settle([], [(claimed[0], 'boom')])
+            # Skip the backoff.
+            OutboxMessage.objects.filter(id=message.id).update(available_at=timezone.now())
+        self.assertEqual(self.relay.claim(), [])
+        message.refresh_from_db()
+        self.assertEqual(message.attempts, 3)
+
+    def test_relay_once(self):
+        delivered = []
+
+        async def deliver(payload):
+            delivered.append(payload['id'])
+
+        async def fail(payload):
+            raise ConnectionError('channel layer down')
+
+        ok = OutboxMessage.objects.create(topic='test.ok', payload={'id': 1})
+        broken = OutboxMessage.objects.create(topic='test.fail', payload={'id': 2})
+        relay = OutboxRelay(batch_size=10)
+        with mock.patch.dict(HANDLERS, {'test.ok': deliver, 'test.fail': fail}):
+            self.assertEqual(async_to_sync(relay.relay_once)(), 2)
+
+        self.assertEqual(delivered, [1])
+        self.assertFalse(OutboxMessage.objects.filter(id=ok.id).exists())
+        broken.refresh_from_db()
+        self.assertEqual((broken.attempts, broken.last_error), (1, "ConnectionError('channel layer down')"))
+
+
+class LocationBufferTests(TestCase):
+    '''
+        A failed insert keeps its rows, up to max_pending, for the next flush.
+    '''
+    def setUp(self):
+        self.driver = create_drivers(1)[0]
+        self.buffer = LocationBuffer(max_pending=3)
+
+    def test_failed_flush_keeps_rows(self):
+        for index in range(2):
+            self.buffer.add(self.driver.id, 23.0 + index / 100, 72.5)
+        with mock.patch.object(DriverLocation.objects, 'bulk_create', side_effect=DatabaseError('down')):
+            with self.assertRaises(DatabaseError):
+                self.buffer.flush()
+        self.assertEqual(len(self.buffer), 2)
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(DriverLocation.objects.filter(driver=self.driver).count(), 2)
+
+    def test_failed_flush_keeps_newest(self):
+        for index in range(2):
+            self.buffer.add(self.driver.id, 23.0 + index / 100, 72.5)
+
+        async def fail(objects, batch_size):
+            # Pings keep arriving while the insert is in flight.
+            for index in range(2, 4):
+                self.buffer.add(self.driver.id, 23.0 + index / 100, 72.5)
+            raise DatabaseError('down')
+
+        with mock.patch.object(DriverLocation.objects, 'abulk_create', side_effect=fail):
+            with self.assertRaises(DatabaseError), self.assertLogs('utils.locationBuffer', 'WARNING'):
+                async_to_sync(self.buffer.aflush)()
+        self.assertEqual([latitude for _, latitude, _, _ in self.buffer.drain()], [23.01, 23.02, 23.03])
+
+
+class RolePermissionRegistryTests(TestCase):
+    '''
+        Permission checks come from the compiled registry and follow role edits.
+    '''
+    def setUp(self):
+        self.permission = Permission.objects.create(permission_name='user_view', description='user_view')
+        self.role = Role.objects.create(role_name='Support', description='Support')
+        self.role_permission = RolePermission.objects.create(role=self.role)
+        self.role_permission.permissions.add(self.permission)
+
+    def test_checks_cost_no_queries(self):
+        get_role_permissions()
+        with self.assertNumQueries(0):
+            self.assertTrue(get_role_permissions().has_permission(self.role.id, 'user_view'))
+            self.assertFalse(get_role_permissions().has_permission(self.role.id, 'user_edit'))
+
+    def test_role_edits_invalidate(self):
+        grant = get_role_permissions().grant(self.role.id)
+        self.role_permission.permissions.remove(self.permission)
+        revoked = get_role_permissions().grant(self.role.id)
+        self.assertEqual(revoked.permissions, frozenset())
+        self.assertNotEqual(revoked.version, grant.version)
+
+        self.role.role_name = 'CEO'
+        self.role.save()
+        self.assertEqual(get_role_permissions().grant(self.role.id).name, 'CEO')
+
+    def test_compile_racing_an_invalidation_is_not_installed(self):
+        compile = rolePermissions.RolePermissions
+
+        def compile_during_edit(roles, links, generation):
+            # Another thread saves a role between our queries and the swap.
+            invalidate_role_permissions()
+            return compile(roles, links, generation)
+
+        with mock.patch('utils.rolePermissions.RolePermissions', side_effect=compile_during_edit):
+            stale = rebuild_role_permissions()
+        self.assertIsNone(rolePermissions._registry)
+        self.assertIsNot(get_role_permissions(), stale)
+        self.assertIs(get_role_permissions(), rolePermissions._registry)
+
+
+class PermissionClaimTests(TestCase):
+    '''
+        Tokens carry the role's permission bitmask and go stale when the role changes.
+    '''
+    def setUp(self):
+        permissions = Permission.objects.bulk_create([Permission(permission_name=name, description=name) for name in PERMISSIONS])
+        self.role = Role.objects.create(role_name='Support', description='Support')
+        self.role_permission = RolePermission.objects.create(role=self.role)
+        self.role_permission.permissions.set(permissions)
+        self.admin = create_users(1, 'admin', role=self.role)[0]
+        self.refresh = PermissionRefreshToken.for_user(self.admin)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh.access_token}')
+
+    def test_claims(self):
+        grant = get_role_permissions().grant(self.role.id)
+        access = self.refresh.access_token
+        self.assertEqual((access['role_id'], access['perms'], access['role_version']), (self.role.id, grant.mask, grant.version))
+        self.assertEqual(self.client.get('/listTeamMemberView').status_code, 200)
+
+    def test_role_change_rejects_token_until_refreshed(self):
+        self.role_permission.permissions.remove(Permission.objects.get(permission_name='view_team_members'))
+        response = self.client.get('/listTeamMemberView')
+        self.assertEqual(response.status_code, 401)
+
+        response = self.client.post('/api/token/refresh/', {'refresh': str(self.refresh)}, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        self.assertEqual(self.client.get('/listTeamMemberView').status_code, 403)
+        self.assertEqual(self.client.get('/driverListView').status_code, 200)
+
+    def test_role_reassignment_and_demotion(self):
+        other = Role.objects.create(role_name='Ops', description='Ops')
+        self.admin.role = other
+        self.admin.save()
+        self.assertEqual(self.client.get('/driverListView').status_code, 401)
+
+        self.admin.user_type = 'customer'
+        self.admin.role = None
+        self.admin.save()
+        self.assertEqual(self.client.get('/driverListView').status_code, 401)
+
+        # The refreshed token carries the new type, which the view refuses.
+        response = self.client.post('/api/token/refresh/', {'refresh': str(self.refresh)}, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        self.assertEqual(self.client.get('/driverListView').status_code, 403)
+
+
+class TokenUserTests(TestCase):
+    '''
+        Authentication builds request.user from the claims, loads the rest
+        lazily, and rejects tokens whose user version was revoked.
+    '''
+    def setUp(self):
+        self.customer = User.objects.get(pk=create_users(1, 'customer', address='Somewhere')[0].pk)
+        self.refresh = PermissionRefreshToken.for_user(self.customer)
+
+    def authenticate(self, token):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return TokenUserAuthentication().authenticate(request)[0]
+
+    def test_lazy_user(self):
+        with self.assertNumQueries(0):
+            user = self.authenticate(self.refresh.access_token)
+            self.assertEqual((user.id, user.user_type, user.role_id), (self.customer.id, 'customer', None))
+        with self.assertNumQueries(1):
+            self.assertEqual((user.address, user.mobile_number, user.first_name), ('Somewhere', self.customer.mobile_number, 'Test'))
+
+        # Saving other columns, even through the lazily loaded user, keeps the token.
+        user.address = 'Elsewhere'
+        user.save()
+        self.customer.first_name = 'Renamed'
+        self.customer.save(update_fields=['first_name'])
+        self.assertEqual(self.authenticate(self.refresh.access_token).id, self.customer.id)
+
+    def test_deactivation(self):
+        self.customer.is_active = False
+        self.customer.save(update_fields=['is_active'])
+        with self.assertRaises(InvalidToken):
+            self.authenticate(self.refresh.access_token)
+        response = APIClient().post('/api/token/refresh/', {'refresh': str(self.refresh)}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_deletion(self):
+        token = self.refresh.access_token
+        self.customer.delete()
+        with self.assertRaises(InvalidToken):
+            self.authenticate(token)
+
+    def test_token_without_claims(self):
+        token = RefreshToken.for_user(self.customer).access_token
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate(token).user_type, 'customer')
+        User.objects.filter(pk=self.customer.pk).update(is_active=False)
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+
+class OtpStoreTests(TestCase):
+    '''
+        Both stores expire codes, count attempts and rate limit sends.
+    '''
+    stores = {
+        'local': lambda: LocalOtpStore(ttl=60, max_attempts=2, max_sends=2, send_window=60),
+        'cache': lambda: CacheOtpStore(prefix=f'otp-test-{next(sequence)}', ttl=60, max_attempts=2, max_sends=2, send_window=60),
+    }
+
+    def test_verify_consumes_code(self):
+        for name, store in self.stores.items():
+            with self.subTest(name):
+                store = store()
+                otp = store.issue('+911234567890')
+                self.assertEqual(store.verify('+911234567890', otp + 1 if otp < 9999 else 1000), INVALID)
+                self.assertEqual(store.verify('+911234567890', str(otp)), VERIFIED)
+                self.assertEqual(store.verify('+911234567890', str(otp)), EXPIRED)
+
+    def test_concurrent_correct_codes_verify_once(self):
+        for name, store in self.stores.items():
+            with self.subTest(name):
+                store = store()
+                otp = store.issue('+911234567890')
+                attempt, results = store._attempt, []
+
+                def racing_attempt(mobile_number):
+                    counted = attempt(mobile_number)
+                    if not results:
+                        # A second request with the same code lands between
+                        # this one's read and its consume.
+                        results.append(None)
+                        results.append(store.verify(mobile_number, otp))
+                    return counted
+
+                with mock.patch.object(store, '_attempt', side_effect=racing_attempt):
+                    results.append(store.verify('+911234567890', otp))
+                self.assertEqual(results[1:], [VERIFIED, EXPIRED])
+
+    def test_attempts_are_limited(self):
+        for name, store in self.stores.items():
+            with self.subTest(name):
+                store = store()
+                otp = store.issue('+911234567890')
+                store.verify('+911234567890', 'x')
+                store.verify('+911234567890', 'x')
+                self.assertEqual(store.verify('+911234567890', otp), TOO_MANY_ATTEMPTS)
+                self.assertEqual(store.verify('+911234567890', otp), EXPIRED)
+
+    def test_sends_are_rate_limited(self):
+        for name, store in self.stores.items():
+            with self.subTest(name):
+                store = store()
+                store.issue('+911234567890')
+                store.issue('+911234567890')
+                with self.assertRaises(OtpRateLimited):
+                    store.issue('+911234567890')
+                store.issue('+911234567891')
+
+    def test_expiry(self):
+        store = LocalOtpStore(ttl=0)
+        otp = store.issue('+911234567890')
+        self.assertEqual(store.verify('+911234567890', otp), EXPIRED)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ProfileThumbnailTests(TestCase):
+    '''
+        Profile picture saves queue the thumbnail task, which skips unchanged content.
+    '''
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def upload(self, user, color):
+        buffer = BytesIO()
+        Image.new('RGB', (800, 400), color).save(buffer, 'JPEG')
+        user.profile_pic = SimpleUploadedFile('picture.jpg', buffer.getvalue(), content_type='image/jpeg')
+        with self.captureOnCommitCallbacks() as callbacks:
+            user.save()
+        return callbacks
+
+    def test_thumbnails(self):
+        user = User.objects.get(pk=create_users(1)[0].pk)
+        self.assertEqual(len(self.upload(user, 'red')), 1)
+
+        thumbnail_pic = generate_profile_thumbnails(user.id)
+        user.refresh_from_db()
+        self.assertEqual(user.thumbnail_pic.name, thumbnail_pic)
+        storage = user.thumbnail_pic.storage
+        folder = os.path.dirname(thumbnail_pic)
+        self.assertEqual(sorted(storage.listdir(folder)[1]), ['100.jpg', '100.webp', '300.jpg', '300.webp', '600.jpg', '600.webp'])
+        with storage.open(os.path.join(folder, '300.webp')) as thumbnail, Image.open(thumbnail) as image:
+            self.assertEqual(image.size, (300, 150))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(generate_profile_thumbnails(user.id), thumbnail_pic)
+
+        self.upload(user, 'blue')
+        self.assertNotEqual(generate_profile_thumbnails(user.id), thumbnail_pic)
+
+    def test_other_saves_do_not_queue(self):
+        user = User.objects.get(pk=create_users(1)[0].pk)
+        self.upload(user, 'red')
+        with self.captureOnCommitCallbacks() as callbacks:
+            user.save(update_fields=['first_name'])
+        self.assertEqual(callbacks, [])
+
+        user.set_password('new-password')
+        with self.captureOnCommitCallbacks() as callbacks:
+            user.save()
+        self.assertEqual(callbacks, [])
+
+        user = User.objects.get(id=user.id)
+        with self.captureOnCommitCallbacks() as callbacks:
+            user.save()
+        self.assertEqual(callbacks, [])
+
+    def test_broker_failure_is_logged(self):
+        user = User.objects.get(pk=create_users(1)[0].pk)
+        with mock.patch.object(generate_profile_thumbnails, 'delay', side_effect=ConnectionError), self.assertLogs('django.test', 'ERROR'):
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                self.upload(user, 'red')
+        self.assertEqual(len(callbacks), 1)
+
+
+class SerializerBenchmarkTests(SimpleTestCase):
+    '''
+        Baselines are only compared against runs of the same instance count.
+    '''
+    result = {'count': 1000, 'objects_per_second': 50000, 'microseconds_per_object': 20.0,
+              'peak_bytes_per_object': 800, 'retained_bytes_per_object': 800}
+
+    def test_compare(self):
+        baseline = {**self.result, 'microseconds_per_object': 10.0, 'peak_bytes_per_object': 700}
+        self.assertEqual(compare({'Trip': self.result}, {'Trip': baseline}), [
+            ('Trip', 'microseconds_per_object', 10.0, 20.0),
+            ('Trip', 'peak_bytes_per_object', 700, 800),
+        ])
+        self.assertEqual(compare({'Trip': self.result}, {}), [])
+
+    def test_count_mismatch(self):
+        with self.assertRaises(ValueError):
+            compare({'Trip': self.result}, {'Trip': {**self.result, 'count': 100}})
+        with self.assertRaises(ValueError):
+            compare({'Trip': self.result}, {'Trip': {key: value for key, value in self.result.items() if key != 'count'}})
+
+
+class RoadGraphTests(SimpleTestCase):
+    def test_nearest_node_scans_past_first_ring(self):
+        # Node 0 is in the first ring around the query, node 1 two rings
+        # away but closer to it.
+        graph = RoadGraph.from_edges([23.0195, 22.9895], [72.0195, 72.0005], [(0, 1, 3000.0, 300.0), (1, 0, 3000.0, 300.0)])
+        node, distance = graph.nearest_node(23.0005, 72.0005)
+        self.assertEqual(node, 1)
+        self.assertLess(distance, haversine_m(23.0005, 72.0005, 23.0195, 72.0195))
+
+    def test_nearest_node_matches_brute_force(self):
+        rng = random.Random(7)
+        lats = [23.0 + rng.uniform(0, 0.08) for _ in range(150)]
+        lons = [72.5 + rng.uniform(0, 0.08) for _ in range(150)]
+        graph = RoadGraph.from_edges(lats, lons, [(node, (node + 1) % 150, 100.0, 10.0) for node in range(150)])
+        for _ in range(300):
+            lat, lon = 22.98 + rng.uniform(0, 0.12), 72.48 + rng.uniform(0, 0.12)
+            expected = min(haversine_m(lat, lon, lats[node], lons[node]) for node in range(150))
+            self.assertAlmostEqual(graph.nearest_node(lat, lon)[1], expected)
+        with self.assertRaises(NoRouteFound):
+            graph.nearest_node(25.0, 75.0)
+
+    def square(self):
+        '''
+            0 -> 1 -> 3 (fast then slow), 0 -> 2 -> 3 (steady) and a slow
+            diagonal 0 -> 3; 3 -> 1 leads back and node 4 only has an edge out,
+            so neither 0 nor 4 can be reached from 3.
+        '''
+        lats = [23.00, 23.00, 23.01, 23.01, 23.05]
+        lons = [72.00, 72.01, 72.00, 72.01, 72.05]
+        def edge(source, target, speed):
+            length = haversine_m(lats[source], lons[source], lats[target], lons[target])
+            return source, target, length, length / speed
+        edges = [edge(0, 1, 10), edge(1, 3, 2), edge(0, 2, 5), edge(2, 3, 5), edge(0, 3, 1), edge(3, 1, 10), edge(4, 0, 10)]
+        return RoadGraph.from_edges(lats, lons, edges), edges
+
+    def test_csr_layout(self):
+        graph, edges = self.square()
+        self.assertEqual((graph.node_count, graph.edge_count), (5, 7))
+        self.assertEqual(list(graph.offsets), [0, 3, 4, 5, 6, 7])
+        self.assertEqual(list(graph.targets), [1, 2, 3, 3, 3, 1, 0])
+
+    def test_shortest_path(self):
+        graph, edges = self.square()
+        length, seconds = graph.shortest_path(0, 3)
+        self.assertAlmostEqual(length, edges[2][2] + edges[3][2], places=1)
+        self.assertAlmostEqual(seconds, edges[2][3] + edges[3][3], places=1)
+        self.assertEqual(graph.shortest_path(2, 2), (0.0, 0.0))
+        with self.assertRaises(NoRouteFound):
+            graph.shortest_path(0, 4)
+        with self.assertRaises(NoRouteFound):
+            graph.shortest_path(3, 0)
+
+    def test_local_backend(self):
+        graph, edges = self.square()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'graph.bin')
+            graph.save(path)
+            backend = LocalGraphBackend(path, access_speed=36)
+            self.assertEqual(list(backend.graph.offsets), list(graph.offsets))
+
+            length, seconds = graph.shortest_path(0, 3)
+            access = haversine_m(23.0001, 72.0, 23.0, 72.0) + haversine_m(23.0099, 72.01, 23.01, 72.01)
+            self.assertEqual(backend.route(23.0001, 72.0, 23.0099, 72.01), (round((length + access) / 1000, 2), round((seconds + access / 10) / 60, 1)))
+
+            self.assertEqual(backend.route(23.0001, 72.0, 23.0, 72.0001)[0], round(haversine_m(23.0001, 72.0, 23.0, 72.0001) / 1000, 2))
+            with self.assertRaises(RoutingError):
+                backend.route(23.01, 72.01, 23.0, 72.0)
+
+
+class RouteCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 0.0
+        caches['default'].clear()
+
+    def cache(self, **options):
+        return RouteCache(clock=lambda: self.now, **options)
+
+    def test_key_snapping(self):
+        cache = self.cache(precision=3)
+        self.assertEqual(cache.make_key(23.02251, '72.57139', 23.1, 72.6), cache.make_key('23.0225', 72.5714, 23.1004, 72.5996))
+        self.assertIsNone(cache.make_key('north', 72.57, 23.1, 72.6))
+
+    def test_eviction_order(self):
+        cache = self.cache(max_entries=2)
+        cache.set('a', (1.0, 2.0))
+        cache.set('b', (3.0, 4.0))
+        self.assertEqual(cache.get('a'), (1.0, 2.0))   # 'b' is now least recently used
+        cache.set('c', (5.0, 6.0))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), (1.0, 2.0))
+        self.assertEqual(cache.get('c'), (5.0, 6.0))
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.stats()['size'], 2)
+
+    def test_expiry(self):
+        cache = self.cache(ttl=60)
+        cache.set('a', (1.0, 2.0))
+        self.now = 59.9
+        self.assertEqual(cache.get('a'), (1.0, 2.0))
+        self.now = 60.0
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['expired'], 1)
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_shared_backend_read_through(self):
+        writer, reader = self.cache(shared_backend='default'), self.cache(shared_backend='default')
+        writer.set('a', (1.0, 2.0))
+        self.assertEqual(reader.get('a'), (1.0, 2.0))
+        self.assertEqual(reader.stats()['shared_hits'], 1)
+
+        # The shared value is now held locally.
+        caches['default'].clear()
+        self.assertEqual(reader.get('a'), (1.0, 2.0))
+        self.assertEqual(reader.stats()['hits'], 1)
+        self.assertEqual(async_to_sync(reader.aget)('b'), None)
+
+    def test_stats(self):
+        cache = self.cache()
+        self.assertEqual(cache.stats()['hit_ratio'], 0.0)
+        cache.set('a', (1.0, 2.0))
+        cache.get('a')
+        cache.get('a')
+        cache.get('b')
+        async_to_sync(cache.aset)('b', (3.0, 4.0))
+        self.assertEqual(async_to_sync(cache.aget)('b'), (3.0, 4.0))
+        self.assertEqual(cache.stats(), {
+            'hits': 3, 'shared_hits': 0, 'misses': 1, 'evictions': 0, 'expired': 0, 'size': 2, 'hit_ratio': 0.75,
+        })
+
+
+class DriverIndexTests(SimpleTestCase):
+    '''
+        Grid queries agree with sorting every live driver by distance.
+    '''
+    def setUp(self):
+        self.now = 0.0
+        self.index = DriverIndex(cell_size=0.01, ttl=60, clock=lambda: self.now)
+
+    def brute_force(self, lat, lon, k, vehicle_type=None, radius=None):
+        distances = sorted(
+            (haversine_m(lat, lon, driver_lat, driver_lon), driver_id)
+            for driver_id, driver_lat, driver_lon, driver_type in self.drivers
+            if vehicle_type is None or driver_type == vehicle_type
+        )
+        return [(driver_id, distance) for distance, driver_id in distances if radius is None or distance <= radius][:k]
+
+    def assertSameDrivers(self, found, expected):
+        self.assertEqual([driver_id for driver_id, _ in found], [driver_id for driver_id, _ in expected])
+        for (_, distance), (_, expected_distance) in zip(found, expected):
+            self.assertAlmostEqual(distance, expected_distance)
+
+    def test_matches_brute_force(self):
+        rng = random.Random(11)
+        self.drivers = [
+            (driver_id, 23.0 + rng.uniform(0, 0.06), 72.5 + rng.uniform(0, 0.06), rng.choice(('2 wheeler', '4 wheeler')))
+            for driver_id in range(200)
+        ]
+        for driver_id, lat, lon, vehicle_type in self.drivers:
+            self.index.update(driver_id, lat, lon, vehicle_type.upper())
+        for _ in range(100):
+            lat, lon = 23.0 + rng.uniform(0, 0.06), 72.5 + rng.uniform(0, 0.06)
+            self.assertSameDrivers(self.index.nearest(lat, lon, 5), self.brute_force(lat, lon, 5))
+            self.assertSameDrivers(self.index.nearest(lat, lon, 3, vehicle_type='2 Wheeler'), self.brute_force(lat, lon, 3, '2 wheeler'))
+            self.assertSameDrivers(self.index.within(lat, lon, 1500), self.brute_force(lat, lon, 200, radius=1500))
+
+    def test_across_cell_boundary(self):
+        # The query sits at the top of its cell: driver 1 is just across the
+        # border, driver 2 in the same cell but further away.
+        self.drivers = [(1, 23.01001, 72.505, None), (2, 23.0005, 72.505, None)]
+        for driver_id, lat, lon, _ in self.drivers:
+            self.index.update(driver_id, lat, lon)
+        self.assertSameDrivers(self.index.nearest(23.00999, 72.505, 1), self.brute_force(23.00999, 72.505, 1))
+        self.assertEqual(self.index.nearest(23.00999, 72.505, 1)[0][0], 1)
+        self.assertEqual([driver_id for driver_id, _ in self.index.within(23.00999, 72.505, 100)], [1])
+
+    def test_expired_pings(self):
+        self.index.update(1, 23.0005, 72.5005)
+        self.index.update(2, 23.0015, 72.5015)
+        self.now = 61.0
+        self.index.update(3, 23.0105, 72.5105)
+        self.index.update(2, 23.0015, 72.5016)
+        self.assertEqual([driver_id for driver_id, _ in self.index.nearest(23.0005, 72.5005, 3)], [2, 3])
+        self.assertIsNone(self.index.position(1))
+        self.assertEqual(len(self.index), 2)
+        self.assertEqual([driver_id for driver_id, _, _ in self.index.snapshot()], [2, 3])
+
+        self.now = 200.0
+        self.assertEqual(self.index.nearest(23.0005, 72.5005, 3), [])
+        self.assertEqual(len(self.index), 0)
+
+
+class SurgeEngineTests(SimpleTestCase):
+    '''
+        Zone multipliers from windowed demand over idle supply, with times
+        passed in explicitly.
+    '''
+    # Three zones a few kilometres apart.
+    BUSY, QUIET, SWAMPED = (23.0225, 72.5714), (23.1000, 72.6000), (23.2000, 72.7000)
+
+    def setUp(self):
+        self.index = DriverIndex(clock=lambda: 0.0)
+        patcher = mock.patch('utils.surge.driver_index', self.index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.engine = SurgeEngine(window=30, bucket=10, smoothing=0.0)
+
+    def demand(self, point, quotes=0, bookings=0, now=0):
+        zone = self.engine.zone(*point)
+        self.engine.quotes.add(zone, now=now, amount=quotes)
+        self.engine.bookings.add(zone, now=now, amount=bookings)
+
+    def drivers(self, point, *driver_ids):
+        for driver_id in driver_ids:
+            self.index.update(driver_id, *point)
+
+    def test_sliding_counter_expiry(self):
+        counter = SlidingCounter(window=30, bucket=10)
+        counter.add('a', now=0)
+        counter.add('a', now=15)
+        counter.add('b', now=29, amount=4)
+        self.assertEqual(counter.totals(now=29), {'a': 2, 'b': 4})
+        self.assertEqual(counter.totals(now=30), {'a': 1, 'b': 4})
+        # A slot reused by a later bucket starts again from zero.
+        counter.add('a', now=31)
+        self.assertEqual(counter.totals(now=40), {'a': 1, 'b': 4})
+        self.assertEqual(counter.totals(now=50), {'a': 1})
+        self.assertEqual(counter.totals(now=70), {})
+        self.assertEqual(counter._counts, {})
+
+    def test_multiplier_per_zone(self):
+        self.demand(self.BUSY, quotes=9)                # 9 / 2 idle -> 1 + 0.25 * 3.5
+        self.drivers(self.BUSY, 1, 2)
+        self.demand(self.QUIET, quotes=3, bookings=1)   # (3 + 3) / 2 idle -> 1 + 0.25 * 2
+        self.drivers(self.QUIET, 3, 4)
+        self.demand(self.SWAMPED, quotes=100)           # clamped to max_multiplier
+
+        self.assertEqual(self.engine.recompute(now=0), {
+            self.engine.zone(*self.BUSY): 1.9, self.engine.zone(*self.QUIET): 1.5, self.engine.zone(*self.SWAMPED): 3.0,
+        })
+        self.assertEqual(self.engine.multiplier(*self.BUSY), 1.9)
+        self.assertEqual(self.engine.multiplier(23.3, 72.8), 1.0)
+
+    def test_low_demand_is_not_surged(self):
+        self.demand(self.BUSY, quotes=2)
+        self.drivers(self.BUSY, 1, 2, 3)
+        self.assertEqual(self.engine.recompute(now=0), {})
+        self.assertEqual(self.engine.multiplier(*self.BUSY), 1.0)
+
+    def test_demand_leaves_the_window(self):
+        self.demand(self.BUSY, quotes=9)
+        self.assertEqual(self.engine.recompute(now=0), {self.engine.zone(*self.BUSY): 3.0})
+        self.assertEqual(self.engine.recompute(now=30), {})
+
+    def test_smoothing(self):
+        engine = self.engine
+        engine.smoothing = 0.5
+        self.demand(self.BUSY, quotes=9)
+        zone = engine.zone(*self.BUSY)
+        self.assertEqual(engine.recompute(now=0), {zone: 2.0})      # halfway from 1.0 to 3.0
+        self.assertEqual(engine.recompute(now=1), {zone: 2.5})
+        self.assertEqual(engine.recompute(now=40), {zone: 1.8})    # demand gone, decaying back
+
+    def test_busy_drivers_are_not_supply(self):
+        zone = self.engine.zone(*self.BUSY)
+        self.drivers(self.BUSY, 1, 2)
+        self.engine.driver_busy(1)
+        self.assertEqual(self.engine.idle_supply(), {zone: 1})
+
+        self.demand(self.BUSY, quotes=9)        # 9 / 1 idle -> clamped
+        self.assertEqual(self.engine.recompute(now=0), {zone: 3.0})
+
+        self.engine.driver_free(1)
+        self.assertEqual(self.engine.idle_supply(), {zone: 2})
+
+        # A busy mark that is never cleared lapses after busy_ttl.
+        self.engine.driver_busy(2)
+        self.assertEqual(self.engine.idle_supply(), {zone: 1})
+        self.assertEqual(self.engine.idle_supply(now=time.monotonic() + self.engine.busy_ttl + 1), {zone: 2})
+
+
+class EtaModelTests(SimpleTestCase):
+    '''
+        Fitted factors per (cell pair, hour), then cell pair, then hour, then overall.
+    '''
+    PAIR_A = (23.01, 72.51, 23.11, 72.51)
+    PAIR_B = (23.21, 72.71, 23.31, 72.71)
+
+    def trips(self, pair, hour, detour, pace, rows):
+        straight = float(straight_km(*pair))
+        return [(*pair, detour * straight, pace * detour * straight, hour)] * rows
+
+    def fit(self, rows):
+        return EtaModel.fit(*map(list, zip(*rows)), cell_size=0.05, min_samples=5)
+
+    def test_fallback_levels(self):
+        rows = (
+            self.trips(self.PAIR_A, 10, 1.3, 2.0, 6)
+            + self.trips(self.PAIR_A, 11, 1.3, 3.0, 2)
+            + self.trips(self.PAIR_B, 11, 1.5, 3.0, 4)
+            # Unusable rows: no distance, and a detour above 10x.
+            + [(*self.PAIR_A, 0.0, 5.0, 10), (*self.PAIR_A, 500.0, 5.0, 10)]
+        )
+        model = self.fit(rows)
+        usable = rows[:12]
+        self.assertEqual(set(model.pair_hour), {(460, 1450, 462, 1450, 10)})
+        self.assertEqual(set(model.pair), {(460, 1450, 462, 1450)})
+        self.assertEqual(set(model.hour), {10, 11})
+
+        # Enough trips in the cell pair at that hour.
+        self.assertEqual([round(value, 6) for value in model.factors(*self.PAIR_A, 10)], [1.3, 2.0])
+
+        # Too few at hour 11: the cell pair's own detour and pace, scaled by
+        # how hour 11 compares to the overall pace.
+        detour, pace = model.factors(*self.PAIR_A, 11)
+        overall_pace = sum(row[4] * row[5] for row in usable) / sum(row[4] ** 2 for row in usable)
+        self.assertAlmostEqual(model.overall[1], overall_pace)
+        self.assertAlmostEqual(detour, 1.3)
+        self.assertAlmostEqual(pace, (6 * 2.0 + 2 * 3.0) / 8 * 3.0 / overall_pace)
+
+        # Too few for the cell pair at all: the hour of week alone.
+        straight_a, straight_b = float(straight_km(*self.PAIR_A)), float(straight_km(*self.PAIR_B))
+        detour, pace = model.factors(*self.PAIR_B, 11)
+        self.assertAlmostEqual(detour, (2 * 1.3 * straight_a ** 2 + 4 * 1.5 * straight_b ** 2) / (2 * straight_a ** 2 + 4 * straight_b ** 2))
+        self.assertAlmostEqual(pace, 3.0)
+
+        # Nothing known about the hour either.
+        self.assertEqual(model.factors(*self.PAIR_B, 50), model.overall)
+
+        monday_ten = datetime(2024, 1, 1, 10, 30)
+        distance, minutes = model.estimate(*self.PAIR_A, monday_ten)
+        self.assertAlmostEqual(distance, 1.3 * straight_a, places=2)
+        self.assertAlmostEqual(minutes, 2.0 * 1.3 * straight_a, places=2)
+
+    def test_save_and_load(self):
+        model = self.fit(self.trips(self.PAIR_A, 10, 1.3, 2.0, 6) + self.trips(self.PAIR_B, 11, 1.5, 3.0, 6))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'eta_model.npz')
+            model.save(path)
+            loaded = EtaModel.load(path)
+        for level in ('cell_size', 'pair_hour', 'pair', 'hour', 'overall'):
+            self.assertEqual(getattr(loaded, level), getattr(model, level))
+
+    def test_nothing_usable(self):
+        with self.assertRaises(ValueError):
+            self.fit([(*self.PAIR_A, 0.0, 5.0, 10)])
+
+
+class SlowBackend(RoutingBackend):
+    def __init__(self, delay, error=None):
+        self.delay = delay
+        self.error = error
+
+    async def aroute(self, start_lat, start_lon, end_lat, end_lon):
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return 12.0, 30.0
+
+
+class RouteOrEstimateTests(SimpleTestCase):
+    '''
+        The historical estimate stands in for a slow or failed route, and only
+        when a model has been fitted.
+    '''
+    PAIR = (11.5, 75.5, 11.6, 75.6)
+
+    def setUp(self):
+        route_cache.clear()
+        self.addCleanup(route_cache.clear)
+        self.model = EtaModel(0.05, {}, {}, {}, (1.3, 2.0))
+        patcher = mock.patch.dict(settings.ETA_MODEL, {'ROUTING_TIMEOUT': 0.05})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def route(self, backend, model):
+        previous = set_routing_backend(backend)
+        try:
+            with mock.patch('utils.helper.get_eta_model', return_value=model):
+                return async_to_sync(aroute_or_estimate)(*self.PAIR)
+        finally:
+            set_routing_backend(previous)
+
+    def test_timeout_uses_estimate(self):
+        distance, minutes, estimated = self.route(SlowBackend(0.5), self.model)
+        self.assertTrue(estimated)
+        self.assertEqual((distance, minutes), self.model.estimate(*self.PAIR, timezone.localtime()))
+
+    def test_failure_uses_estimate(self):
+        self.assertTrue(self.route(SlowBackend(0, RoutingError("down")), self.model)[2])
+
+    def test_fast_route(self):
+        self.assertEqual(self.route(SlowBackend(0), self.model), (12.0, 30.0, False))
+
+    def test_without_model(self):
+        # No ROUTING_TIMEOUT without a model: a slow route still answers.
+        self.assertEqual(self.route(SlowBackend(0.1), None), (12.0, 30.0, False))
+        route_cache.clear()
+        with self.assertRaises(RoutingError):
+            self.route(SlowBackend(0, RoutingError("down")), None)
@@ -53,7 +53,12 @@ urlpatterns = [
 
     # Trip Details
     path('tripDetails', tripViews.TripDetails.as_view()),
+    path('tripDetailsBatch', tripViews.TripDetailsBatch.as_view()),
     path('addTripDetails', tripViews.AddTripDetails.as_view(), name='add_trip'),
+    path('acceptTrip/<int:id>', tripViews.AcceptTripView.as_view(), name='accept_trip'),
+    path('startTrip/<int:id>', tripViews.StartTripView.as_view(), name='start_trip'),
+    path('completeTrip/<int:id>', tripViews.CompleteTripView.as_view(), name='complete_trip'),
+    path('cancelTrip/<int:id>', tripViews.CancelTripView.as_view(), name='cancel_trip'),
 
     # # Vehicle Details
     # path('addVehicle/', VehicleViews.addVehicleView.as_view()),
@@ -67,4 +72,48 @@ urlpatterns = [
     # Token
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
-]
\ No newline at end of file
+]
+
+# Max SQL queries per request, checked by the query budget tests in
+# user/tests.py regardless of how many rows sit behind the endpoint.
+QUERY_BUDGETS = {
+    'login': 2,
+    'signup': 3,
+    'mobile_number': 1,
+    'otp-verification': 3,
+    'resendOtpView': 1,
+    'addTeamMemberView': 7,
+    'listTeamMemberView': 1,
+    'destroyTeamMemberView/<int:pk>': 2,
+    'updateTeamMemberView/<int:pk>': 3,
+    'createRoles': 2,
+    'retrieveUpdateDestroyRoles/<int:pk>': 1,
+    'adminRights/<str:verification_code>': 2,
+    'roleListView': 1,
+    'createPermission': 2,
+    'retrieveUpdateDestroyPermission/<int:pk>': 1,
+    'updateProfileView': 2,
+    'changePasswordView': 2,
+    'forgotpassword': 5,
+    'forgot-password/<str:verification_code>': 3,
+    'ProfileView': 1,
+    'adminDriverStatusList': 1,
+    'add-driver-details': 1,
+    'admin-verify-driver/<int:id>': 9,
+    'ImpersonationView': 3,
+    'driverPersonalDetailView/<int:id>': 3,
+    'driverDraftView': 1,
+    'driverListView': 1,
+    'languagesListView': 1,
+    'userCountView': 4,
+    'driverTripPendingView': 3,
+    'tripDetails': 0,
+    'tripDetailsBatch': 0,
+    'addTripDetails': 7,
+    'acceptTrip/<int:id>': 6,
+    'startTrip/<int:id>': 1,
+    'completeTrip/<int:id>': 1,
+    'cancelTrip/<int:id>': 2,
+    'api/token/': 1,
+    'api/token/refresh/': 2,
+}
@@ -3,8 +3,6 @@ from rest_framework.filters import SearchFilter, OrderingFilter
 from rest_framework.generics import ListAPIView, ListCreateAPIView, RetrieveAPIView, CreateAPIView, UpdateAPIView
 from rest_framework.permissions import IsAuthenticated, BasePermission
 from rest_framework.response import Response
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.views import APIView
 
 from django.db.models import F, Value
@@ -13,9 +11,14 @@ from django_filters.rest_framework import DjangoFilterBackend
 from django.utils import timezone
 from django.urls import reverse
 from django.shortcuts import get_object_or_404
+from datetime import timedelta
 
 from utils.mixins import DynamicPermission
-from ..models import DriverDetail, DocumentType, User, DriverRequest, Role, Trip
+from utils.tokens import PermissionRefreshToken, TokenUserAuthentication, request_grant
+from utils.driverIndex import driver_index
+from utils.pagination import NearestFirstCursorPagination, KeysetPagination
+from Uber import settings
+from ..models import DriverDetail, DocumentType, User, DriverRequest, Trip, TripStatus, DriverLocation
 from ..serializers.driverDetailsSerializers import DriverSerializer, DriverTripPendingSerializer, AdminDriverApprovalSerializer, DriverDraftSerializer, DriverPersonalDetailsViewSerializer, DocumentTypeSerializer, VerificationRequestSerializer, DriverVerificationPendingSerializer, ImpersonationSerializer
 
 
@@ -25,13 +28,13 @@ class ImpersonationPermission(BasePermission):
         Permission class to check if the user has permission to impersonate another user.
     """
     def has_permission(self, request, view):
-        role = request.user.role
-        if role is None:
+        role_id = request.user.role_id
+        if role_id is None:
             return False
         if request.user.user_type != 'admin':
             return False
-        role = Role.objects.filter(id = role.id).values_list('role_name', flat=True).first()
-        if role == 'CEO':
+        _, grant = request_grant(request)
+        if grant.name == 'CEO':
             return True
         return False
 
@@ -41,7 +44,7 @@ class DriverDetailsView(ListCreateAPIView):
         Submit driver details for verification using CreateAPIView.
     '''
     serializer_class = VerificationRequestSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [TokenUserAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
@@ -73,7 +76,8 @@ class DriverDetailsView(ListCreateAPIView):
 
 
 class DriverListView(ListAPIView):
-    authentication_classes = [JWTAuthentication]
+    pagination_class = KeysetPagination
+    authentication_classes = [TokenUserAuthentication]
     def get_permissions(self):
         return [IsAuthenticated(), DynamicPermission('user_view')]
 
@@ -86,7 +90,7 @@ class DriverListView(ListAPIView):
 
     def get_queryset(self):
         start_date = self.request.query_params.get('start_date')
-        driver = DriverRequest.objects.filter(status = 'approved')
+        driver = DriverRequest.objects.filter(status = 'approved').select_related('user', 'action_by')
         if start_date:
             driver = driver.filter(created_at__date=start_date)
         return driver
@@ -106,7 +110,8 @@ class DriverListView(ListAPIView):
 
 
 class AdminDriverStatusListView(ListAPIView):
-    authentication_classes = [JWTAuthentication]
+    pagination_class = KeysetPagination
+    authentication_classes = [TokenUserAuthentication]
     def get_permissions(self):
         return [IsAuthenticated(), DynamicPermission('user_view')]
 
@@ -124,7 +129,7 @@ class AdminDriverStatusListView(ListAPIView):
     def get_queryset(self):
         start_date = self.request.query_params.get('start_date')
         status = self.request.query_params.get('status')
-        driver = DriverRequest.objects.all()
+        driver = DriverRequest.objects.select_related('user')
         if status:
             driver = driver.filter(status=status)
 
@@ -135,7 +140,7 @@ class AdminDriverStatusListView(ListAPIView):
 
 
 class UserCountView(ListAPIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [TokenUserAuthentication]
     permission_classes = [IsAuthenticated]
 
     def list(self, request, *args, **kwargs):
@@ -160,7 +165,7 @@ class UserCountView(ListAPIView):
 
 
 class DriverPersonalDetailsView(RetrieveAPIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [TokenUserAuthentication]
     def get_permissions(self):
         return [IsAuthenticated(), DynamicPermission('user_view')]
 
@@ -169,13 +174,13 @@ class DriverPersonalDetailsView(RetrieveAPIView):
 
     def get_object(self):
         try:
-            return DriverRequest.objects.get(id=self.kwargs['id'])
+            return DriverRequest.objects.select_related('user', 'action_by').prefetch_related('verification_documents__document_name').get(id=self.kwargs['id'])
         except DriverRequest.DoesNotExist:
             return Response({"status" : "error", "message" :"Validation Error", "errors":{"user": "Does not applied as Driver."}}, status=status.HTTP_400_BAD_REQUEST)
 
 
 class DriverDraftView(ListAPIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [TokenUserAuthentication]
     def get_permissions(self):
         return [IsAuthenticated(), DynamicPermission('user_view')]
 
@@ -187,7 +192,7 @@ class DriverDraftView(ListAPIView):
 
 
 class AdminDriverApprovalView(UpdateAPIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [TokenUserAuthentication]
     def get_permissions(self):
         return [IsAuthenticated(), DynamicPermission('user_edit')]
 
@@ -232,7 +237,7 @@ class AdminDriverApprovalView(UpdateAPIView):
 
 
 class ImpersonationView(CreateAPIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [TokenUserAuthentication]
     permission_classes = [IsAuthenticated, ImpersonationPermission]
 
     serializer_class = ImpersonationSerializer
@@ -249,7 +254,7 @@ class ImpersonationView(CreateAPIView):
             if type == 'admin':
                 user = User.objects.filter(id = request.data['id']).first()
 
-            refresh = RefreshToken.for_user(user)
+            refresh = PermissionRefreshToken.for_user(user)
             data = {"refresh": str(refresh),
                     "access": str(refresh.access_token),
                     "role" : user.user_type}
@@ -263,16 +268,34 @@ class ImpersonationView(CreateAPIView):
 
 
 class DriverTripPendingView(ListAPIView):
-    authentication_classes = [JWTAuthentication]
+    '''
+        Pending trips for the driver's vehicle type, nearest pickup first.
+        Only the newest PENDING_TRIP_FEED['MAX_TRIPS'] trips younger than
+        MAX_AGE seconds are considered, read through the
+        (vehicle_type, status, created_at) index.
+    '''
+    authentication_classes = [TokenUserAuthentication]
     permission_classes = [IsAuthenticated]
     serializer_class = DriverTripPendingSerializer
+    pagination_class = NearestFirstCursorPagination
 
     def get_queryset(self):
         user = self.request.user
         driver = get_object_or_404(DriverDetail.objects.select_related('in_use'), user=user)
         type = driver.in_use.vehicle_type if driver.in_use else None
-        trip = Trip.objects.filter(vehicle_type=type).select_related('customer')
-        return trip
+        cutoff = timezone.now() - timedelta(seconds=settings.PENDING_TRIP_FEED['MAX_AGE'])
+        trip = Trip.objects.filter(vehicle_type=type, status=TripStatus.PENDING, created_at__gte=cutoff).select_related('customer').order_by('-created_at')
+        return trip[:settings.PENDING_TRIP_FEED['MAX_TRIPS']]
+
+    def get_origin(self):
+        '''
+            Driver's live position, else the last stored ping.
+        '''
+        position = driver_index.position(self.request.user.id)
+        if position is not None:
+            return position
+        location = DriverLocation.objects.filter(driver_id=self.request.user.id).order_by('-recorded_at').values_list('latitude', 'longitude').first()
+        return (float(location[0]), float(location[1])) if location else None
 
 # class VerificationRequestResubmissionView(APIView):
 
@@ -3,8 +3,6 @@ from rest_framework.authentication import authenticate
 from rest_framework.generics import RetrieveUpdateAPIView, UpdateAPIView, DestroyAPIView,CreateAPIView, RetrieveAPIView, ListAPIView
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.permissions import IsAuthenticated, BasePermission
 from rest_framework.exceptions import NotFound
 from rest_framework.filters import SearchFilter, OrderingFilter
@@ -12,15 +10,16 @@ from django.db.models import F, Value, CharField
 from django.db.models.functions import Concat
 
 from utils.mixins import DynamicPermission
-from ..models import User, Role, Permission, RolePermission, DriverDetail
-from ..serializers.userSerializers import AdminRightsSerializer, ResendOtpSerializer, UpdateTeamMemberSerializer, ListTeamMemberSerializer, AddTeamMemberSerializer, OtpVerificationSerializer, mobileNumberSerializer, AdminSerializer, updateProfileSerializer, ChangePasswordSerializer, ForgotPasswordSerializer, CustomUserSerializer, ResetPasswordSerializer , LoginSerializer
+from utils.rolePermissions import get_role_permissions
+from utils.tokens import PermissionRefreshToken, TokenUserAuthentication
+from utils.pagination import KeysetPagination
+from ..models import User, DriverDetail
+from ..serializers.userSerializers import issue_otp, AdminRightsSerializer, ResendOtpSerializer, UpdateTeamMemberSerializer, ListTeamMemberSerializer, AddTeamMemberSerializer, OtpVerificationSerializer, mobileNumberSerializer, AdminSerializer, updateProfileSerializer, ChangePasswordSerializer, ForgotPasswordSerializer, CustomUserSerializer, ResetPasswordSerializer , LoginSerializer
 from Uber import settings
 
 from django.core.mail import send_mail
 from django.utils import timezone
 
-import random
-
 
 
 class CanEditTeamMember(BasePermission):
@@ -28,24 +27,14 @@ class CanEditTeamMember(BasePermission):
     Custom permission to allow only SuperAdmin to give Admin rights to user.
     """
     def has_permission(self, request, view):
-        user = request.user
-        user_type = user.user_type
-        role = request.user.role
-        if user_type != 'admin':
-            return False
-
-        permissions = RolePermission.objects.filter(role=role).first().permissions.values_list('permission_name', flat=True)
-        required_permissions = "edit_team_member"
-        if bool(required_permissions in list(permissions)):
-            return True
-        return False
+        return DynamicPermission("edit_team_member").has_permission(request, view)
 
 
 class adminRightsView(RetrieveUpdateAPIView):
     '''
         Give rights to admin.
     '''
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [TokenUserAuthentication]
     permission_classes = [IsAuthenticated, CanEditTeamMember]
     serializer_class = AdminRightsSerializer
     lookup_field = 'verification_code'
@@ -124,8 +113,6 @@ class LoginView(CreateAPIView):
             email = serializer.validated_data['email']
             password = serializer.validated_data['password']
             user = User.objects.filter(email=email).first()
-            role_permissions = RolePermission.objects.filter(role=user.role)
-            permissions = Permission.objects.filter(permissions__in=role_permissions).values_list('permission_name')
 
             if not user:
                 return Response({
@@ -134,7 +121,9 @@ class LoginView(CreateAPIView):
                     "errors":{"email" : "Invalid Credentials."}
                 }, status=status.HTTP_400_BAD_REQUEST)
 
-            refresh = RefreshToken.for_user(user)
+            refresh = PermissionRefreshToken.for_user(user)
+            # Same [[name], ...] rows as the values_list() this replaced.
+            permissions = [(name,) for name in sorted(get_role_permissions().grant(user.role_id).permissions)]
             data = {
                 "refresh": str(refresh),
                 "access": str(refresh.access_token),
@@ -199,11 +188,10 @@ class ResendOtpView(UpdateAPIView):
         Generate and store a new OTP for the user and return the response.
         """
         user = self.get_object()
+        if isinstance(user, Response):
+            return user
 
-        new_otp = random.randint(1000, 9999)
-        user.otp = new_otp
-        user.otp_created_at = timezone.now().time()
-        user.save()
+        new_otp = issue_otp(user.mobile_number)
 
         data = {
                 "mobile_number": user.mobile_number,
@@ -226,9 +214,9 @@ class OtpVerificationView(CreateAPIView):
         serializer = self.get_serializer(data=data)
 
         if serializer.is_valid():
-            user = User.objects.filter(mobile_number = data['mobile_number']).first()
+            user = serializer.validated_data['user']
             driver = DriverDetail.objects.filter(user=user).exists()
-            refresh = RefreshToken.for_user(user)
+            refresh = PermissionRefreshToken.for_user(user)
             data = {"refresh": str(refresh),
                     "access": str(refresh.access_token),
                     "role" : user.user_type,}
@@ -256,10 +244,11 @@ class SignupView(CreateAPIView):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
             user = serializer.save()
-            refresh = RefreshToken.for_user(user)
+            otp = issue_otp(user.mobile_number)
+            refresh = PermissionRefreshToken.for_user(user)
 
             data = {
-                "otp": user.otp,
+                "otp": otp,
                 "refresh": str(refresh),
                 "access": str(refresh.access_token),
                 "mobile_number": user.mobile_number,
@@ -275,7 +264,7 @@ class SignupView(CreateAPIView):
 
 class ChangePasswordView(UpdateAPIView):
 
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [TokenUserAuthentication]
     permission_classes = [IsAuthenticated]
 
     serializer_class = ChangePasswordSerializer
@@ -283,11 +272,6 @@ class ChangePasswordView(UpdateAPIView):
 
     def update(self, request, *args, **kwargs):
         user = request.user
-        try:
-            user = User.objects.get(mobile_number = user)
-        except User.DoesNotExist:
-            return Response({"status" : "error","message" : "Validation Error", "errors":{"user":"User not Found."}}, status=status.HTTP_400_BAD_REQUEST)
-
         serializer = self.get_serializer(user, data=request.data, context={'user':user} ,partial=True)
         if serializer.is_valid():
             user = serializer.save()
@@ -301,7 +285,7 @@ class UpdateProfileView(RetrieveUpdateAPIView):
     '''
         Update Profile
     '''
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [TokenUserAuthentication]
     permission_classes = [IsAuthenticated]
 
     serializer_class = updateProfileSerializer
@@ -314,7 +298,7 @@ class ProfileView(RetrieveAPIView):
     '''
         Get Profile
     '''
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [TokenUserAuthentication]
     permission_classes = [IsAuthenticated]
 
     serializer_class = updateProfileSerializer
@@ -386,7 +370,7 @@ class ResetPasswordView(UpdateAPIView):
 class AddTeamMemberView(CreateAPIView):
 
     serializer_class = AddTeamMemberSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [TokenUserAuthentication]
     def get_permissions(self):
         return [IsAuthenticated(), DynamicPermission('add_team_member')]
 
@@ -415,7 +399,8 @@ class ListTeamMemberView(ListAPIView):
         List all team members.
     '''
     serializer_class = ListTeamMemberSerializer
-    authentication_classes = [JWTAuthentication]
+    pagination_class = KeysetPagination
+    authentication_classes = [TokenUserAuthentication]
     def get_permissions(self):
         return [IsAuthenticated(), DynamicPermission('view_team_members')]
 
@@ -427,7 +412,7 @@ class ListTeamMemberView(ListAPIView):
 
     def get_queryset(self):
         user = self.request.user
-        return User.objects.filter(user_type='admin', deleted_at=None).exclude(id = user.id).annotate(name=Concat(F('first_name'), Value(' '), F('last_name'), output_field=CharField()))
+        return User.objects.filter(user_type='admin', deleted_at=None).exclude(id = user.id).select_related('role').annotate(name=Concat(F('first_name'), Value(' '), F('last_name'), output_field=CharField()))
 
 
 class UpdateTeamMemberView(RetrieveUpdateAPIView):
@@ -458,7 +443,7 @@ class DestroyTeamMemberView(DestroyAPIView):
     '''
         Delete team member.
     '''
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [TokenUserAuthentication]
     def get_permissions(self):
         return [IsAuthenticated(), DynamicPermission('remove_team_member')]
 
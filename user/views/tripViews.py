@@ -2,21 +2,34 @@ from rest_framework.generics import CreateAPIView, ListAPIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework.exceptions import APIException
+from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
+from django.db import transaction
 import pytz
 from decimal import Decimal
 from channels.generic.websocket import WebsocketConsumer
 from django.utils import timezone
 from datetime import time
 from datetime import timedelta
+import asyncio
 import math
+import numpy as np
 from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from asgiref.sync import async_to_sync, sync_to_async
 from ..models import DriverRequest, DocumentRequired, DocumentType, DriverDetail, User, Trip, TripFare
-from ..serializers.tripSerializers import TripSerializer
-from utils.helper import calculate_road_distance_and_time
-from Uber.settings import open_route_service_key
+from ..serializers.tripSerializers import TripSerializer, TripQuoteBatchSerializer, CENTS
+from utils.tokens import TokenUserAuthentication
+from utils.routingBackends import RoutingError
+from utils.helper import aroute_or_estimate, calculate_road_distances, estimate_road_distance_and_time
+from utils.fareSchedule import aget_fare_schedule
+from utils.asyncViews import AsyncAPIView, json_response
+from utils.quotes import sign_quote
+from utils.outbox import enqueue
+from utils.matching import matching_engine
+from utils.surge import surge_engine
+from utils.tripTransitions import accept_trip, start_trip, complete_trip, cancel_trip
+from Uber import settings
 
 
 
@@ -77,63 +90,149 @@ from Uber.settings import open_route_service_key
 #         return Response(serializer.errors,status=status.HTTP_400_BAD_REQUEST)
 
 
-class TripDetails(CreateAPIView):
+class TripDetails(AsyncAPIView):
     '''
         TRIP DETAILS
+
+        Async view: the routing call is awaited on the event loop instead of
+        holding a thread from the ASGI pool while ORS answers.
     '''
-    authentication_classes = [JWTAuthentication]
-    permission_classes = [IsAuthenticated]
+    authentication_classes = [TokenUserAuthentication]
 
-    def create(self, request, *args, **kwargs):
+    async def post(self, request, *args, **kwargs):
         india_timezone = pytz.timezone('Asia/Kolkata')
         current_time_utc = timezone.now()
         current_time_ist = current_time_utc.astimezone(india_timezone)
-        current_time_only = current_time_ist.time()
 
         pickup_location_long = request.data.get('pickup_location_longitude')
         pickup_location_lat = request.data.get('pickup_location_latitude')
         drop_location_lat = request.data.get('drop_location_latitude')
         drop_location_long = request.data.get('drop_location_longitude')
         if not pickup_location_lat:
-            return Response({"status":"success","message":"Successfully","data":{}}, status=status.HTTP_200_OK)
+            return json_response({"status":"success","message":"Successfully","data":{}}, status=status.HTTP_200_OK)
 
         if not pickup_location_long:
-            return Response({"status":"success","message":"Successfully","data":{}}, status=status.HTTP_200_OK)
+            return json_response({"status":"success","message":"Successfully","data":{}}, status=status.HTTP_200_OK)
 
         if not drop_location_lat:
-            return Response({"status":"success","message":"Successfully","data":{}}, status=status.HTTP_200_OK)
+            return json_response({"status":"success","message":"Successfully","data":{}}, status=status.HTTP_200_OK)
 
         if not drop_location_long:
-            return Response({"status":"success","message":"Successfully","data":{}}, status=status.HTTP_200_OK)
+            return json_response({"status":"success","message":"Successfully","data":{}}, status=status.HTTP_200_OK)
 
-        distance, durations = calculate_road_distance_and_time(pickup_location_lat, pickup_location_long, drop_location_lat, drop_location_long, open_route_service_key)
-        distance = Decimal(str(distance))
-        base_fair = 5
-        total_fare = {}
-        fares = TripFare.objects.all()
+        try:
+            pickup_location_lat, pickup_location_long, drop_location_lat, drop_location_long = (
+                float(value) for value in (pickup_location_lat, pickup_location_long, drop_location_lat, drop_location_long)
+            )
+        except (TypeError, ValueError):
+            errors = {
+                "coordinates": "Latitude and longitude must be numbers."
+            }
+            return json_response({"status": "error", "message": "Validation Error", "errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+        if not (-90 <= pickup_location_lat <= 90 and -90 <= drop_location_lat <= 90 and -180 <= pickup_location_long <= 180 and -180 <= drop_location_long <= 180):
+            errors = {
+                "coordinates": "Latitude or longitude out of range."
+            }
+            return json_response({"status": "error", "message": "Validation Error", "errors": errors}, status=status.HTTP_400_BAD_REQUEST)
 
-        for fare in fares:
-            if current_time_only >= fare.night_time_starting or current_time_only < fare.night_time_ending:
-                total_fare[fare.vehicle_type] = base_fair + (fare.normal_fare + fare.night_time_fare ) * distance
+        surge_engine.start()
+        surge_engine.record_quote(pickup_location_lat, pickup_location_long)
+        surge = surge_engine.multiplier(pickup_location_lat, pickup_location_long)
 
-            elif fare.peak_time_morning_starting <= current_time_only <= fare.peak_time_morning_ending or fare.peak_time_evening_starting <= current_time_only <= fare.peak_time_evening_starting:
-                total_fare[fare.vehicle_type] = base_fair + (fare.normal_fare + fare.peak_time_fare ) * distance
+        # Cheap pre-screen on the historical model before paying for a route.
+        estimate = estimate_road_distance_and_time(pickup_location_lat, pickup_location_long, drop_location_lat, drop_location_long, current_time_ist)
+        if estimate is not None and estimate[0] > settings.ETA_MODEL['MAX_TRIP_KM']:
+            errors = {
+                "drop_location": f"Trips longer than {settings.ETA_MODEL['MAX_TRIP_KM']} km are not available."
+            }
+            return json_response({"status": "error", "message": "Validation Error", "errors": errors}, status=status.HTTP_400_BAD_REQUEST)
 
-            else:
-                total_fare[fare.vehicle_type] = base_fair + (fare.normal_fare * distance)
+        try:
+            distance, durations, estimated = await aroute_or_estimate(pickup_location_lat, pickup_location_long, drop_location_lat, drop_location_long, current_time_ist)
+        except (RoutingError, asyncio.TimeoutError):
+            errors = {
+                "route": "Could not find a route right now, please try again."
+            }
+            return json_response({"status": "error", "message": "Routing unavailable", "errors": errors}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        distance = Decimal(str(distance))
+        total_fare = (await aget_fare_schedule()).quote(distance, current_time_ist)
+        if surge > 1:
+            total_fare = {vehicle_type: (fare * Decimal(str(surge))).quantize(CENTS) for vehicle_type, fare in total_fare.items()}
+        quote, quote_expires_at = sign_quote(
+            request.user.id,
+            (pickup_location_lat, pickup_location_long),
+            (drop_location_lat, drop_location_long),
+            distance, durations, total_fare, surge,
+        )
 
         data  = {"distance": f"{distance} km",
                     'durations': (current_time_ist + timedelta(minutes=math.ceil(durations))).strftime("%I:%M %p"),
                     'estimated_time': f'{math.ceil(durations)} mins',
                     'pickup_location': request.data['pickup_location'],
                     'drop_location': request.data['drop_location'],
-                    'total_fare':total_fare}
+                    'total_fare':total_fare,
+                    'surge_multiplier': surge,
+                    'estimated': estimated,
+                    'quote': quote,
+                    'quote_expires_at': quote_expires_at}
 
-        return Response({"status":"success","message":"Successfully","data":data}, status=status.HTTP_200_OK)
+        return json_response({"status":"success","message":"Successfully","data":data}, status=status.HTTP_200_OK)
+
+
+class TripDetailsBatch(AsyncAPIView):
+    '''
+        Fares for many pickup / drop pairs in one call.
+
+        Body: {"pairs": [[pickup_lat, pickup_long, drop_lat, drop_long], ...]}
+        The response is column oriented: `distance`, `estimated_time` and
+        `fares` are aligned with `pairs`, and each `fares` row is aligned with
+        `vehicle_types`. Pairs without a road route get null entries. Each
+        pair counts as a quote towards its pickup zone's surge.
+    '''
+    authentication_classes = [TokenUserAuthentication]
+
+    async def post(self, request, *args, **kwargs):
+        serializer = TripQuoteBatchSerializer(data=request.data)
+        try:
+            valid = serializer.is_valid()
+        except APIException as e:
+            return json_response(e.detail, status=e.status_code)
+        if not valid:
+            return json_response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        pairs = serializer.validated_data['pairs']
+        current_time_ist = timezone.now().astimezone(pytz.timezone('Asia/Kolkata'))
+
+        surge_engine.start()
+        for pair in pairs:
+            surge_engine.record_quote(pair[0], pair[1])
+
+        try:
+            routes = await sync_to_async(calculate_road_distances, thread_sensitive=False)(pairs)
+        except RoutingError:
+            errors = {
+                "pairs": "Could not find routes right now, please try again."
+            }
+            return json_response({"status": "error", "message": "Routing unavailable", "errors": errors}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        distances = np.array([route[0] if route else np.nan for route in routes], dtype=np.float64)
+        schedule = await aget_fare_schedule()
+        fares = schedule.quote_many(distances, current_time_ist)
+        surge = np.array([surge_engine.multiplier(pair[0], pair[1]) for pair in pairs], dtype=np.float64)
+        fares = np.round(fares * surge[:, None], 2)
+
+        routed = ~np.isnan(distances)
+        data = {
+            "vehicle_types": schedule.vehicle_types,
+            "distance": [route[0] if route else None for route in routes],
+            "estimated_time": [math.ceil(route[1]) if route else None for route in routes],
+            "fares": [row if ok else None for row, ok in zip(fares.tolist(), routed.tolist())],
+            "surge_multiplier": surge.tolist(),
+        }
+        return json_response({"status":"success","message":"Successfully","data":data}, status=status.HTTP_200_OK)
 
 
 class AddTripDetails(CreateAPIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [TokenUserAuthentication]
     permission_classes = [IsAuthenticated]
     serializer_class = TripSerializer
 
@@ -142,38 +241,104 @@ class AddTripDetails(CreateAPIView):
         serializer = self.get_serializer(data=request.data, context={'user': user})
 
         if serializer.is_valid():
-            trip = serializer.save()
-            print(user)
-            user = get_object_or_404(User, mobile_number=user)
-            data = {
-                "id": trip.id,
-                "distance": f"{trip.distance} km",
-                "pickup_location": trip.pickup_location,
-                "drop_location": trip.drop_location,
-                "vehicle_type": trip.vehicle_type,
-                "first_name": user.first_name,
-                "last_name": user.last_name,
-                "fare": f"Rs. {trip.fare}"
-            }
+            with transaction.atomic():
+                trip = serializer.save()
+                data = {
+                    "id": trip.id,
+                    "distance": f"{trip.distance} km",
+                    "pickup_location": trip.pickup_location,
+                    "drop_location": trip.drop_location,
+                    "vehicle_type": trip.vehicle_type,
+                    "first_name": user.first_name,
+                    "last_name": user.last_name,
+                    "fare": f"Rs. {trip.fare}"
+                }
+                enqueue('trip.created', {
+                    'trip': {
+                        'id': trip.id,
+                        'vehicle_type': trip.vehicle_type,
+                        'pickup_location_latitude': trip.pickup_location_latitude,
+                        'pickup_location_longitude': trip.pickup_location_longitude,
+                    },
+                    'data': data,
+                })
 
-            vehicle_type = trip.vehicle_type
-            drivers = DriverDetail.objects.filter(in_use__vehicle_type=vehicle_type)
-            channel_layer = get_channel_layer()
-
-            for driver in drivers:
-                group_name = f'driver_{driver.user.id}'
-                print(f"📢 Sending WebSocket update to group: {group_name}")  # Debugging
-
-                async_to_sync(channel_layer.group_send)(
-                    group_name,
-                    {
-                        'type': 'send_trip_update',
-                        'message': {
-                            'status': 'New trip available',
-                            'data': data
-                        }
-                    }
-                )
+            if trip.pickup_location_latitude is not None and trip.pickup_location_longitude is not None:
+                surge_engine.record_booking(trip.pickup_location_latitude, trip.pickup_location_longitude)
             return Response({"status": "success", "message": "Successfully added trip", "data": data}, status=status.HTTP_201_CREATED)
 
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class TripTransitionView(APIView):
+    '''
+        Base for trip state changes; each one is a single conditional UPDATE
+        so concurrent requests for the same trip get an immediate 409.
+    '''
+    authentication_classes = [TokenUserAuthentication]
+    permission_classes = [IsAuthenticated]
+    success_message = None
+    conflict_message = "Trip cannot be updated in its current state"
+
+    def transition(self, request, id):
+        raise NotImplementedError
+
+    def post(self, request, id):
+        result = self.transition(request, id)
+        if isinstance(result, Response):
+            return result
+        if not result:
+            return Response({"status": "error", "message": self.conflict_message}, status=status.HTTP_409_CONFLICT)
+        return Response({"status": "success", "message": self.success_message, "data": {"id": id}}, status=status.HTTP_200_OK)
+
+
+class AcceptTripView(TripTransitionView):
+    success_message = "Trip accepted successfully"
+    conflict_message = "Trip is no longer available"
+
+    def transition(self, request, id):
+        driver = DriverDetail.objects.filter(user_id=request.user.id).values_list('in_use_id', 'in_use__vehicle_type').first()
+        if driver is None or driver[0] is None:
+            errors = {
+                "vehicle": "Select a vehicle before accepting trips"
+            }
+            return Response({"status": "error", "message": "Validation Error", "errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            accepted = accept_trip(id, request.user.id, driver[0], driver[1])
+            if accepted:
+                enqueue('trip.taken', {'id': id, 'vehicle_type': driver[1]})
+        if accepted:
+            matching_engine.release_driver(request.user.id)
+            surge_engine.driver_busy(request.user.id)
+        return accepted
+
+
+class StartTripView(TripTransitionView):
+    success_message = "Trip started successfully"
+
+    def transition(self, request, id):
+        return start_trip(id, request.user.id)
+
+
+class CompleteTripView(TripTransitionView):
+    success_message = "Trip completed successfully"
+
+    def transition(self, request, id):
+        completed = complete_trip(id, request.user.id)
+        if completed:
+            surge_engine.driver_free(request.user.id)
+        return completed
+
+
+class CancelTripView(TripTransitionView):
+    success_message = "Trip cancelled successfully"
+
+    def transition(self, request, id):
+        cancelled = cancel_trip(id, request.user.id, request.data.get('description'))
+        # Either side may cancel, so the driver to free is read from the trip;
+        # a cancelled trip is final, so its driver can no longer change.
+        driver_id = Trip.objects.filter(id=id).values_list('driver_id', flat=True).first() if cancelled else None
+        if driver_id is not None:
+            surge_engine.driver_free(driver_id)
+        return cancelled
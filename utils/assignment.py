@@ -0,0 +1,80 @@
+UNREACHABLE = 1e9
+
+
+
+def hungarian(cost):
+    '''
+        Minimum cost assignment of rows to columns (Hungarian method with
+        potentials, O(n^2 m)). Returns [(row, column)]; pairs costing
+        UNREACHABLE or more are left out.
+    '''
+    rows = len(cost)
+    columns = len(cost[0]) if rows else 0
+    if not rows or not columns:
+        return []
+    if rows > columns:
+        transposed = [list(column) for column in zip(*cost)]
+        return sorted((row, column) for column, row in hungarian(transposed))
+
+    inf = float('inf')
+    u, v = [0.0] * (rows + 1), [0.0] * (columns + 1)
+    match, way = [0] * (columns + 1), [0] * (columns + 1)
+    for row in range(1, rows + 1):
+        match[0] = row
+        j0 = 0
+        min_value = [inf] * (columns + 1)
+        used = [False] * (columns + 1)
+        while True:
+            used[j0] = True
+            i0, delta, j1 = match[j0], inf, 0
+            cost_row = cost[i0 - 1]
+            for j in range(1, columns + 1):
+                if not used[j]:
+                    current = cost_row[j - 1] - u[i0] - v[j]
+                    if current < min_value[j]:
+                        min_value[j], way[j] = current, j0
+                    if min_value[j] < delta:
+                        delta, j1 = min_value[j], j
+            for j in range(columns + 1):
+                if used[j]:
+                    u[match[j]] += delta
+                    v[j] -= delta
+                else:
+                    min_value[j] -= delta
+            j0 = j1
+            if match[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            match[j0] = match[j1]
+            j0 = j1
+
+    return sorted(
+        (match[j] - 1, j - 1) for j in range(1, columns + 1)
+        if match[j] and cost[match[j] - 1][j - 1] < UNREACHABLE
+    )
+
+
+def greedy(cost):
+    '''
+        Cheapest pair first; near optimal and O(nm log nm) for large windows.
+    '''
+    pairs = sorted(
+        (value, row, column)
+        for row, cost_row in enumerate(cost)
+        for column, value in enumerate(cost_row)
+        if value < UNREACHABLE
+    )
+    taken_rows, taken_columns, result = set(), set(), []
+    for value, row, column in pairs:
+        if row not in taken_rows and column not in taken_columns:
+            taken_rows.add(row)
+            taken_columns.add(column)
+            result.append((row, column))
+    return sorted(result)
+
+
+SOLVERS = {
+    'hungarian': hungarian,
+    'greedy': greedy,
+}
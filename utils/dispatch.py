@@ -0,0 +1,84 @@
+import json
+import re
+
+from channels.layers import get_channel_layer
+
+from utils import geohash
+from utils.driverIndex import driver_index
+from utils.matching import matching_engine
+from Uber import settings
+
+
+
+def vehicle_type_group(vehicle_type, zone=None):
+    '''
+        Channel group of every online driver using `vehicle_type`, optionally
+        narrowed to one geohash zone.
+    '''
+    slug = re.sub(r'[^0-9a-z]+', '_', vehicle_type.lower()).strip('_')
+    return f'trips_{slug}_{zone}' if zone else f'trips_{slug}'
+
+
+def driver_zone(latitude, longitude):
+    return geohash.encode(float(latitude), float(longitude), settings.DISPATCH['ZONE_PRECISION'])
+
+
+def trip_groups(vehicle_type, pickup_latitude=None, pickup_longitude=None):
+    '''
+        Groups a new trip is announced to: the vehicle type group, or with
+        DISPATCH['USE_ZONES'] the pickup zone and its neighbours.
+    '''
+    if settings.DISPATCH['USE_ZONES'] and pickup_latitude is not None and pickup_longitude is not None:
+        zone = driver_zone(pickup_latitude, pickup_longitude)
+        return [vehicle_type_group(vehicle_type, cell) for cell in geohash.neighbours(zone)]
+    return [vehicle_type_group(vehicle_type)]
+
+
+def trip_update_event(message):
+    # Serialised once here; consumers forward the text as is.
+    return {'type': 'send_trip_update', 'text': json.dumps(message, default=str)}
+
+
+def nearest_drivers(trip):
+    '''
+        Ids of the closest online drivers for a trip from the live index.
+    '''
+    if trip.pickup_location_latitude is None or trip.pickup_location_longitude is None:
+        return []
+    nearest = driver_index.nearest(
+        float(trip.pickup_location_latitude),
+        float(trip.pickup_location_longitude),
+        settings.DISPATCH['NEAREST_DRIVERS'],
+        vehicle_type=trip.vehicle_type,
+        radius=settings.DISPATCH['SEARCH_RADIUS'],
+    )
+    return [driver_id for driver_id, distance in nearest]
+
+
+async def anotify_new_trip(trip, data):
+    '''
+        Offer the trip to the closest drivers; when none have reported a
+        position yet, fall back to one group_send per group. With
+        DISPATCH['STRATEGY'] 'batch' the trip is queued for the matching
+        engine instead.
+    '''
+    if settings.DISPATCH['STRATEGY'] == 'batch' and matching_engine.submit(trip, data):
+        return []
+    channel_layer = get_channel_layer()
+    event = trip_update_event({'status': 'New trip available', 'data': data})
+    driver_ids = nearest_drivers(trip)
+    if driver_ids:
+        group_names = [f'driver_{driver_id}' for driver_id in driver_ids]
+    else:
+        group_names = trip_groups(trip.vehicle_type, trip.pickup_location_latitude, trip.pickup_location_longitude)
+    for group_name in group_names:
+        await channel_layer.group_send(group_name, event)
+    return driver_ids
+
+
+async def anotify_trip_taken(trip_id, vehicle_type):
+    '''
+        Let other drivers drop a trip that has just been accepted.
+    '''
+    event = trip_update_event({'status': 'Trip no longer available', 'data': {'id': trip_id}})
+    await get_channel_layer().group_send(vehicle_type_group(vehicle_type), event)
@@ -0,0 +1,142 @@
+import heapq
+import math
+import threading
+import time
+
+from utils.roadGraph import haversine_m
+from Uber import settings
+
+
+METRES_PER_DEGREE = 111320.0
+
+
+
+class DriverIndex:
+    """
+        Live grid index of online driver positions.
+
+        Drivers are bucketed into square cells of `cell_size` degrees
+        (0.01 is ~1.1 km) keyed by (row, col). Positions older than `ttl`
+        seconds count as offline and are pruned lazily by queries. `clock`
+        returns seconds and is only swapped out by tests.
+    """
+    def __init__(self, cell_size=0.01, ttl=60, clock=time.monotonic):
+        self.cell_size = cell_size
+        self.ttl = ttl
+        self.clock = clock
+        self._cells = {}
+        self._drivers = {}
+        self._lock = threading.Lock()
+
+    def _cell(self, lat, lon):
+        return int(math.floor(lat / self.cell_size)), int(math.floor(lon / self.cell_size))
+
+    def update(self, driver_id, lat, lon, vehicle_type=None):
+        cell = self._cell(lat, lon)
+        vehicle_type = vehicle_type.lower() if vehicle_type else None
+        with self._lock:
+            previous = self._drivers.get(driver_id)
+            if previous is not None and previous[3] != cell:
+                self._discard(driver_id, previous[3])
+            self._drivers[driver_id] = (lat, lon, vehicle_type, cell, self.clock())
+            self._cells.setdefault(cell, set()).add(driver_id)
+
+    def set_vehicle_type(self, driver_id, vehicle_type):
+        with self._lock:
+            entry = self._drivers.get(driver_id)
+            if entry is not None:
+                self._drivers[driver_id] = (entry[0], entry[1], vehicle_type.lower() if vehicle_type else None, entry[3], entry[4])
+
+    def remove(self, driver_id):
+        with self._lock:
+            entry = self._drivers.pop(driver_id, None)
+            if entry is not None:
+                self._discard(driver_id, entry[3])
+
+    def _discard(self, driver_id, cell):
+        members = self._cells.get(cell)
+        if members is not None:
+            members.discard(driver_id)
+            if not members:
+                del self._cells[cell]
+
+    def position(self, driver_id):
+        entry = self._drivers.get(driver_id)
+        return (entry[0], entry[1]) if entry is not None else None
+
+    def snapshot(self):
+        '''
+            [(driver_id, lat, lon)] of drivers seen within the last `ttl` seconds.
+        '''
+        cutoff = self.clock() - self.ttl
+        with self._lock:
+            return [(driver_id, entry[0], entry[1]) for driver_id, entry in self._drivers.items() if entry[4] >= cutoff]
+
+    def __len__(self):
+        return len(self._drivers)
+
+    def _ring(self, row, col, ring):
+        if ring == 0:
+            yield row, col
+            return
+        for c in range(col - ring, col + ring + 1):
+            yield row - ring, c
+            yield row + ring, c
+        for r in range(row - ring + 1, row + ring):
+            yield r, col - ring
+            yield r, col + ring
+
+    def _candidates(self, cell, vehicle_type, now, stale):
+        for driver_id in self._cells.get(cell, ()):
+            entry = self._drivers[driver_id]
+            if now - entry[4] > self.ttl:
+                stale.append(driver_id)
+                continue
+            if vehicle_type is not None and entry[2] != vehicle_type:
+                continue
+            yield driver_id, entry
+
+    def nearest(self, lat, lon, k, vehicle_type=None, radius=None):
+        '''
+            Up to `k` closest online drivers as [(driver_id, distance_m)],
+            optionally only of `vehicle_type` and within `radius` metres.
+        '''
+        vehicle_type = vehicle_type.lower() if vehicle_type else None
+        row, col = self._cell(lat, lon)
+        # Smallest cell side in metres; ring n is at least n of these away.
+        cell_m = self.cell_size * METRES_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01)
+        max_rings = int(math.ceil(radius / cell_m)) + 1 if radius is not None else settings.DRIVER_INDEX['MAX_RINGS']
+        now, stale, best = self.clock(), [], []
+
+        with self._lock:
+            for ring in range(max_rings + 1):
+                for cell in self._ring(row, col, ring):
+                    for driver_id, entry in self._candidates(cell, vehicle_type, now, stale):
+                        distance = haversine_m(lat, lon, entry[0], entry[1])
+                        if radius is not None and distance > radius:
+                            continue
+                        if len(best) < k:
+                            heapq.heappush(best, (-distance, driver_id))
+                        elif -best[0][0] > distance:
+                            heapq.heapreplace(best, (-distance, driver_id))
+                # Anything in the next ring is at least ring * cell_m away.
+                if len(best) == k and -best[0][0] <= ring * cell_m:
+                    break
+            for driver_id in stale:
+                entry = self._drivers.pop(driver_id, None)
+                if entry is not None:
+                    self._discard(driver_id, entry[3])
+
+        return sorted(((driver_id, -distance) for distance, driver_id in best), key=lambda item: item[1])
+
+    def within(self, lat, lon, radius, vehicle_type=None):
+        '''
+            Every online driver within `radius` metres, closest first.
+        '''
+        return self.nearest(lat, lon, len(self._drivers) or 1, vehicle_type=vehicle_type, radius=radius)
+
+
+driver_index = DriverIndex(
+    cell_size=settings.DRIVER_INDEX['CELL_SIZE'],
+    ttl=settings.DRIVER_INDEX['TTL'],
+)
@@ -0,0 +1,173 @@
+import math
+import os
+import threading
+
+import numpy as np
+
+from utils.roadGraph import EARTH_RADIUS_M
+from Uber import settings
+
+
+
+def straight_km(start_lat, start_lon, end_lat, end_lon):
+    '''
+        Vectorised haversine distance in km.
+    '''
+    start_lat, start_lon, end_lat, end_lon = (np.radians(np.asarray(value, dtype=np.float64)) for value in (start_lat, start_lon, end_lat, end_lon))
+    a = np.sin((end_lat - start_lat) / 2) ** 2 + np.cos(start_lat) * np.cos(end_lat) * np.sin((end_lon - start_lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a)) / 1000
+
+
+def hour_of_week(moment):
+    return moment.weekday() * 24 + moment.hour
+
+
+def _slopes(keys, x, y, min_samples):
+    '''
+        Least squares slope through the origin of y on x for every distinct
+        key row; returns (unique keys, slopes, counts) for keys with enough
+        samples.
+    '''
+    unique, inverse, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+    xy = np.bincount(inverse, weights=x * y, minlength=len(unique))
+    xx = np.bincount(inverse, weights=x * x, minlength=len(unique))
+    keep = (counts >= min_samples) & (xx > 0)
+    return unique[keep], xy[keep] / xx[keep], counts[keep]
+
+
+class EtaModel:
+    """
+        Road distance and duration estimates learnt from completed trips.
+
+        Road km is modelled as `detour * straight line km` and minutes as
+        `pace * road km`. Both factors are fitted per (pickup cell, drop cell,
+        hour of week). Sparse groups (fewer than `min_samples` trips) fall
+        back to the cell pair with its pace scaled by the hour of week, then
+        to the hour of week alone, then to one global value. Cells are
+        `cell_size` degree squares (0.05 is ~5.5 km).
+    """
+    def __init__(self, cell_size, pair_hour, pair, hour, overall):
+        self.cell_size = cell_size
+        self.pair_hour = pair_hour
+        self.pair = pair
+        self.hour = hour
+        self.overall = overall
+
+    @classmethod
+    def fit(cls, start_lat, start_lon, end_lat, end_lon, distance, minutes, hours, cell_size=0.05, min_samples=5):
+        start_lat, start_lon, end_lat, end_lon, distance, minutes = (
+            np.asarray(value, dtype=np.float64) for value in (start_lat, start_lon, end_lat, end_lon, distance, minutes)
+        )
+        hours = np.asarray(hours, dtype=np.int64)
+        straight = straight_km(start_lat, start_lon, end_lat, end_lon)
+        usable = (straight > 0.05) & (distance > 0) & (minutes > 0) & (distance < straight * 10)
+        start_lat, start_lon, end_lat, end_lon, distance, minutes, hours, straight = (
+            value[usable] for value in (start_lat, start_lon, end_lat, end_lon, distance, minutes, hours, straight)
+        )
+        if not len(straight):
+            raise ValueError("No usable trips to fit on.")
+
+        cells = np.stack([
+            np.floor(start_lat / cell_size), np.floor(start_lon / cell_size),
+            np.floor(end_lat / cell_size), np.floor(end_lon / cell_size),
+        ], axis=1).astype(np.int64)
+        levels = {}
+        for name, keys in (
+            ('pair_hour', np.column_stack([cells, hours])),
+            ('pair', cells),
+            ('hour', hours.reshape(-1, 1)),
+        ):
+            unique, detour, counts = _slopes(keys, straight, distance, min_samples)
+            matched = {tuple(key): index for index, key in enumerate(unique.tolist())}
+            pace_keys, pace, _ = _slopes(keys, distance, minutes, min_samples)
+            levels[name] = {
+                key if len(key) > 1 else key[0]: (float(detour[matched[key]]), float(value))
+                for key, value in zip(map(tuple, pace_keys.tolist()), pace)
+                if key in matched
+            }
+
+        overall = (
+            float((straight * distance).sum() / (straight * straight).sum()),
+            float((distance * minutes).sum() / (distance * distance).sum()),
+        )
+        return cls(cell_size, levels['pair_hour'], levels['pair'], levels['hour'], overall)
+
+    def factors(self, start_lat, start_lon, end_lat, end_lon, hours):
+        size = self.cell_size
+        pair = (int(start_lat // size), int(start_lon // size), int(end_lat // size), int(end_lon // size))
+        exact = self.pair_hour.get(pair + (hours,))
+        if exact is not None:
+            return exact
+        hour = self.hour.get(hours, self.overall)
+        base = self.pair.get(pair)
+        if base is None:
+            return hour
+        # Cell pair detour and pace, with the pace scaled to this hour of week.
+        return base[0], base[1] * hour[1] / self.overall[1]
+
+    def estimate(self, start_lat, start_lon, end_lat, end_lon, moment):
+        '''
+            (road km, minutes) for one trip; pure Python, a few microseconds.
+            None when a coordinate is not a finite number.
+        '''
+        try:
+            start_lat, start_lon, end_lat, end_lon = float(start_lat), float(start_lon), float(end_lat), float(end_lon)
+        except (TypeError, ValueError):
+            return None
+        if not all(math.isfinite(value) for value in (start_lat, start_lon, end_lat, end_lon)):
+            return None
+        detour, pace = self.factors(start_lat, start_lon, end_lat, end_lon, hour_of_week(moment))
+        distance = detour * float(straight_km(start_lat, start_lon, end_lat, end_lon))
+        return round(distance, 2), round(pace * distance, 2)
+
+    def save(self, path):
+        def pack(level, width):
+            keys = np.array([key if isinstance(key, tuple) else (key,) for key in level], dtype=np.int64).reshape(-1, width)
+            values = np.array(list(level.values()), dtype=np.float64).reshape(-1, 2)
+            return keys, values
+
+        pair_hour_keys, pair_hour_values = pack(self.pair_hour, 5)
+        pair_keys, pair_values = pack(self.pair, 4)
+        hour_keys, hour_values = pack(self.hour, 1)
+        with open(path, 'wb') as model_file:
+            np.savez_compressed(
+                model_file, cell_size=self.cell_size, overall=np.array(self.overall),
+                pair_hour_keys=pair_hour_keys, pair_hour_values=pair_hour_values,
+                pair_keys=pair_keys, pair_values=pair_values,
+                hour_keys=hour_keys, hour_values=hour_values,
+            )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            def unpack(name, single=False):
+                keys, values = data[f'{name}_keys'].tolist(), data[f'{name}_values'].tolist()
+                return {(key[0] if single else tuple(key)): tuple(value) for key, value in zip(keys, values)}
+
+            return cls(
+                float(data['cell_size']), unpack('pair_hour'), unpack('pair'), unpack('hour', single=True),
+                tuple(data['overall'].tolist()),
+            )
+
+
+_model = None
+_loaded_mtime = None
+_lock = threading.Lock()
+
+def get_eta_model():
+    '''
+        The model at ETA_MODEL['PATH'], reloaded when the file changes;
+        None until `train_eta_model` has written one.
+    '''
+    global _model, _loaded_mtime
+    path = settings.ETA_MODEL['PATH']
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    if mtime != _loaded_mtime:
+        with _lock:
+            if mtime != _loaded_mtime:
+                _model, _loaded_mtime = EtaModel.load(path), mtime
+    return _model
@@ -0,0 +1,103 @@
+import threading
+import time
+from itertools import chain
+
+import numpy as np
+from asgiref.sync import sync_to_async
+
+from Uber import settings
+
+
+MINUTES_PER_DAY = 24 * 60
+BASE_FARE = 5
+
+
+def minute_of_day(moment):
+    return moment.hour * 60 + moment.minute
+
+
+def _window(start, end, inclusive_end=False):
+    start, end = minute_of_day(start), minute_of_day(end) + (1 if inclusive_end else 0)
+    if start <= end:
+        return range(start, min(end, MINUTES_PER_DAY))
+    # Window wraps past midnight, e.g. 22:30 - 07:00.
+    return chain(range(start, MINUTES_PER_DAY), range(0, end))
+
+
+class FareSchedule:
+    """
+        TripFare rows compiled into a minute-of-day lookup table.
+
+        `table[minute]` holds `(vehicle_type, per_km_rate)` pairs with the
+        night / peak surcharge already folded into the rate, so a quote is one
+        index plus one multiply per vehicle type. `rate_matrix` holds the same
+        rates as a (minute, vehicle type) float array for pricing in bulk.
+    """
+    def __init__(self, fares):
+        table = [[] for _ in range(MINUTES_PER_DAY)]
+        for fare in fares:
+            rates = [fare.normal_fare] * MINUTES_PER_DAY
+            peak_rate = fare.normal_fare + fare.peak_time_fare
+            for minute in chain(
+                _window(fare.peak_time_morning_starting, fare.peak_time_morning_ending, inclusive_end=True),
+                _window(fare.peak_time_evening_starting, fare.peak_time_evening_ending, inclusive_end=True),
+            ):
+                rates[minute] = peak_rate
+            # Night fare wins over peak fare where the windows overlap.
+            night_rate = fare.normal_fare + fare.night_time_fare
+            for minute in _window(fare.night_time_starting, fare.night_time_ending):
+                rates[minute] = night_rate
+            for minute, rate in enumerate(rates):
+                table[minute].append((fare.vehicle_type, rate))
+        self.table = tuple(tuple(row) for row in table)
+        self.vehicle_types = [vehicle_type for vehicle_type, _ in self.table[0]]
+        self.rate_matrix = np.array([[float(rate) for _, rate in row] for row in self.table], dtype=np.float64).reshape(MINUTES_PER_DAY, len(self.vehicle_types))
+        self.compiled_at = time.monotonic()
+
+    def rates_at(self, moment):
+        return self.table[minute_of_day(moment)]
+
+    def quote(self, distance, moment):
+        return {vehicle_type: BASE_FARE + rate * distance for vehicle_type, rate in self.rates_at(moment)}
+
+    def quote_many(self, distances, moment):
+        '''
+            Fares for an array of distances; returns a (distance, vehicle type)
+            array rounded to paise, NaN where the distance is NaN.
+        '''
+        distances = np.asarray(distances, dtype=np.float64)
+        rates = self.rate_matrix[minute_of_day(moment)]
+        return np.round(BASE_FARE + np.outer(distances, rates), 2)
+
+
+_schedule = None
+_lock = threading.Lock()
+
+def rebuild_fare_schedule():
+    '''
+        Compile the TripFare table and swap it in as one reference assignment.
+    '''
+    global _schedule
+    from user.models import TripFare
+
+    with _lock:
+        _schedule = FareSchedule(TripFare.objects.all())
+    return _schedule
+
+
+def get_fare_schedule():
+    '''
+        Compiled schedule for this worker, built on first use. Other workers
+        pick up TripFare edits after FARE_SCHEDULE['REFRESH_INTERVAL'] seconds.
+    '''
+    schedule = _schedule
+    if schedule is None or time.monotonic() - schedule.compiled_at > settings.FARE_SCHEDULE['REFRESH_INTERVAL']:
+        schedule = rebuild_fare_schedule()
+    return schedule
+
+
+async def aget_fare_schedule():
+    schedule = _schedule
+    if schedule is None or time.monotonic() - schedule.compiled_at > settings.FARE_SCHEDULE['REFRESH_INTERVAL']:
+        schedule = await sync_to_async(rebuild_fare_schedule)()
+    return schedule
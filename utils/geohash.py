@@ -0,0 +1,65 @@
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+DECODE = {character: index for index, character in enumerate(BASE32)}
+
+
+def encode(latitude, longitude, precision=6):
+    '''
+        Standard geohash of a point; precision 5 is a ~4.9 km cell,
+        6 is ~1.2 km x 0.6 km.
+    '''
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    geohash, bits, bit_count, even = [], 0, 0, True
+    while len(geohash) < precision:
+        value, interval = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (interval[0] + interval[1]) / 2
+        if value >= middle:
+            bits = (bits << 1) | 1
+            interval[0] = middle
+        else:
+            bits <<= 1
+            interval[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(BASE32[bits])
+            bits, bit_count = 0, 0
+    return ''.join(geohash)
+
+
+def bounds(geohash):
+    '''
+        (min_lat, min_lon, max_lat, max_lon) of a geohash cell.
+    '''
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for character in geohash:
+        bits = DECODE[character]
+        for shift in range(4, -1, -1):
+            interval = lon_range if even else lat_range
+            middle = (interval[0] + interval[1]) / 2
+            if (bits >> shift) & 1:
+                interval[0] = middle
+            else:
+                interval[1] = middle
+            even = not even
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def neighbours(geohash):
+    '''
+        The cell itself plus its eight surrounding cells of the same precision.
+    '''
+    min_lat, min_lon, max_lat, max_lon = bounds(geohash)
+    lat_step, lon_step = max_lat - min_lat, max_lon - min_lon
+    centre_lat, centre_lon = (min_lat + max_lat) / 2, (min_lon + max_lon) / 2
+    cells = []
+    for d_lat in (-1, 0, 1):
+        for d_lon in (-1, 0, 1):
+            latitude = centre_lat + d_lat * lat_step
+            if not -90 <= latitude <= 90:
+                continue
+            longitude = (centre_lon + d_lon * lon_step + 180) % 360 - 180
+            cell = encode(latitude, longitude, len(geohash))
+            if cell not in cells:
+                cells.append(cell)
+    return cells
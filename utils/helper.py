@@ -1,30 +1,99 @@
-import requests
-
-def calculate_road_distance_and_time(start_lat, start_lon, end_lat, end_lon, api_key):
-    headers = {
-        'Authorization': api_key,
-        'Content-Type': 'application/json'
-    }
-
-    body = {
-        "coordinates": [
-            [start_lon, start_lat],   # longitude first, then latitude
-            [end_lon, end_lat]
-        ]
-    }
-
-    response = requests.post(
-        'https://api.openrouteservice.org/v2/directions/driving-car',
-        headers=headers,
-        json=body
-    )
-
-    data = response.json()
-    # print(data,"----------")
-    distance_in_meters = data['routes'][0]['summary']['distance']
-    duration_in_seconds = data['routes'][0]['summary']['duration']
-
-    distance_in_km = round(distance_in_meters / 1000, 2)
-    duration_in_minutes = round(duration_in_seconds / 60, 1)
-
-    return distance_in_km, duration_in_minutes
\ No newline at end of file
+import asyncio
+
+from django.utils import timezone
+
+from utils.etaModel import get_eta_model
+from utils.routeCache import route_cache
+from utils.routingBackends import RoutingError, get_routing_backend
+from Uber import settings
+
+def calculate_road_distance_and_time(start_lat, start_lon, end_lat, end_lon):
+    cache_key = route_cache.make_key(start_lat, start_lon, end_lat, end_lon)
+    if cache_key is not None:
+        cached = route_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    distance_in_km, duration_in_minutes = get_routing_backend().route(start_lat, start_lon, end_lat, end_lon)
+
+    if cache_key is not None:
+        route_cache.set(cache_key, (distance_in_km, duration_in_minutes))
+
+    return distance_in_km, duration_in_minutes
+
+
+async def acalculate_road_distance_and_time(start_lat, start_lon, end_lat, end_lon):
+    cache_key = route_cache.make_key(start_lat, start_lon, end_lat, end_lon)
+    if cache_key is not None:
+        cached = await route_cache.aget(cache_key)
+        if cached is not None:
+            return cached
+
+    distance_in_km, duration_in_minutes = await get_routing_backend().aroute(start_lat, start_lon, end_lat, end_lon)
+
+    if cache_key is not None:
+        await route_cache.aset(cache_key, (distance_in_km, duration_in_minutes))
+
+    return distance_in_km, duration_in_minutes
+
+
+def calculate_road_distances(pairs):
+    '''
+        Bulk variant of calculate_road_distance_and_time for
+        `(start_lat, start_lon, end_lat, end_lon)` pairs. Cached corridors are
+        answered locally and only the distinct misses go to the backend in one
+        route_many call. Unroutable pairs come back as None.
+    '''
+    results = [None] * len(pairs)
+    missing = {}
+    for position, pair in enumerate(pairs):
+        cache_key = route_cache.make_key(*pair)
+        cached = route_cache.get(cache_key) if cache_key is not None else None
+        if cached is not None:
+            results[position] = cached
+        else:
+            missing.setdefault(cache_key or position, []).append(position)
+
+    if missing:
+        lookups = list(missing.items())
+        routes = get_routing_backend().route_many([pairs[positions[0]] for _, positions in lookups])
+        for (cache_key, positions), route in zip(lookups, routes):
+            if route is None:
+                continue
+            if isinstance(cache_key, str):
+                route_cache.set(cache_key, route)
+            for position in positions:
+                results[position] = route
+    return results
+
+
+def estimate_road_distance_and_time(start_lat, start_lon, end_lat, end_lon, moment=None):
+    '''
+        Historical (km, minutes) estimate, or None before a model is trained.
+    '''
+    model = get_eta_model()
+    if model is None:
+        return None
+    return model.estimate(start_lat, start_lon, end_lat, end_lon, moment or timezone.localtime())
+
+
+async def aroute_or_estimate(start_lat, start_lon, end_lat, end_lon, moment=None):
+    '''
+        Road route, falling back to the historical estimate when the routing
+        backend fails or takes longer than ETA_MODEL['ROUTING_TIMEOUT']
+        seconds. Without a model there is nothing to fall back to, so the
+        backend's own timeouts apply. Returns (km, minutes, estimated).
+    '''
+    model = get_eta_model()
+    route = acalculate_road_distance_and_time(start_lat, start_lon, end_lat, end_lon)
+    try:
+        if model is None:
+            distance, duration = await route
+        else:
+            distance, duration = await asyncio.wait_for(route, settings.ETA_MODEL['ROUTING_TIMEOUT'])
+        return distance, duration, False
+    except (RoutingError, asyncio.TimeoutError):
+        estimate = model.estimate(start_lat, start_lon, end_lat, end_lon, moment or timezone.localtime()) if model is not None else None
+        if estimate is None:
+            raise
+        return estimate[0], estimate[1], True
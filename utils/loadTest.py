@@ -0,0 +1,233 @@
+import asyncio
+import json
+import math
+import random
+import time
+from collections import Counter, defaultdict
+from datetime import date, time as clock
+
+import httpx
+import numpy as np
+from channels.testing import WebsocketCommunicator
+
+from utils.roadGraph import EARTH_RADIUS_M
+from utils.tokens import PermissionRefreshToken
+
+
+OFFER_STATUSES = ('New trip available', 'New trip offer')
+
+
+
+class LatencyRecorder:
+    """
+        Per-endpoint latency samples and status codes.
+    """
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+
+    def record(self, name, seconds, status=None):
+        self.samples[name].append(seconds)
+        if status is not None:
+            self.statuses[name][status] += 1
+
+    def summary(self, elapsed):
+        '''
+            [{name, count, statuses, p50, p95, p99, max (ms), throughput (/s)}]
+        '''
+        rows = []
+        for name, samples in self.samples.items():
+            milliseconds = np.asarray(samples) * 1000
+            p50, p95, p99 = np.percentile(milliseconds, [50, 95, 99])
+            rows.append({
+                'name': name,
+                'count': len(samples),
+                'statuses': dict(self.statuses[name]),
+                'p50': round(float(p50), 1),
+                'p95': round(float(p95), 1),
+                'p99': round(float(p99), 1),
+                'max': round(float(milliseconds.max()), 1),
+                'throughput': round(len(samples) / elapsed, 1) if elapsed else 0.0,
+            })
+        return rows
+
+
+def create_fixtures(riders, drivers, vehicle_type):
+    '''
+        Riders, drivers with a vehicle in use and default fares; returns
+        (rider tokens, driver tokens). Meant for a throwaway test database.
+    '''
+    from user.models import User, DriverDetail, TripFare
+    from vehicle.models import Vehicle
+
+    if not TripFare.objects.exists():
+        TripFare.objects.bulk_create([
+            TripFare(vehicle_type=name, normal_fare=rate, night_time_fare=3, peak_time_fare=2.5,
+                     night_time_starting=clock(22, 30), night_time_ending=clock(7, 0),
+                     peak_time_morning_starting=clock(9, 0), peak_time_morning_ending=clock(11, 0),
+                     peak_time_evening_starting=clock(18, 0), peak_time_evening_ending=clock(20, 0))
+            for name, rate in (('2 Wheeler', 7), ('3 Wheeler', 10), ('4 Wheeler', 15))
+        ])
+
+    rider_users = User.objects.bulk_create([
+        User(mobile_number=f'+9160{index:08d}', first_name='Rider', last_name=str(index), user_type='customer')
+        for index in range(riders)
+    ])
+    driver_users = User.objects.bulk_create([
+        User(mobile_number=f'+9170{index:08d}', first_name='Driver', last_name=str(index), user_type='driver')
+        for index in range(drivers)
+    ])
+    details = DriverDetail.objects.bulk_create([DriverDetail(user=user, dob=date(1990, 1, 1)) for user in driver_users])
+    vehicles = Vehicle.objects.bulk_create([
+        Vehicle(driver=detail, vehicle_number=f'LT{index:08d}', vehicle_type=vehicle_type)
+        for index, detail in enumerate(details)
+    ])
+    for detail, vehicle in zip(details, vehicles):
+        detail.in_use = vehicle
+    DriverDetail.objects.bulk_update(details, ['in_use'])
+
+    token = lambda user: str(PermissionRefreshToken.for_user(user).access_token)
+    return [token(user) for user in rider_users], [token(user) for user in driver_users]
+
+
+def random_point(latitude, longitude, radius_km):
+    '''
+        Uniform random point within `radius_km` of the centre.
+    '''
+    distance = radius_km * 1000 * math.sqrt(random.random())
+    bearing = random.uniform(0, 2 * math.pi)
+    lat = latitude + math.degrees(distance * math.cos(bearing) / EARTH_RADIUS_M)
+    lon = longitude + math.degrees(distance * math.sin(bearing) / (EARTH_RADIUS_M * math.cos(math.radians(latitude))))
+    return round(lat, 6), round(lon, 6)
+
+
+class LoadTest:
+    """
+        Simulated riders and drivers against the ASGI application, in one
+        event loop.
+
+        Every driver holds a trip_updates websocket, reports a position in
+        the test area every `ping_interval` seconds and accepts whatever it is
+        offered while idle, then starts and completes the trip after
+        `ride_time` seconds. Every rider asks for `trips_per_rider` quotes
+        (tripDetails) and books each (addTripDetails), `think_time` seconds
+        apart. HTTP goes through httpx's ASGI transport, so the numbers cover
+        the full Django stack without a network in between.
+    """
+    def __init__(self, application, rider_tokens, driver_tokens, vehicle_type='2 Wheeler', trips_per_rider=5,
+                 latitude=23.0225, longitude=72.5714, radius=3, think_time=0.0, ping_interval=20, ride_time=0.0, drain=10):
+        self.application = application
+        self.rider_tokens = rider_tokens
+        self.driver_tokens = driver_tokens
+        self.vehicle_type = vehicle_type
+        self.trips_per_rider = trips_per_rider
+        self.latitude = latitude
+        self.longitude = longitude
+        self.radius = radius
+        self.think_time = think_time
+        self.ping_interval = ping_interval
+        self.ride_time = ride_time
+        self.drain = drain
+        self.recorder = LatencyRecorder()
+        self.booked = {}
+        self.offered = set()
+        self.accepted = set()
+
+    async def request(self, client, name, method, url, token, **kwargs):
+        started = time.perf_counter()
+        response = await client.request(method, url, headers={'Authorization': f'Bearer {token}'}, **kwargs)
+        self.recorder.record(name, time.perf_counter() - started, response.status_code)
+        return response
+
+    async def rider(self, client, token):
+        for _ in range(self.trips_per_rider):
+            pickup = random_point(self.latitude, self.longitude, self.radius)
+            drop = random_point(self.latitude, self.longitude, self.radius * 3)
+            response = await self.request(client, 'tripDetails', 'POST', '/tripDetails', token, json={
+                'pickup_location_latitude': pickup[0], 'pickup_location_longitude': pickup[1],
+                'drop_location_latitude': drop[0], 'drop_location_longitude': drop[1],
+                'pickup_location': 'Load test pickup', 'drop_location': 'Load test drop',
+            })
+            if response.status_code == 200:
+                response = await self.request(client, 'addTripDetails', 'POST', '/addTripDetails', token, json={
+                    'quote': response.json()['data']['quote'], 'vehicle_type': self.vehicle_type,
+                    'pickup_location': 'Load test pickup', 'drop_location': 'Load test drop',
+                })
+                if response.status_code == 201:
+                    self.booked[response.json()['data']['id']] = time.perf_counter()
+            if self.think_time:
+                await asyncio.sleep(random.uniform(0, 2 * self.think_time))
+
+    async def connect_driver(self, token):
+        communicator = WebsocketCommunicator(self.application, f'/ws/trip_updates/?token={token}')
+        started = time.perf_counter()
+        connected, _ = await communicator.connect()
+        self.recorder.record('ws connect', time.perf_counter() - started, 101 if connected else 403)
+        return communicator if connected else None
+
+    async def ping(self, communicator):
+        lat, lon = random_point(self.latitude, self.longitude, self.radius)
+        while True:
+            await communicator.send_to(text_data=json.dumps({'type': 'location', 'latitude': lat, 'longitude': lon}))
+            await asyncio.sleep(self.ping_interval)
+            # A few metres of drift between pings.
+            lat, lon = round(lat + random.uniform(-1e-4, 1e-4), 6), round(lon + random.uniform(-1e-4, 1e-4), 6)
+
+    async def driver(self, client, communicator, token):
+        while True:
+            message = json.loads(await communicator.receive_from(timeout=3600))
+            if message.get('status') not in OFFER_STATUSES:
+                continue
+            trip_id = message['data']['id']
+            booked_at = self.booked.get(trip_id)
+            if booked_at is not None and trip_id not in self.offered:
+                self.offered.add(trip_id)
+                self.recorder.record('dispatch (booked -> first offer)', time.perf_counter() - booked_at)
+            if trip_id in self.accepted:
+                continue
+
+            response = await self.request(client, 'acceptTrip', 'POST', f'/acceptTrip/{trip_id}', token)
+            if response.status_code != 200:
+                continue
+            self.accepted.add(trip_id)
+            if booked_at is not None:
+                self.recorder.record('assignment (booked -> accepted)', time.perf_counter() - booked_at)
+            if self.ride_time:
+                await asyncio.sleep(self.ride_time)
+            await self.request(client, 'startTrip', 'POST', f'/startTrip/{trip_id}', token)
+            await self.request(client, 'completeTrip', 'POST', f'/completeTrip/{trip_id}', token)
+
+    async def run(self):
+        '''
+            Run the scenario; returns (summary rows, counters, elapsed seconds).
+        '''
+        transport = httpx.ASGITransport(app=self.application)
+        async with httpx.AsyncClient(transport=transport, base_url='http://testserver', timeout=None) as client:
+            communicators = await asyncio.gather(*(self.connect_driver(token) for token in self.driver_tokens))
+            drivers = [(communicator, token) for communicator, token in zip(communicators, self.driver_tokens) if communicator]
+            background = [asyncio.create_task(self.ping(communicator)) for communicator, _ in drivers]
+            # Let the first pings land in the driver index before booking.
+            await asyncio.sleep(0.5)
+            background += [asyncio.create_task(self.driver(client, communicator, token)) for communicator, token in drivers]
+
+            started = time.perf_counter()
+            await asyncio.gather(*(self.rider(client, token) for token in self.rider_tokens))
+            deadline = time.perf_counter() + self.drain
+            while time.perf_counter() < deadline and len(self.accepted) < len(self.booked):
+                await asyncio.sleep(0.1)
+            elapsed = time.perf_counter() - started
+
+            for task in background:
+                task.cancel()
+            await asyncio.gather(*background, return_exceptions=True)
+            for communicator, _ in drivers:
+                await communicator.disconnect()
+
+        counters = {
+            'riders': len(self.rider_tokens),
+            'drivers connected': len(drivers),
+            'trips booked': len(self.booked),
+            'trips offered': len(self.offered & self.booked.keys()),
+            'trips accepted': len(self.accepted),
+        }
+        return self.recorder.summary(elapsed), counters, elapsed
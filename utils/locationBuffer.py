@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import threading
+
+from django.utils import timezone
+
+from Uber import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+
+class LocationBuffer:
+    """
+        Collects driver location pings in memory and writes them to
+        DriverLocation with one bulk insert every `flush_interval` seconds
+        (or sooner once `max_pending` rows are waiting). Rows from a failed
+        insert go back into the buffer for the next flush.
+    """
+    def __init__(self, flush_interval=5, max_pending=5000, batch_size=1000):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self._pending = []
+        self._lock = threading.Lock()
+        self._tasks = {}
+        self._wakeups = {}
+
+    def add(self, driver_id, latitude, longitude, recorded_at=None):
+        with self._lock:
+            self._pending.append((driver_id, latitude, longitude, recorded_at or timezone.now()))
+            full = len(self._pending) >= self.max_pending
+        if full:
+            for loop, wakeup in list(self._wakeups.items()):
+                loop.call_soon_threadsafe(wakeup.set)
+
+    def drain(self):
+        with self._lock:
+            rows, self._pending = self._pending, []
+        return rows
+
+    def __len__(self):
+        return len(self._pending)
+
+    def restore(self, rows):
+        '''
+            Put rows from a failed write back ahead of newer pings, keeping
+            the newest `max_pending`.
+        '''
+        with self._lock:
+            pending = rows + self._pending
+            dropped = max(len(pending) - self.max_pending, 0)
+            self._pending = pending[dropped:]
+        if dropped:
+            logger.warning("Dropped %s driver locations after a failed write", dropped)
+
+    def flush(self):
+        from user.models import DriverLocation
+
+        rows = self.drain()
+        if rows:
+            try:
+                DriverLocation.objects.bulk_create(self._objects(rows), batch_size=self.batch_size)
+            except Exception:
+                self.restore(rows)
+                raise
+        return len(rows)
+
+    async def aflush(self):
+        from user.models import DriverLocation
+
+        rows = self.drain()
+        if rows:
+            try:
+                await DriverLocation.objects.abulk_create(self._objects(rows), batch_size=self.batch_size)
+            except Exception:
+                self.restore(rows)
+                raise
+        return len(rows)
+
+    @staticmethod
+    def _objects(rows):
+        from user.models import DriverLocation
+
+        return [
+            DriverLocation(driver_id=driver_id, latitude=round(latitude, 6), longitude=round(longitude, 6), recorded_at=recorded_at)
+            for driver_id, latitude, longitude, recorded_at in rows
+        ]
+
+    def start(self):
+        '''
+            Make sure the flush loop runs on the current event loop.
+        '''
+        loop = asyncio.get_running_loop()
+        task = self._tasks.get(loop)
+        if task is None or task.done():
+            self._wakeups[loop] = asyncio.Event()
+            self._tasks[loop] = loop.create_task(self._run(loop))
+
+    async def _run(self, loop):
+        wakeup = self._wakeups[loop]
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(wakeup.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                wakeup.clear()
+                try:
+                    await self.aflush()
+                except Exception:
+                    logger.exception("Failed to write driver locations")
+        finally:
+            self._tasks.pop(loop, None)
+            self._wakeups.pop(loop, None)
+
+
+location_buffer = LocationBuffer(
+    flush_interval=settings.DRIVER_LOCATIONS['FLUSH_INTERVAL'],
+    max_pending=settings.DRIVER_LOCATIONS['MAX_PENDING'],
+    batch_size=settings.DRIVER_LOCATIONS['BATCH_SIZE'],
+)
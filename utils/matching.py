@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import threading
+import time
+
+from channels.layers import get_channel_layer
+
+from utils.assignment import SOLVERS, UNREACHABLE
+from utils.driverIndex import driver_index
+from utils.roadGraph import haversine_m
+from Uber import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+
+class MatchingEngine:
+    """
+        Batches pending trips and idle drivers into short windows and
+        assigns them together instead of letting every driver race for
+        every trip.
+
+        Each window the engine drops trips that are no longer pending, builds
+        an ETA matrix (straight line distance / `average_speed`) between the
+        waiting trips and nearby drivers without an open offer, solves it and
+        sends each matched driver an offer on `driver_<id>`. Offers that are
+        not taken within `offer_ttl` put the trip back in the queue without
+        that driver. Trips still unmatched after `max_wait` are broadcast.
+    """
+    def __init__(self, window=2, solver='hungarian', candidates=20, radius=5000, average_speed=8.3, offer_ttl=15, max_wait=30):
+        self.window = window
+        self.solve = SOLVERS[solver]
+        self.candidates = candidates
+        self.radius = radius
+        self.average_speed = average_speed
+        self.offer_ttl = offer_ttl
+        self.max_wait = max_wait
+        self._pending = {}
+        self._offers = {}
+        self._lock = threading.Lock()
+        self._loop = None
+        self._task = None
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        '''
+            Run the matching loop on the current event loop (once).
+        '''
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._task = self._loop.create_task(self._run())
+
+    def submit(self, trip, data):
+        '''
+            Queue a new trip for the next window; False when no loop is running.
+        '''
+        if not self.running:
+            return False
+        if trip.pickup_location_latitude is None or trip.pickup_location_longitude is None:
+            return False
+        with self._lock:
+            self._pending[trip.id] = {
+                'data': data,
+                'latitude': float(trip.pickup_location_latitude),
+                'longitude': float(trip.pickup_location_longitude),
+                'vehicle_type': trip.vehicle_type,
+                'queued_at': time.monotonic(),
+                'declined': set(),
+            }
+        return True
+
+    def release_driver(self, driver_id):
+        with self._lock:
+            self._offers.pop(driver_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+            self._offers.clear()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.window)
+            try:
+                await self.match_once()
+            except Exception:
+                logger.exception("Trip matching window failed")
+
+    def _expire_offers(self, now):
+        for driver_id, (trip_id, entry, expires_at) in list(self._offers.items()):
+            if expires_at <= now:
+                del self._offers[driver_id]
+                entry['declined'].add(driver_id)
+                self._pending.setdefault(trip_id, entry)
+
+    async def match_once(self):
+        '''
+            Run one matching window; returns [(trip_id, driver_id)] offered.
+        '''
+        from user.models import Trip
+
+        now = time.monotonic()
+        with self._lock:
+            self._expire_offers(now)
+            trip_ids = list(self._pending)
+        if not trip_ids:
+            return []
+
+        still_pending = {
+            trip_id async for trip_id in Trip.objects.filter(id__in=trip_ids, status='pending').values_list('id', flat=True)
+        }
+
+        with self._lock:
+            for trip_id in trip_ids:
+                if trip_id not in still_pending:
+                    self._pending.pop(trip_id, None)
+            busy = set(self._offers)
+            by_vehicle_type = {}
+            for trip_id, entry in self._pending.items():
+                by_vehicle_type.setdefault((entry['vehicle_type'] or '').lower(), []).append((trip_id, entry))
+
+        offers = []
+        for vehicle_type, trips in by_vehicle_type.items():
+            offers.extend(self._assign(vehicle_type, trips, busy))
+
+        expired = []
+        with self._lock:
+            for trip_id, driver_id, entry in offers:
+                self._pending.pop(trip_id, None)
+                self._offers[driver_id] = (trip_id, entry, now + self.offer_ttl)
+            for trip_id, entry in list(self._pending.items()):
+                if now - entry['queued_at'] >= self.max_wait:
+                    expired.append((trip_id, entry))
+                    del self._pending[trip_id]
+
+        channel_layer = get_channel_layer()
+        from utils.dispatch import trip_groups, trip_update_event
+        for trip_id, driver_id, entry in offers:
+            await channel_layer.group_send(f'driver_{driver_id}', trip_update_event({
+                'status': 'New trip offer',
+                'expires_in': self.offer_ttl,
+                'data': entry['data'],
+            }))
+        for trip_id, entry in expired:
+            event = trip_update_event({'status': 'New trip available', 'data': entry['data']})
+            for group_name in trip_groups(entry['vehicle_type'], entry['latitude'], entry['longitude']):
+                await channel_layer.group_send(group_name, event)
+
+        return [(trip_id, driver_id) for trip_id, driver_id, entry in offers]
+
+    def _assign(self, vehicle_type, trips, busy):
+        columns, positions = {}, []
+        for trip_id, entry in trips:
+            for driver_id, distance in driver_index.nearest(entry['latitude'], entry['longitude'], self.candidates, vehicle_type=vehicle_type, radius=self.radius):
+                if driver_id not in busy and driver_id not in columns:
+                    columns[driver_id] = len(positions)
+                    positions.append((driver_id, driver_index.position(driver_id)))
+        if not positions:
+            return []
+
+        cost = []
+        for trip_id, entry in trips:
+            cost_row = []
+            for driver_id, position in positions:
+                distance = haversine_m(entry['latitude'], entry['longitude'], position[0], position[1]) if position else None
+                if distance is None or distance > self.radius or driver_id in entry['declined']:
+                    cost_row.append(UNREACHABLE)
+                else:
+                    cost_row.append(distance / self.average_speed)
+            cost.append(cost_row)
+
+        return [(trips[row][0], positions[column][0], trips[row][1]) for row, column in self.solve(cost)]
+
+
+matching_engine = MatchingEngine(
+    window=settings.MATCHING['WINDOW'],
+    solver=settings.MATCHING['SOLVER'],
+    candidates=settings.MATCHING['CANDIDATES'],
+    radius=settings.DISPATCH['SEARCH_RADIUS'],
+    average_speed=settings.MATCHING['AVERAGE_SPEED'],
+    offer_ttl=settings.MATCHING['OFFER_TTL'],
+    max_wait=settings.MATCHING['MAX_WAIT'],
+)
@@ -1,5 +1,5 @@
 from rest_framework.permissions import BasePermission
-from user.models import RolePermission
+from utils.tokens import request_has_permission
 
 
 
@@ -11,11 +11,9 @@ class DynamicPermission(BasePermission):
         self.required_permissions = required_permissions
 
     def has_permission(self, request, view):
-        role = request.user.role
-        if role is None:
+        role_id = request.user.role_id
+        if role_id is None:
             return False
         if request.user.user_type != 'admin':
             return False
-        permissions = RolePermission.objects.filter(role=role).first().permissions.values_list('permission_name', flat=True)
-        required_permissions = self.required_permissions
-        return bool(required_permissions in list(permissions))
\ No newline at end of file
+        return request_has_permission(request, self.required_permissions)
@@ -0,0 +1,221 @@
+import hmac
+import secrets
+import threading
+import time
+
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from Uber import settings
+
+
+VERIFIED = 'verified'
+INVALID = 'invalid'
+EXPIRED = 'expired'
+TOO_MANY_ATTEMPTS = 'too_many_attempts'
+
+
+
+class OtpRateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"OTP rate limit hit, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class OtpStore:
+    """
+        One-time passwords keyed by mobile number, kept out of the User table.
+
+        `issue()` stores a fresh code for `ttl` seconds, at most `max_sends`
+        per number every `send_window` seconds. `verify()` counts every
+        attempt against the code and gives up after `max_attempts`; a
+        correct code is consumed.
+    """
+    def __init__(self, ttl=120, max_attempts=5, max_sends=3, send_window=600, digits=4):
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+        self.max_sends = max_sends
+        self.send_window = send_window
+        self.digits = digits
+
+    def generate(self):
+        low = 10 ** (self.digits - 1)
+        return low + secrets.randbelow(9 * low)
+
+    def issue(self, mobile_number):
+        sends, retry_after = self._count_send(mobile_number)
+        if sends > self.max_sends:
+            raise OtpRateLimited(retry_after)
+        otp = self.generate()
+        self._put(mobile_number, otp)
+        return otp
+
+    def verify(self, mobile_number, otp):
+        attempts, code = self._attempt(mobile_number)
+        if code is None:
+            return EXPIRED
+        if attempts > self.max_attempts:
+            self.discard(mobile_number)
+            return TOO_MANY_ATTEMPTS
+        if not hmac.compare_digest(str(code), str(otp)):
+            return INVALID
+        # Only the request that removes the code succeeds; a concurrent one
+        # with the same code finds it gone.
+        if not self._consume(mobile_number, code):
+            return EXPIRED
+        return VERIFIED
+
+    def _count_send(self, mobile_number):
+        '''
+            Count a send; returns (sends in the current window, seconds left in it).
+        '''
+        raise NotImplementedError
+
+    def _put(self, mobile_number, otp):
+        raise NotImplementedError
+
+    def _attempt(self, mobile_number):
+        '''
+            Count a verification attempt; returns (attempts so far, stored code or None).
+        '''
+        raise NotImplementedError
+
+    def _consume(self, mobile_number, code):
+        '''
+            Atomically remove `code`; True only for the caller that removed it.
+        '''
+        raise NotImplementedError
+
+    def discard(self, mobile_number):
+        raise NotImplementedError
+
+
+class LocalOtpStore(OtpStore):
+    """
+        Per-process store; only correct with a single process (tests).
+    """
+    def __init__(self, **options):
+        super().__init__(**options)
+        self._codes = {}      # mobile_number -> (otp, attempts, expires_at)
+        self._sends = {}      # mobile_number -> (sends, window_ends_at)
+        self._lock = threading.Lock()
+
+    def _count_send(self, mobile_number):
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            sends, window_ends_at = self._sends.get(mobile_number, (0, now + self.send_window))
+            self._sends[mobile_number] = (sends + 1, window_ends_at)
+        return sends + 1, max(1, round(window_ends_at - now))
+
+    def _put(self, mobile_number, otp):
+        with self._lock:
+            self._codes[mobile_number] = (otp, 0, time.monotonic() + self.ttl)
+
+    def _attempt(self, mobile_number):
+        with self._lock:
+            entry = self._codes.get(mobile_number)
+            if entry is None or entry[2] <= time.monotonic():
+                self._codes.pop(mobile_number, None)
+                return 0, None
+            otp, attempts, expires_at = entry
+            self._codes[mobile_number] = (otp, attempts + 1, expires_at)
+        return attempts + 1, otp
+
+    def _consume(self, mobile_number, code):
+        with self._lock:
+            entry = self._codes.get(mobile_number)
+            if entry is None or entry[0] != code:
+                return False
+            del self._codes[mobile_number]
+        return True
+
+    def discard(self, mobile_number):
+        with self._lock:
+            self._codes.pop(mobile_number, None)
+
+    def _evict(self, now):
+        for mobile_number in [number for number, (_, ends_at) in self._sends.items() if ends_at <= now]:
+            del self._sends[mobile_number]
+        for mobile_number in [number for number, (_, _, expires_at) in self._codes.items() if expires_at <= now]:
+            del self._codes[mobile_number]
+
+
+class CacheOtpStore(OtpStore):
+    """
+        Store shared by all workers through a Django cache (e.g. Redis).
+        Counters use add() + incr(), which are atomic on shared backends.
+    """
+    def __init__(self, cache='default', prefix='otp', **options):
+        super().__init__(**options)
+        self.cache = caches[cache]
+        self.prefix = prefix
+
+    def _key(self, kind, mobile_number):
+        return f'{self.prefix}:{kind}:{mobile_number}'
+
+    def _incr(self, key, timeout):
+        self.cache.add(key, 0, timeout)
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # Expired between add() and incr(); start a new window.
+            self.cache.add(key, 1, timeout)
+            return 1
+
+    def _count_send(self, mobile_number):
+        window_key = self._key('window', mobile_number)
+        now = time.time()
+        self.cache.add(window_key, now + self.send_window, self.send_window)
+        window_ends_at = self.cache.get(window_key) or now + self.send_window
+        sends = self._incr(self._key('sends', mobile_number), self.send_window)
+        return sends, max(1, round(window_ends_at - now))
+
+    def _put(self, mobile_number, otp):
+        self.cache.set_many({
+            self._key('code', mobile_number): otp,
+            self._key('attempts', mobile_number): 0,
+        }, self.ttl)
+
+    def _attempt(self, mobile_number):
+        code = self.cache.get(self._key('code', mobile_number))
+        if code is None:
+            return 0, None
+        return self._incr(self._key('attempts', mobile_number), self.ttl), code
+
+    def _consume(self, mobile_number, code):
+        # delete() reports whether the key existed, and only one caller can
+        # see True. A code re-issued in between is deleted too, which only
+        # means the user has to request another one.
+        consumed = self.cache.delete(self._key('code', mobile_number))
+        self.cache.delete(self._key('attempts', mobile_number))
+        return consumed
+
+    def discard(self, mobile_number):
+        self.cache.delete_many([self._key('code', mobile_number), self._key('attempts', mobile_number)])
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_otp_store():
+    '''
+        Return the process-wide store configured in settings.OTP.
+    '''
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store_class = import_string(settings.OTP['BACKEND'])
+                _store = store_class(**settings.OTP.get('OPTIONS', {}))
+    return _store
+
+
+def set_otp_store(store):
+    '''
+        Swap the process-wide store (tests); returns the previous one.
+    '''
+    global _store
+    with _store_lock:
+        previous, _store = _store, store
+    return previous
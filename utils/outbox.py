@@ -0,0 +1,177 @@
+import asyncio
+import logging
+from datetime import timedelta
+
+from channels.db import database_sync_to_async
+from django.db import transaction
+from django.utils import timezone
+
+from Uber import settings
+
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+
+
+def register(topic):
+    '''
+        Decorator adding an async handler for outbox messages of `topic`.
+    '''
+    def decorator(handler):
+        HANDLERS[topic] = handler
+        return handler
+    return decorator
+
+
+def enqueue(topic, payload):
+    '''
+        Record a side effect; call inside the transaction that causes it so
+        both commit or neither does. The relay is woken once it commits.
+    '''
+    from user.models import OutboxMessage
+
+    if topic not in HANDLERS:
+        raise ValueError(f"No outbox handler for {topic!r}")
+    message = OutboxMessage.objects.create(topic=topic, payload=payload)
+    transaction.on_commit(outbox_relay.wake)
+    return message
+
+
+@register('trip.created')
+async def trip_created(payload):
+    from user.models import Trip
+    from utils.dispatch import anotify_new_trip
+
+    await anotify_new_trip(Trip(**payload['trip']), payload['data'])
+
+
+@register('trip.taken')
+async def trip_taken(payload):
+    from utils.dispatch import anotify_trip_taken
+
+    await anotify_trip_taken(payload['id'], payload['vehicle_type'])
+
+
+class OutboxRelay:
+    """
+        Delivers OutboxMessage rows to their handlers, at least once.
+
+        Each pass claims up to `batch_size` due rows with SKIP LOCKED and
+        pushes their available_at `lease` seconds ahead, so several relays
+        can run side by side and a relay that dies mid batch only delays its
+        rows. Delivered rows are deleted in one statement; failed ones are
+        retried after `retry_backoff ** attempts` seconds and left in the
+        table for inspection after `max_attempts`.
+    """
+    def __init__(self, batch_size=100, interval=1, lease=30, max_attempts=10, retry_backoff=2):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self._tasks = {}
+        self._wakeups = {}
+
+    def claim(self):
+        from user.models import OutboxMessage
+
+        now = timezone.now()
+        with transaction.atomic():
+            messages = list(
+                OutboxMessage.objects
+                .select_for_update(skip_locked=True)
+                .filter(available_at__lte=now, attempts__lt=self.max_attempts)
+                .order_by('available_at', 'id')[:self.batch_size]
+            )
+            if messages:
+                OutboxMessage.objects.filter(id__in=[message.id for message in messages]).update(
+                    available_at=now + timedelta(seconds=self.lease)
+                )
+        return messages
+
+    def settle(self, delivered, failed):
+        '''
+            Delete `delivered` ids and reschedule `failed` [(message, error)].
+        '''
+        from user.models import OutboxMessage
+
+        if delivered:
+            OutboxMessage.objects.filter(id__in=delivered).delete()
+        now = timezone.now()
+        for message, error in failed:
+            attempts = message.attempts + 1
+            if attempts >= self.max_attempts:
+                logger.error("Outbox message %s (%s) gave up after %s attempts: %s", message.id, message.topic, attempts, error)
+            OutboxMessage.objects.filter(id=message.id).update(
+                attempts=attempts,
+                last_error=error,
+                available_at=now + timedelta(seconds=self.retry_backoff ** attempts),
+            )
+
+    async def deliver(self, message):
+        handler = HANDLERS.get(message.topic)
+        if handler is None:
+            raise LookupError(f"No outbox handler for {message.topic!r}")
+        await handler(message.payload)
+
+    async def relay_once(self):
+        '''
+            Deliver one batch; returns how many messages were claimed.
+        '''
+        messages = await database_sync_to_async(self.claim)()
+        if not messages:
+            return 0
+        results = await asyncio.gather(*(self.deliver(message) for message in messages), return_exceptions=True)
+        delivered, failed = [], []
+        for message, result in zip(messages, results):
+            if isinstance(result, Exception):
+                failed.append((message, repr(result)))
+            else:
+                delivered.append(message.id)
+        await database_sync_to_async(self.settle)(delivered, failed)
+        return len(messages)
+
+    def wake(self):
+        for loop, wakeup in list(self._wakeups.items()):
+            loop.call_soon_threadsafe(wakeup.set)
+
+    def start(self):
+        '''
+            Make sure the relay loop runs on the current event loop.
+        '''
+        loop = asyncio.get_running_loop()
+        task = self._tasks.get(loop)
+        if task is None or task.done():
+            self._wakeups[loop] = asyncio.Event()
+            self._tasks[loop] = loop.create_task(self.run(loop))
+        return self._tasks[loop]
+
+    async def run(self, loop):
+        wakeup = self._wakeups[loop]
+        try:
+            while True:
+                try:
+                    # A full batch means more are probably waiting.
+                    if await self.relay_once() == self.batch_size:
+                        continue
+                except Exception:
+                    logger.exception("Outbox relay pass failed")
+                try:
+                    await asyncio.wait_for(wakeup.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+                wakeup.clear()
+        finally:
+            self._tasks.pop(loop, None)
+            self._wakeups.pop(loop, None)
+
+
+outbox_relay = OutboxRelay(
+    batch_size=settings.OUTBOX['BATCH_SIZE'],
+    interval=settings.OUTBOX['INTERVAL'],
+    lease=settings.OUTBOX['LEASE'],
+    max_attempts=settings.OUTBOX['MAX_ATTEMPTS'],
+    retry_backoff=settings.OUTBOX['RETRY_BACKOFF'],
+)
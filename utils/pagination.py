@@ -0,0 +1,268 @@
+import base64
+import json
+import math
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from utils.roadGraph import haversine_m
+
+
+
+class NearestFirstCursorPagination(BasePagination):
+    '''
+        Cursor pagination over a small, already bounded candidate list,
+        ordered by distance from an origin and then id.
+
+        The view supplies the origin through `get_origin()` (None when the
+        position is unknown, which falls back to newest first). The
+        cursor carries the origin, so later pages keep the same ordering even
+        if the caller has moved in between.
+    '''
+    page_size = 20
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        cursor = self.decode_cursor(request)
+        origin = cursor['origin'] if cursor else view.get_origin()
+
+        objects = list(queryset)
+        for obj in objects:
+            if origin is None or obj.pickup_location_latitude is None or obj.pickup_location_longitude is None:
+                obj.pickup_distance = None
+            else:
+                obj.pickup_distance = haversine_m(origin[0], origin[1], float(obj.pickup_location_latitude), float(obj.pickup_location_longitude))
+        objects.sort(key=self.sort_key)
+
+        if cursor:
+            after = (cursor['distance'] if cursor['distance'] is not None else math.inf, -cursor['id'])
+            objects = [obj for obj in objects if self.sort_key(obj) > after]
+
+        page = objects[:self.page_size]
+        self.next_cursor = None
+        if len(objects) > self.page_size:
+            last = page[-1]
+            self.next_cursor = {'origin': origin, 'distance': last.pickup_distance, 'id': last.id}
+        return page
+
+    @staticmethod
+    def sort_key(obj):
+        # Unknown distances go last; ties (and the no-origin case) newest first.
+        return (obj.pickup_distance if obj.pickup_distance is not None else math.inf, -obj.id)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            origin = cursor['origin']
+            return {
+                'origin': (float(origin[0]), float(origin[1])) if origin is not None else None,
+                'distance': float(cursor['distance']) if cursor['distance'] is not None else None,
+                'id': int(cursor['id']),
+            }
+        except (TypeError, ValueError, KeyError, IndexError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, cursor):
+        encoded = base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return self.encode_cursor(self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class KeysetPagination(BasePagination):
+    '''
+        Cursor pagination on (ordering field, id).
+
+        The ordering field comes from the view's OrderingFilter (or
+        `ordering`), and id breaks ties in the same direction, so the order
+        is total and each page is a `WHERE (field, id) < cursor ... LIMIT n`
+        index range read however deep the caller goes. NULLs sort last.
+    '''
+    page_size = 8
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering = '-created_at'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.field, self.descending = self.get_ordering(request, queryset, view)
+        self.nullable = self.is_nullable(queryset.model, self.field)
+        cursor = self.decode_cursor(request, queryset.model)
+        backwards = bool(cursor and cursor['previous'])
+
+        # Walking back to the previous page is the same query, reversed.
+        descending = self.descending != backwards
+        nulls = {'nulls_first': True} if backwards else {'nulls_last': True}
+        field = F(self.field).desc(**nulls) if descending else F(self.field).asc(**nulls)
+        queryset = queryset.order_by(field, '-id' if descending else 'id')
+        if cursor:
+            queryset = queryset.filter(self.after(cursor, descending, backwards))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        page = results[:self.page_size]
+        if backwards:
+            page.reverse()
+
+        self.next_cursor = self.previous_cursor = None
+        if page:
+            if has_more or backwards:
+                self.next_cursor = self.cursor_for(page[-1], previous=False)
+            if (has_more and backwards) or (cursor and not backwards):
+                self.previous_cursor = self.cursor_for(page[0], previous=True)
+        return page
+
+    def after(self, cursor, descending, backwards):
+        '''
+            Rows strictly past the cursor in the current direction.
+        '''
+        value, pk = cursor['value'], cursor['id']
+        beyond = '__lt' if descending else '__gt'
+        past_id = Q(**{'id' + beyond: pk})
+        if value is None:
+            # Inside the trailing NULL block; going back also covers every non-NULL row.
+            condition = Q(**{self.field + '__isnull': True}) & past_id
+            if backwards:
+                condition |= Q(**{self.field + '__isnull': False})
+            return condition
+        condition = Q(**{self.field + beyond: value}) | (Q(**{self.field: value}) & past_id)
+        if not backwards and self.nullable:
+            condition |= Q(**{self.field + '__isnull': True})
+        return condition
+
+    @staticmethod
+    def is_nullable(model, field_path):
+        '''
+            NULL handling only for columns that can hold NULL, so that plain
+            `created_at` cursors stay a pure index range.
+        '''
+        try:
+            for name in field_path.split('__'):
+                field = model._meta.get_field(name)
+                if field.null:
+                    return True
+                model = field.related_model
+        except (FieldDoesNotExist, AttributeError):
+            # Annotations such as `name` are not model fields.
+            return True
+        return False
+
+    @staticmethod
+    def model_field(model, field_path):
+        '''
+            The model field at the end of `field_path`, or None for annotations.
+        '''
+        field = None
+        try:
+            for name in field_path.split('__'):
+                field = model._meta.get_field(name)
+                model = field.related_model
+        except (FieldDoesNotExist, AttributeError):
+            return None
+        return field
+
+    def get_page_size(self, request):
+        try:
+            requested = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(requested, self.max_page_size))
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'ordering', None) or self.ordering
+        for backend in getattr(view, 'filter_backends', []):
+            if hasattr(backend, 'get_ordering'):
+                ordering = backend().get_ordering(request, queryset, view) or ordering
+                break
+        if not isinstance(ordering, str):
+            ordering = ordering[0]
+        return ordering.lstrip('-'), ordering.startswith('-')
+
+    def cursor_for(self, obj, previous):
+        value = obj
+        for name in self.field.split('__'):
+            value = getattr(value, name, None) if value is not None else None
+        if hasattr(value, 'isoformat'):
+            # Full precision; DjangoJSONEncoder would cut datetimes to milliseconds.
+            value = value.isoformat()
+        elif value is not None and not isinstance(value, (str, int, float, bool)):
+            value = str(value)
+        return {'value': value, 'id': obj.pk, 'field': self.field, 'previous': previous}
+
+    def decode_cursor(self, request, model):
+        '''
+            The cursor's value goes into a filter, so it is converted with the
+            ordering field's own to_python(); anything it rejects is a 404.
+        '''
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            if cursor['field'] != self.field:
+                raise ValueError
+            value = cursor['value']
+            if value is not None:
+                if not isinstance(value, (str, int, float, bool)):
+                    raise ValueError
+                field = self.model_field(model, self.field)
+                if field is not None:
+                    value = field.to_python(value)
+            return {'value': value, 'id': int(cursor['id']), 'previous': bool(cursor['previous'])}
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, cursor):
+        if cursor is None:
+            return None
+        encoded = base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.encode_cursor(self.next_cursor),
+            'previous': self.encode_cursor(self.previous_cursor),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,81 @@
+from importlib import import_module
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver, resolve
+
+
+
+def _walk(patterns, prefix=''):
+    '''
+        (full route, pattern, urlconf module) for every endpoint, descending
+        into include()s.
+    '''
+    for pattern in patterns:
+        route = prefix + str(pattern.pattern)
+        if isinstance(pattern, URLResolver):
+            module = pattern.urlconf_module
+            if isinstance(module, str):
+                module = import_module(module)
+            yield from ((full_route, endpoint, owner or module) for full_route, endpoint, owner in _walk(pattern.url_patterns, route))
+        elif isinstance(pattern, URLPattern):
+            yield route, pattern, None
+
+
+def query_budgets():
+    '''
+        {route: max queries} collected from the QUERY_BUDGETS dict of every
+        included urls module.
+    '''
+    budgets = {}
+    for route, pattern, module in _walk(get_resolver().url_patterns):
+        module_budgets = getattr(module, 'QUERY_BUDGETS', None)
+        if module_budgets is not None and str(pattern.pattern) in module_budgets:
+            budgets[route] = module_budgets[str(pattern.pattern)]
+    return budgets
+
+
+def unbudgeted_routes(urlconf):
+    '''
+        Routes of `urlconf` (a urls module) missing from its QUERY_BUDGETS.
+    '''
+    budgets = getattr(urlconf, 'QUERY_BUDGETS', {})
+    return [str(pattern.pattern) for pattern in urlconf.urlpatterns if str(pattern.pattern) not in budgets]
+
+
+def budget_for(path):
+    route = resolve(path).route
+    budgets = query_budgets()
+    if route not in budgets:
+        raise LookupError(f"No query budget declared for {route!r}")
+    return route, budgets[route]
+
+
+class QueryBudgetMixin:
+    """
+        TestCase mixin checking an endpoint against the query budget
+        declared for its URL.
+
+        `assertQueryBudget(request, scale)` calls `scale(rows)` to add
+        synthetic rows, then `request(scale's return value)` under a query
+        counter, once with `small_rows` and once with `large_rows`. It fails
+        when either run goes over the budget or the count grows with the
+        number of rows (an N+1).
+    """
+    small_rows = 2
+    large_rows = 10
+
+    def assertQueryBudget(self, request, scale=None):
+        counts = []
+        for rows in (self.small_rows, self.large_rows):
+            target = scale(rows) if scale is not None else None
+            with CaptureQueriesContext(connection) as queries:
+                response = request(target)
+            self.assertLess(response.status_code, 500, getattr(response, 'data', response.content))
+            counts.append(len(queries))
+
+        route, budget = budget_for(response.request['PATH_INFO'])
+        captured = '\n'.join(query['sql'] for query in queries.captured_queries)
+        self.assertEqual(counts[0], counts[1], f"{route}: queries grow with rows ({counts[0]} -> {counts[1]})\n{captured}")
+        self.assertLessEqual(max(counts), budget, f"{route}: {max(counts)} queries over a budget of {budget}\n{captured}")
+        return response
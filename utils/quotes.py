@@ -0,0 +1,56 @@
+import secrets
+import time
+
+from django.core import signing
+
+from Uber import settings
+
+
+QUOTE_SALT = 'user.trip-quote'
+
+
+class QuoteError(Exception):
+    pass
+
+
+def sign_quote(customer_id, pickup, drop, distance, estimated_time, total_fare, surge=1.0):
+    '''
+        Pack a fare quote into a compact signed token.
+
+        `pickup` / `drop` are `(latitude, longitude)` pairs and `total_fare`
+        maps vehicle type to fare (surge already applied). Returns `(token, expires_at)` where
+        `expires_at` is a unix timestamp. The random nonce is saved on the
+        trip booked with the quote, so a quote books at most one trip.
+    '''
+    expires_at = int(time.time()) + settings.TRIP_QUOTE['TTL']
+    payload = {
+        "c": customer_id,
+        "p": [str(pickup[0]), str(pickup[1])],
+        "d": [str(drop[0]), str(drop[1])],
+        "km": str(distance),
+        "min": str(estimated_time),
+        "f": {vehicle_type.lower(): str(fare) for vehicle_type, fare in total_fare.items()},
+        "s": str(surge),
+        "x": expires_at,
+        "n": secrets.token_urlsafe(9),
+    }
+    return signing.dumps(payload, salt=QUOTE_SALT, compress=True), expires_at
+
+
+def read_quote(token, customer_id):
+    '''
+        Verify a token from sign_quote for `customer_id`; raises QuoteError.
+    '''
+    try:
+        payload = signing.loads(token, salt=QUOTE_SALT)
+    except signing.BadSignature:
+        raise QuoteError("Quote is invalid.")
+    if "n" not in payload:
+        raise QuoteError("Quote is invalid.")
+
+    if payload.get("c") != customer_id:
+        raise QuoteError("Quote was issued to another user.")
+
+    if payload.get("x", 0) < time.time():
+        raise QuoteError("Quote has expired. Please request a new one.")
+    return payload
@@ -0,0 +1,247 @@
+import bz2
+import gzip
+import heapq
+import json
+import math
+import re
+import xml.etree.ElementTree as ET
+from array import array
+from itertools import count
+
+
+EARTH_RADIUS_M = 6371008.8
+GRAPH_MAGIC = b'RGRAPH1\n'
+GRID_CELL_DEGREES = 0.01
+
+# Default speeds (km/h) for OSM highway types we route cars over.
+HIGHWAY_SPEEDS = {
+    'motorway': 90, 'motorway_link': 50,
+    'trunk': 70, 'trunk_link': 40,
+    'primary': 50, 'primary_link': 35,
+    'secondary': 40, 'secondary_link': 30,
+    'tertiary': 35, 'tertiary_link': 25,
+    'unclassified': 25, 'residential': 20,
+    'living_street': 10, 'service': 15, 'road': 20,
+}
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+class NoRouteFound(Exception):
+    pass
+
+
+class RoadGraph:
+    """
+        Compact directed road graph stored as flat arrays (CSR layout).
+
+        Edges leaving node `n` are `offsets[n]:offsets[n + 1]` in `targets`,
+        `lengths` (metres) and `times` (seconds). Node positions live in `lats`
+        and `lons`, and a coarse grid maps coordinates to nearby nodes so
+        arbitrary pickup/drop points can be snapped onto the network.
+    """
+    def __init__(self, lats, lons, offsets, targets, lengths, times):
+        self.lats = lats
+        self.lons = lons
+        self.offsets = offsets
+        self.targets = targets
+        self.lengths = lengths
+        self.times = times
+        self.max_speed = max((l / t for l, t in zip(lengths, times) if t > 0), default=1.0)
+        self._grid = {}
+        for node in range(len(lats)):
+            if offsets[node + 1] > offsets[node]:
+                self._grid.setdefault(self._cell(lats[node], lons[node]), []).append(node)
+
+    @property
+    def node_count(self):
+        return len(self.lats)
+
+    @property
+    def edge_count(self):
+        return len(self.targets)
+
+    @staticmethod
+    def _cell(lat, lon):
+        return (int(math.floor(lat / GRID_CELL_DEGREES)), int(math.floor(lon / GRID_CELL_DEGREES)))
+
+    @classmethod
+    def from_edges(cls, lats, lons, edges):
+        '''
+            Build a graph from `(source, target, length_m, time_s)` tuples.
+        '''
+        edges = sorted(edges)
+        # Fixed-width typecodes ('l' is 4 bytes on Windows, 8 elsewhere) so
+        # saved graphs read back the same on every platform.
+        offsets = array('q', [0] * (len(lats) + 1))
+        for source, _, _, _ in edges:
+            offsets[source + 1] += 1
+        for node in range(len(lats)):
+            offsets[node + 1] += offsets[node]
+        return cls(
+            array('d', lats), array('d', lons), offsets,
+            array('i', (edge[1] for edge in edges)),
+            array('f', (edge[2] for edge in edges)),
+            array('f', (edge[3] for edge in edges)),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as graph_file:
+            if graph_file.readline() != GRAPH_MAGIC:
+                raise ValueError(f"{path} is not a road graph file.")
+            header = json.loads(graph_file.readline())
+            arrays = {}
+            for name, typecode, length in header['arrays']:
+                values = array(typecode)
+                values.frombytes(graph_file.read(length * values.itemsize))
+                arrays[name] = values
+        return cls(**arrays)
+
+    def save(self, path):
+        names = ('lats', 'lons', 'offsets', 'targets', 'lengths', 'times')
+        header = {'arrays': [(name, getattr(self, name).typecode, len(getattr(self, name))) for name in names]}
+        with open(path, 'wb') as graph_file:
+            graph_file.write(GRAPH_MAGIC)
+            graph_file.write(json.dumps(header).encode() + b'\n')
+            for name in names:
+                getattr(self, name).tofile(graph_file)
+
+    @staticmethod
+    def _ring_distance(lat, lon, row, col, ring):
+        '''
+            Lower bound on the distance from (lat, lon), inside cell (row, col),
+            to any point in the cells `ring` steps away: the distance to the
+            nearest edge of the block of cells inside that ring.
+        '''
+        if ring == 0:
+            return 0.0
+        to_parallel = min(lat - (row - ring + 1) * GRID_CELL_DEGREES, (row + ring) * GRID_CELL_DEGREES - lat)
+        to_meridian = min(lon - (col - ring + 1) * GRID_CELL_DEGREES, (col + ring) * GRID_CELL_DEGREES - lon)
+        across_meridian = math.sin(math.radians(min(to_meridian, 90.0))) * math.cos(math.radians(lat))
+        return EARTH_RADIUS_M * min(math.radians(to_parallel), math.asin(min(1.0, across_meridian)))
+
+    def nearest_node(self, lat, lon, max_rings=5):
+        '''
+            Exact nearest node: rings of grid cells are scanned outwards
+            until no unscanned ring can hold anything closer. Gives up with
+            NoRouteFound if the first `max_rings` rings hold no node at all.
+        '''
+        row, col = self._cell(lat, lon)
+        best, best_distance = None, None
+        for ring in count():
+            if best is None and ring > max_rings:
+                break
+            if best is not None and self._ring_distance(lat, lon, row, col, ring) >= best_distance:
+                break
+            for r in range(row - ring, row + ring + 1):
+                for c in range(col - ring, col + ring + 1):
+                    if max(abs(r - row), abs(c - col)) != ring:
+                        continue
+                    for node in self._grid.get((r, c), ()):
+                        distance = haversine_m(lat, lon, self.lats[node], self.lons[node])
+                        if best_distance is None or distance < best_distance:
+                            best, best_distance = node, distance
+        if best is None:
+            raise NoRouteFound("No road found near the given location.")
+        return best, best_distance
+
+    def shortest_path(self, source, target):
+        '''
+            A* search for the fastest path; returns (length_m, time_s).
+        '''
+        if source == target:
+            return 0.0, 0.0
+
+        lats, lons = self.lats, self.lons
+        offsets, targets, lengths, times = self.offsets, self.targets, self.lengths, self.times
+        target_lat, target_lon = lats[target], lons[target]
+        max_speed = self.max_speed
+
+        best_time = {source: 0.0}
+        best_length = {source: 0.0}
+        heap = [(haversine_m(lats[source], lons[source], target_lat, target_lon) / max_speed, 0.0, source)]
+        settled = set()
+        while heap:
+            _, elapsed, node = heapq.heappop(heap)
+            if node == target:
+                return best_length[node], elapsed
+            if node in settled:
+                continue
+            settled.add(node)
+            for edge in range(offsets[node], offsets[node + 1]):
+                neighbour = targets[edge]
+                candidate = elapsed + times[edge]
+                if candidate < best_time.get(neighbour, math.inf):
+                    best_time[neighbour] = candidate
+                    best_length[neighbour] = best_length[node] + lengths[edge]
+                    estimate = haversine_m(lats[neighbour], lons[neighbour], target_lat, target_lon) / max_speed
+                    heapq.heappush(heap, (candidate + estimate, candidate, neighbour))
+        raise NoRouteFound("No route between the given locations.")
+
+
+def _parse_maxspeed(value, default):
+    match = re.match(r'\s*(\d+(?:\.\d+)?)\s*(mph)?', value or '')
+    if not match:
+        return default
+    speed = float(match.group(1))
+    return speed * 1.609 if match.group(2) else speed
+
+
+def _open_osm(path):
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rb')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def build_from_osm(path):
+    '''
+        Convert an OSM XML extract (.osm, .osm.bz2 or .osm.gz) into a RoadGraph
+        containing only the drivable highway network.
+    '''
+    coordinates = {}
+    ways = []
+    with _open_osm(path) as osm_file:
+        for _, element in ET.iterparse(osm_file, events=('end',)):
+            if element.tag == 'node':
+                coordinates[int(element.get('id'))] = (float(element.get('lat')), float(element.get('lon')))
+                element.clear()
+            elif element.tag == 'way':
+                tags = {tag.get('k'): tag.get('v') for tag in element.iter('tag')}
+                highway = tags.get('highway')
+                if highway in HIGHWAY_SPEEDS and tags.get('access') not in ('no', 'private'):
+                    refs = [int(nd.get('ref')) for nd in element.iter('nd')]
+                    speed = _parse_maxspeed(tags.get('maxspeed'), HIGHWAY_SPEEDS[highway])
+                    oneway = tags.get('oneway', 'yes' if highway.startswith('motorway') else 'no')
+                    ways.append((refs, speed, oneway))
+                element.clear()
+
+    index = {}
+    lats, lons, edges = [], [], []
+    def node_index(osm_id):
+        if osm_id not in index:
+            index[osm_id] = len(lats)
+            lat, lon = coordinates[osm_id]
+            lats.append(lat)
+            lons.append(lon)
+        return index[osm_id]
+
+    for refs, speed, oneway in ways:
+        refs = [ref for ref in refs if ref in coordinates]
+        if oneway == '-1':
+            refs.reverse()
+        metres_per_second = speed / 3.6
+        for start, end in zip(refs, refs[1:]):
+            source, target = node_index(start), node_index(end)
+            length = haversine_m(lats[source], lons[source], lats[target], lons[target])
+            edges.append((source, target, length, length / metres_per_second))
+            if oneway not in ('yes', 'true', '1', '-1'):
+                edges.append((target, source, length, length / metres_per_second))
+
+    return RoadGraph.from_edges(lats, lons, edges)
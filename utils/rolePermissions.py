@@ -0,0 +1,129 @@
+import threading
+import time
+import zlib
+from typing import NamedTuple
+
+from django.core.cache import caches
+
+from Uber import settings
+
+
+GENERATION_KEY = 'role_permissions:generation'
+
+
+
+class RoleGrant(NamedTuple):
+    name: str
+    permissions: frozenset
+    mask: int
+    version: int
+
+
+NO_GRANT = RoleGrant(None, frozenset(), 0, 0)
+
+
+def permission_bit(permission_id):
+    return 1 << permission_id
+
+
+class RolePermissions:
+    """
+        Role / RolePermission rows compiled into one RoleGrant per role.
+
+        `permissions` is a frozenset of permission names and `mask` the same
+        set as a bitmask of `permission_bit(permission.id)`. `version` is a
+        checksum of the role's name and permissions, so every worker derives
+        the same number for the same rows and it changes whenever they do.
+    """
+    def __init__(self, roles, links, generation=None):
+        names = dict(roles)
+        granted = {role_id: (set(), 0) for role_id in names}
+        self.bits = {}
+        for role_id, permission_id, permission_name in links:
+            permissions, mask = granted.get(role_id, (set(), 0))
+            permissions.add(permission_name)
+            granted[role_id] = (permissions, mask | permission_bit(permission_id))
+            self.bits[permission_name] = self.bits.get(permission_name, 0) | permission_bit(permission_id)
+
+        self.roles = {}
+        for role_id, (permissions, mask) in granted.items():
+            name = names.get(role_id)
+            version = zlib.crc32(f"{name}:{mask:x}".encode())
+            self.roles[role_id] = RoleGrant(name, frozenset(permissions), mask, version)
+        self.generation = generation
+        self.compiled_at = time.monotonic()
+
+    def grant(self, role_id):
+        return self.roles.get(role_id, NO_GRANT)
+
+    def has_permission(self, role_id, permission_name):
+        return permission_name in self.grant(role_id).permissions
+
+
+_registry = None
+_invalidations = 0
+_lock = threading.Lock()
+
+def _shared_cache():
+    alias = settings.ROLE_PERMISSIONS['SHARED_BACKEND']
+    return caches[alias] if alias else None
+
+
+def _shared_generation():
+    cache = _shared_cache()
+    return cache.get(GENERATION_KEY, 0) if cache is not None else None
+
+
+def rebuild_role_permissions():
+    '''
+        Compile every role's permissions (two queries) and swap the result in
+        as one reference assignment. A compile that raced an invalidation
+        is returned but not installed, since its rows may predate the edit.
+    '''
+    global _registry
+    from user.models import Role, RolePermission
+
+    with _lock:
+        invalidations = _invalidations
+    generation = _shared_generation()
+    roles = Role.objects.values_list('id', 'role_name')
+    links = RolePermission.permissions.through.objects.values_list(
+        'rolepermission__role_id', 'permission_id', 'permission__permission_name'
+    )
+    registry = RolePermissions(list(roles), list(links), generation)
+    with _lock:
+        if _invalidations == invalidations:
+            _registry = registry
+    return registry
+
+
+def get_role_permissions():
+    '''
+        Compiled registry for this worker. It is rebuilt after an
+        invalidation in this process, when another worker bumped the shared
+        generation (ROLE_PERMISSIONS['SHARED_BACKEND']) or after
+        ROLE_PERMISSIONS['REFRESH_INTERVAL'] seconds.
+    '''
+    registry = _registry
+    if (
+        registry is None
+        or time.monotonic() - registry.compiled_at > settings.ROLE_PERMISSIONS['REFRESH_INTERVAL']
+        or registry.generation != _shared_generation()
+    ):
+        registry = rebuild_role_permissions()
+    return registry
+
+
+def invalidate_role_permissions():
+    '''
+        Drop this worker's registry and bump the shared generation so the
+        other workers recompile on their next permission check.
+    '''
+    global _registry, _invalidations
+    with _lock:
+        _registry = None
+        _invalidations += 1
+    cache = _shared_cache()
+    if cache is not None:
+        cache.add(GENERATION_KEY, 0, None)
+        cache.incr(GENERATION_KEY)
@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+from Uber import settings
+
+
+
+class RouteCache:
+    """
+        LRU + TTL cache for road distance / duration lookups.
+
+        Pickup and drop coordinates are snapped to `precision` decimal places
+        (3 places is roughly 110 m) so riders requesting the same corridor share
+        one entry. When `shared_backend` names a CACHES alias, entries are also
+        written there so every worker benefits from a lookup made by any of them.
+        `clock` returns seconds and is only swapped out by tests.
+    """
+    def __init__(self, precision=3, max_entries=10000, ttl=900, shared_backend=None, clock=time.monotonic):
+        self.precision = precision
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared_backend = shared_backend
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "shared_hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+    def make_key(self, start_lat, start_lon, end_lat, end_lon):
+        try:
+            points = [round(float(value), self.precision) for value in (start_lat, start_lon, end_lat, end_lon)]
+        except (TypeError, ValueError):
+            return None
+        return "route:{}:{}:{}:{}:{}".format(self.precision, *points)
+
+    def get(self, key):
+        value = self._get_local(key)
+        if value is not None:
+            return value
+        if self.shared_backend:
+            return self._shared_result(key, caches[self.shared_backend].get(key))
+        return self._miss()
+
+    async def aget(self, key):
+        value = self._get_local(key)
+        if value is not None:
+            return value
+        if self.shared_backend:
+            return self._shared_result(key, await caches[self.shared_backend].aget(key))
+        return self._miss()
+
+    def set(self, key, value):
+        self._store(key, value, self.clock())
+        if self.shared_backend:
+            caches[self.shared_backend].set(key, value, self.ttl)
+
+    async def aset(self, key, value):
+        self._store(key, value, self.clock())
+        if self.shared_backend:
+            await caches[self.shared_backend].aset(key, value, self.ttl)
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at > self.clock():
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return value
+            del self._entries[key]
+            self._stats["expired"] += 1
+        return None
+
+    def _shared_result(self, key, value):
+        if value is None:
+            return self._miss()
+        value = tuple(value)
+        self._store(key, value, self.clock())
+        with self._lock:
+            self._stats["shared_hits"] += 1
+        return value
+
+    def _miss(self):
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def _store(self, key, value, now):
+        with self._lock:
+            self._entries[key] = (value, now + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["shared_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["hits"] + stats["shared_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+
+route_cache = RouteCache(
+    precision=settings.ROUTE_CACHE['PRECISION'],
+    max_entries=settings.ROUTE_CACHE['MAX_ENTRIES'],
+    ttl=settings.ROUTE_CACHE['TTL'],
+    shared_backend=settings.ROUTE_CACHE['SHARED_BACKEND'],
+)
@@ -0,0 +1,298 @@
+import asyncio
+import random
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+
+from utils.roadGraph import RoadGraph, NoRouteFound, haversine_m
+from Uber import settings
+
+
+
+class RoutingError(Exception):
+    pass
+
+
+class RoutingBackend:
+    """
+        Base class for road routing sources.
+
+        `route` returns `(distance_in_km, duration_in_minutes)` for the fastest
+        road route between two points; `aroute` is the awaitable form for
+        async views. `route_many` answers a list of
+        `(start_lat, start_lon, end_lat, end_lon)` pairs, with None for pairs
+        that have no route.
+    """
+    def route(self, start_lat, start_lon, end_lat, end_lon):
+        raise NotImplementedError
+
+    async def aroute(self, start_lat, start_lon, end_lat, end_lon):
+        # Backends without a native async client run in a worker thread.
+        return await sync_to_async(self.route, thread_sensitive=False)(start_lat, start_lon, end_lat, end_lon)
+
+    def route_many(self, pairs):
+        results = []
+        for pair in pairs:
+            try:
+                results.append(self.route(*pair))
+            except RoutingError:
+                results.append(None)
+        return results
+
+
+class OpenRouteServiceBackend(RoutingBackend):
+    """
+        Directions from the OpenRouteService HTTP API.
+
+        Both the sync and the async path keep a pooled keep-alive connection,
+        apply strict connect / read timeouts and retry connection errors,
+        timeouts and 429 / 5xx answers with exponential backoff and full jitter.
+    """
+    url = 'https://api.openrouteservice.org/v2/directions/driving-car'
+    matrix_url = 'https://api.openrouteservice.org/v2/matrix/driving-car'
+    # Drops per matrix request, well under the ORS cap of 3500 cells.
+    matrix_chunk_size = 50
+
+    def __init__(self, api_key, connect_timeout=2.0, read_timeout=5.0, retries=2, backoff=0.25, pool_size=20):
+        self.api_key = api_key
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self._session = None
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    @property
+    def headers(self):
+        return {
+            'Authorization': self.api_key,
+            'Content-Type': 'application/json'
+        }
+
+    def _retry_delay(self, attempt):
+        return random.uniform(0, self.backoff * (2 ** attempt))
+
+    @staticmethod
+    def _should_retry(status_code):
+        return status_code == 429 or status_code >= 500
+
+    @staticmethod
+    def _decode(response):
+        # Gateways in front of ORS answer errors with HTML.
+        try:
+            return response.json()
+        except ValueError as e:
+            raise RoutingError(f"OpenRouteService answered {response.status_code} without JSON") from e
+
+    @property
+    def session(self):
+        if self._session is None:
+            session = requests.Session()
+            session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size))
+            session.headers.update(self.headers)
+            self._session = session
+        return self._session
+
+    def _post(self, url, body):
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.post(url, json=body, timeout=(self.connect_timeout, self.read_timeout))
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.retries:
+                    raise RoutingError(f"OpenRouteService unreachable: {e}") from e
+            else:
+                if not self._should_retry(response.status_code) or attempt == self.retries:
+                    return self._decode(response)
+            time.sleep(self._retry_delay(attempt))
+
+    def _async_client(self):
+        # httpx clients are bound to the event loop that created them.
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                headers=self.headers,
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            )
+            self._async_clients[loop] = client
+        return client
+
+    async def _apost(self, url, body):
+        client = self._async_client()
+        for attempt in range(self.retries + 1):
+            try:
+                response = await client.post(url, json=body)
+            except httpx.TransportError as e:
+                if attempt == self.retries:
+                    raise RoutingError(f"OpenRouteService unreachable: {e}") from e
+            else:
+                if not self._should_retry(response.status_code) or attempt == self.retries:
+                    return self._decode(response)
+            await asyncio.sleep(self._retry_delay(attempt))
+
+    @staticmethod
+    def _route_body(start_lat, start_lon, end_lat, end_lon):
+        return {
+            "coordinates": [
+                [start_lon, start_lat],   # longitude first, then latitude
+                [end_lon, end_lat]
+            ]
+        }
+
+    @staticmethod
+    def _parse_route(data):
+        try:
+            distance_in_meters = data['routes'][0]['summary']['distance']
+            duration_in_seconds = data['routes'][0]['summary']['duration']
+        except (KeyError, IndexError) as e:
+            raise RoutingError(f"OpenRouteService returned no route: {data}") from e
+
+        distance_in_km = round(distance_in_meters / 1000, 2)
+        duration_in_minutes = round(duration_in_seconds / 60, 1)
+        return distance_in_km, duration_in_minutes
+
+    def route(self, start_lat, start_lon, end_lat, end_lon):
+        return self._parse_route(self._post(self.url, self._route_body(start_lat, start_lon, end_lat, end_lon)))
+
+    async def aroute(self, start_lat, start_lon, end_lat, end_lon):
+        return self._parse_route(await self._apost(self.url, self._route_body(start_lat, start_lon, end_lat, end_lon)))
+
+    def route_many(self, pairs):
+        '''
+            One matrix request per pickup point (and chunk of its drops). The
+            pickup is the only source, so every cell requested is a pair that
+            was asked for; repeated drops are requested once.
+        '''
+        results = [None] * len(pairs)
+        by_pickup = {}
+        for position, (start_lat, start_lon, end_lat, end_lon) in enumerate(pairs):
+            by_pickup.setdefault((start_lat, start_lon), {}).setdefault((end_lat, end_lon), []).append(position)
+
+        for (start_lat, start_lon), drops in by_pickup.items():
+            drops = list(drops.items())
+            for index in range(0, len(drops), self.matrix_chunk_size):
+                chunk = drops[index:index + self.matrix_chunk_size]
+                body = {
+                    "locations": [[start_lon, start_lat]] + [[end_lon, end_lat] for (end_lat, end_lon), _ in chunk],
+                    "sources": [0],
+                    "destinations": list(range(1, len(chunk) + 1)),
+                    "metrics": ["distance", "duration"],
+                }
+                data = self._post(self.matrix_url, body)
+                if 'distances' not in data or 'durations' not in data:
+                    raise RoutingError(f"OpenRouteService returned no matrix: {data}")
+
+                for column, (_, positions) in enumerate(chunk):
+                    distance_in_meters = data['distances'][0][column]
+                    duration_in_seconds = data['durations'][0][column]
+                    if distance_in_meters is None or duration_in_seconds is None:
+                        continue
+                    route = (round(distance_in_meters / 1000, 2), round(duration_in_seconds / 60, 1))
+                    for position in positions:
+                        results[position] = route
+        return results
+
+
+class LocalGraphBackend(RoutingBackend):
+    """
+        In-process routing over a road graph built with `manage.py build_road_graph`.
+
+        Pickup and drop are snapped to the nearest road node; the legs from the
+        points to those nodes are added at `access_speed` km/h.
+    """
+    def __init__(self, graph_path, access_speed=20):
+        self.graph_path = graph_path
+        self.access_speed = access_speed
+        self._graph = None
+        self._lock = threading.Lock()
+
+    @property
+    def graph(self):
+        if self._graph is None:
+            with self._lock:
+                if self._graph is None:
+                    self._graph = RoadGraph.load(self.graph_path)
+        return self._graph
+
+    def route(self, start_lat, start_lon, end_lat, end_lon):
+        graph = self.graph
+        try:
+            start_lat, start_lon, end_lat, end_lon = map(float, (start_lat, start_lon, end_lat, end_lon))
+            source, source_access = graph.nearest_node(start_lat, start_lon)
+            target, target_access = graph.nearest_node(end_lat, end_lon)
+            length, seconds = graph.shortest_path(source, target)
+        except (TypeError, ValueError, NoRouteFound) as e:
+            raise RoutingError(str(e)) from e
+
+        access = source_access + target_access
+        if source == target:
+            access = haversine_m(start_lat, start_lon, end_lat, end_lon)
+        length += access
+        seconds += access / (self.access_speed / 3.6)
+
+        distance_in_km = round(length / 1000, 2)
+        duration_in_minutes = round(seconds / 60, 1)
+        return distance_in_km, duration_in_minutes
+
+
+class StubRoutingBackend(RoutingBackend):
+    """
+        Offline stand-in for load tests and local development: straight line
+        distance times `detour` at a constant `speed` km/h, answered after
+        `latency` seconds to mimic a remote routing service.
+    """
+    def __init__(self, detour=1.3, speed=25, latency=0.0):
+        self.detour = detour
+        self.speed = speed
+        self.latency = latency
+
+    def _route(self, start_lat, start_lon, end_lat, end_lon):
+        try:
+            length = haversine_m(float(start_lat), float(start_lon), float(end_lat), float(end_lon)) * self.detour
+        except (TypeError, ValueError) as e:
+            raise RoutingError(str(e)) from e
+        return round(length / 1000, 2), round(length / 1000 / self.speed * 60, 1)
+
+    def route(self, start_lat, start_lon, end_lat, end_lon):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._route(start_lat, start_lon, end_lat, end_lon)
+
+    async def aroute(self, start_lat, start_lon, end_lat, end_lon):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._route(start_lat, start_lon, end_lat, end_lon)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_routing_backend():
+    '''
+        Return the process-wide backend configured in settings.ROUTING.
+    '''
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                backend_class = import_string(settings.ROUTING['BACKEND'])
+                _backend = backend_class(**settings.ROUTING.get('OPTIONS', {}))
+    return _backend
+
+
+def set_routing_backend(backend):
+    '''
+        Swap the process-wide backend (load tests); returns the previous one.
+    '''
+    global _backend
+    with _backend_lock:
+        previous, _backend = _backend, backend
+    return previous
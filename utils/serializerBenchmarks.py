@@ -0,0 +1,204 @@
+import gc
+import statistics
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connections
+from django.utils import timezone
+
+from user.models import User, Trip, DriverRequest, DocumentRequired, DocumentType as DriverDocumentType
+from user.serializers.tripSerializers import TripSerializer
+from user.serializers.driverDetailsSerializers import DriverTripPendingSerializer, DriverPersonalDetailsViewSerializer
+from vehicle.models import VehicleRequest, DocumentType as VehicleDocumentType
+from vehicle.serializers.vehicleSerializers import VehicleDetailsSerializer, AdminVehicleStatusListSerailzier
+
+
+BENCHMARKS = {}
+
+
+
+def benchmark(name, serializer_class):
+    '''
+        Register a factory `(count) -> instances` for `serializer_class`.
+    '''
+    def decorator(factory):
+        BENCHMARKS[name] = (serializer_class, factory)
+        return factory
+    return decorator
+
+
+def prefetched(instance, name, objects):
+    '''
+        Fill the prefetch cache of a many-to-many so it serializes without a query.
+    '''
+    queryset = getattr(instance, name).model.objects.all()
+    queryset._result_cache = list(objects)
+    queryset._prefetch_done = True
+    instance.__dict__.setdefault('_prefetched_objects_cache', {})[name] = queryset
+    return instance
+
+
+def _user(index, user_type='customer'):
+    return User(id=index + 1, first_name=f'First{index}', last_name=f'Last{index}', mobile_number=f'+9190{index:08d}',
+                user_type=user_type, profile_pic=f'profile_pics/{index}.jpg')
+
+
+def _trip(index, now):
+    return Trip(
+        id=index + 1, customer=_user(index), vehicle_type='2 Wheeler', pickup_location=f'Pickup street {index}',
+        drop_location=f'Drop street {index}', pickup_location_latitude=Decimal('23.0225000000000000'),
+        pickup_location_longitude=Decimal('72.5714000000000000'), drop_location_latitude=Decimal('23.1000000000000000'),
+        drop_location_longitude=Decimal('72.6000000000000000'), distance=Decimal('12.40'), estimated_time=Decimal('27.00'),
+        fare=Decimal('91.80'), created_at=now - timedelta(minutes=index % 15),
+    )
+
+
+@benchmark('TripSerializer', TripSerializer)
+def trips(count):
+    now = timezone.now()
+    return [_trip(index, now) for index in range(count)]
+
+
+@benchmark('DriverTripPendingSerializer', DriverTripPendingSerializer)
+def pending_trips(count):
+    now = timezone.now()
+    instances = []
+    for index in range(count):
+        trip = _trip(index, now)
+        trip.pickup_distance = 150.0 + index
+        instances.append(trip)
+    return instances
+
+
+@benchmark('DriverPersonalDetailsViewSerializer', DriverPersonalDetailsViewSerializer)
+def driver_requests(count):
+    now = timezone.now()
+    document_type = DriverDocumentType(id=1, document_label='Aadhar card')
+    verifier = _user(10 ** 6, user_type='admin')
+    instances = []
+    for index in range(count):
+        documents = [
+            DocumentRequired(id=index * 3 + position + 1, document_name=document_type, document_text=f'{index:012d}',
+                             document_image=f'aadhar_photos/{index}_{position}.jpg')
+            for position in range(3)
+        ]
+        request = DriverRequest(id=index + 1, user=_user(index, user_type='driver'), action_by=verifier, dob=now.date(),
+                                status='approved', created_at=now, action_at=now)
+        instances.append(prefetched(request, 'verification_documents', documents))
+    return instances
+
+
+@benchmark('VehicleDetailsSerializer', VehicleDetailsSerializer)
+def vehicle_requests(count):
+    now = timezone.now()
+    verifier = _user(10 ** 6, user_type='admin')
+    instances = []
+    for index in range(count):
+        documents = [
+            VehicleDocumentType(id=index * 6 + position + 1, document_type=document_type,
+                                document_image=f'vehicle_images/{index}_{position}.jpg')
+            for position, document_type in enumerate((
+                'vehicle_front_image', 'vehicle_back_image', 'vehicle_leftSide_image',
+                'vehicle_rightSide_image', 'vehicle_rc_front_image', 'vehicle_rc_back_image',
+            ))
+        ]
+        request = VehicleRequest(id=index + 1, action_by=verifier, vehicle_number=f'GJ01AB{index % 10000:04d}',
+                                 vehicle_type='4 Wheeler', vehicle_chassis_number=f'CH{index:015d}',
+                                 vehicle_engine_number=f'EN{index:015d}', status='approved', action_at=now)
+        instances.append(prefetched(request, 'verification_documents', documents))
+    return instances
+
+
+@benchmark('AdminVehicleStatusListSerailzier', AdminVehicleStatusListSerailzier)
+def vehicle_status_rows(count):
+    now = timezone.now()
+    instances = []
+    for index in range(count):
+        request = VehicleRequest(id=index + 1, vehicle_number=f'GJ01AB{index % 10000:04d}', vehicle_type='2 Wheeler',
+                                 status='pending', created_at=now)
+        request.name = f'First{index} Last{index}'
+        instances.append(request)
+    return instances
+
+
+@contextmanager
+def no_queries():
+    '''
+        Fail loudly if a serializer reaches for the database, which would
+        turn the benchmark into a query benchmark.
+    '''
+    def blocker(execute, sql, params, many, context):
+        raise AssertionError(f"Serializer benchmark ran a query: {sql}")
+
+    with connections['default'].execute_wrapper(blocker):
+        yield
+
+
+def run_benchmark(name, count=1000, repeat=5):
+    '''
+        Serialize `count` synthetic instances `repeat` times. Returns objects
+        per second (median run), microseconds per object and the peak / net
+        traced allocation per object in bytes (from a separate traced run, so
+        tracemalloc overhead stays out of the timings).
+    '''
+    serializer_class, factory = BENCHMARKS[name]
+    instances = factory(count)
+    with no_queries():
+        serializer_class(instances[:10], many=True).data  # warm up field construction and caches
+
+        timings = []
+        for _ in range(repeat):
+            gc.collect()
+            started = time.perf_counter()
+            serializer_class(instances, many=True).data
+            timings.append(time.perf_counter() - started)
+
+        gc.collect()
+        tracemalloc.start()
+        try:
+            before, _ = tracemalloc.get_traced_memory()
+            data = serializer_class(instances, many=True).data
+            after, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        del data
+
+    elapsed = statistics.median(timings)
+    return {
+        'count': count,
+        'objects_per_second': round(count / elapsed),
+        'microseconds_per_object': round(elapsed / count * 1e6, 2),
+        'peak_bytes_per_object': round((peak - before) / count),
+        'retained_bytes_per_object': round((after - before) / count),
+    }
+
+
+def compare(results, baselines, time_tolerance=0.25, memory_tolerance=0.10):
+    '''
+        [(name, metric, baseline, current)] for results worse than their
+        baseline by more than the tolerance. Per-object figures depend on
+        the instance count, so a baseline recorded at another count raises
+        ValueError instead of being compared.
+    '''
+    mismatched = [
+        f"{name} (baseline {baselines[name].get('count')}, run {result['count']})"
+        for name, result in results.items()
+        if name in baselines and baselines[name].get('count') != result['count']
+    ]
+    if mismatched:
+        raise ValueError(f"Baselines were recorded with another --count: {', '.join(mismatched)}")
+
+    regressions = []
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            continue
+        if result['microseconds_per_object'] > baseline['microseconds_per_object'] * (1 + time_tolerance):
+            regressions.append((name, 'microseconds_per_object', baseline['microseconds_per_object'], result['microseconds_per_object']))
+        for metric in ('peak_bytes_per_object', 'retained_bytes_per_object'):
+            if result[metric] > baseline[metric] * (1 + memory_tolerance):
+                regressions.append((name, metric, baseline[metric], result[metric]))
+    return regressions
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import threading
+import time
+
+from utils import geohash
+from utils.driverIndex import driver_index
+from Uber import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+
+class SlidingCounter:
+    """
+        Per-key event counts over the last `window` seconds, kept in
+        `window / bucket` ring buckets so adding and totalling are O(buckets)
+        with no per-event storage.
+    """
+    def __init__(self, window=300, bucket=10):
+        self.bucket = bucket
+        self.size = max(1, int(window // bucket))
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, key, now=None, amount=1):
+        slot = int((now if now is not None else time.monotonic()) // self.bucket)
+        with self._lock:
+            entry = self._counts.get(key)
+            if entry is None:
+                entry = self._counts[key] = ([0] * self.size, [0] * self.size)
+            counts, stamps = entry
+            index = slot % self.size
+            if stamps[index] != slot:
+                stamps[index], counts[index] = slot, 0
+            counts[index] += amount
+
+    def totals(self, now=None):
+        '''
+            {key: count in window}; keys with nothing left are dropped.
+        '''
+        oldest = int((now if now is not None else time.monotonic()) // self.bucket) - self.size + 1
+        result = {}
+        with self._lock:
+            for key, (counts, stamps) in list(self._counts.items()):
+                total = sum(count for count, stamp in zip(counts, stamps) if stamp >= oldest)
+                if total:
+                    result[key] = total
+                else:
+                    del self._counts[key]
+        return result
+
+
+class SurgeEngine:
+    """
+        Zone surge multipliers from live demand and supply.
+
+        Quote requests and bookings are counted per geohash zone in sliding
+        windows; idle supply is the drivers in the live driver index that are
+        not on a trip. Every `interval` seconds a background task recomputes
+
+            target = 1 + sensitivity * (demand / max(idle, 1) - threshold)
+
+        per zone, clamps it to [1, max_multiplier], smooths it against the
+        previous value and publishes a new {zone: multiplier} dict, so
+        `multiplier()` is a geohash encode plus a dict lookup.
+    """
+    def __init__(self, precision=5, window=300, bucket=10, interval=5, quote_weight=1.0, booking_weight=3.0,
+                 threshold=1.0, sensitivity=0.25, max_multiplier=3.0, smoothing=0.5, busy_ttl=7200):
+        self.precision = precision
+        self.interval = interval
+        self.quote_weight = quote_weight
+        self.booking_weight = booking_weight
+        self.threshold = threshold
+        self.sensitivity = sensitivity
+        self.max_multiplier = max_multiplier
+        self.smoothing = smoothing
+        self.busy_ttl = busy_ttl
+        self.quotes = SlidingCounter(window, bucket)
+        self.bookings = SlidingCounter(window, bucket)
+        self.multipliers = {}
+        self._busy = {}
+        self._tasks = {}
+
+    def zone(self, latitude, longitude):
+        return geohash.encode(float(latitude), float(longitude), self.precision)
+
+    def multiplier(self, latitude, longitude):
+        return self.multipliers.get(self.zone(latitude, longitude), 1.0)
+
+    def record_quote(self, latitude, longitude):
+        self.quotes.add(self.zone(latitude, longitude))
+
+    def record_booking(self, latitude, longitude):
+        self.bookings.add(self.zone(latitude, longitude))
+
+    def driver_busy(self, driver_id):
+        self._busy[driver_id] = time.monotonic() + self.busy_ttl
+
+    def driver_free(self, driver_id):
+        self._busy.pop(driver_id, None)
+
+    def idle_supply(self, now=None):
+        now = now if now is not None else time.monotonic()
+        for driver_id, until in list(self._busy.items()):
+            if until <= now:
+                self._busy.pop(driver_id, None)
+        supply = {}
+        for driver_id, latitude, longitude in driver_index.snapshot():
+            if driver_id not in self._busy:
+                zone = self.zone(latitude, longitude)
+                supply[zone] = supply.get(zone, 0) + 1
+        return supply
+
+    def recompute(self, now=None):
+        '''
+            Publish fresh multipliers; zones back at 1.0 are left out.
+        '''
+        now = now if now is not None else time.monotonic()
+        demand = {}
+        for zone, count in self.quotes.totals(now).items():
+            demand[zone] = demand.get(zone, 0) + self.quote_weight * count
+        for zone, count in self.bookings.totals(now).items():
+            demand[zone] = demand.get(zone, 0) + self.booking_weight * count
+        supply = self.idle_supply(now)
+
+        previous, multipliers = self.multipliers, {}
+        for zone in demand.keys() | previous.keys():
+            ratio = demand.get(zone, 0) / max(supply.get(zone, 0), 1)
+            target = min(max(1 + self.sensitivity * (ratio - self.threshold), 1.0), self.max_multiplier)
+            value = round(self.smoothing * previous.get(zone, 1.0) + (1 - self.smoothing) * target, 1)
+            if value > 1.0:
+                multipliers[zone] = value
+        self.multipliers = multipliers
+        return multipliers
+
+    def start(self):
+        '''
+            Run the recompute loop on the current event loop (once per loop).
+        '''
+        loop = asyncio.get_running_loop()
+        task = self._tasks.get(loop)
+        if task is None or task.done():
+            self._tasks[loop] = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.recompute()
+            except Exception:
+                logger.exception("Surge recompute failed")
+
+
+surge_engine = SurgeEngine(
+    precision=settings.SURGE['ZONE_PRECISION'],
+    window=settings.SURGE['WINDOW'],
+    bucket=settings.SURGE['BUCKET'],
+    interval=settings.SURGE['INTERVAL'],
+    quote_weight=settings.SURGE['QUOTE_WEIGHT'],
+    booking_weight=settings.SURGE['BOOKING_WEIGHT'],
+    threshold=settings.SURGE['THRESHOLD'],
+    sensitivity=settings.SURGE['SENSITIVITY'],
+    max_multiplier=settings.SURGE['MAX_MULTIPLIER'],
+    smoothing=settings.SURGE['SMOOTHING'],
+)
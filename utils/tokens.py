@@ -0,0 +1,161 @@
+import time
+
+from django.core.cache import caches
+from django.db import router
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from utils.rolePermissions import get_role_permissions
+from Uber import settings
+
+
+USER_TYPE_CLAIM = 'user_type'
+ROLE_ID_CLAIM = 'role_id'
+PERMISSIONS_CLAIM = 'perms'
+ROLE_VERSION_CLAIM = 'role_version'
+USER_VERSION_CLAIM = 'user_version'
+
+
+
+def _user_versions():
+    return caches[settings.ROLE_PERMISSIONS['SHARED_BACKEND'] or 'default']
+
+
+def user_version(user_id):
+    '''
+        Current token version of a user; 0 until their access first changes.
+    '''
+    return _user_versions().get(f'token_user:{user_id}', 0)
+
+
+def revoke_user_tokens(user_id):
+    '''
+        Give the user a fresh token version, so every token stamped with an
+        older one is rejected until refreshed. The key outlives any access
+        token issued before it, so its expiry can't revive one.
+    '''
+    timeout = api_settings.ACCESS_TOKEN_LIFETIME.total_seconds()
+    _user_versions().set(f'token_user:{user_id}', time.time_ns(), timeout)
+
+
+def permission_claims(user_id, user_type, role_id):
+    '''
+        Claims stamped on every token: the user type, the role, the role's
+        permission bitmask and the version it was read at, and the user's
+        token version.
+    '''
+    grant = get_role_permissions().grant(role_id)
+    return {
+        USER_TYPE_CLAIM: user_type,
+        ROLE_ID_CLAIM: role_id,
+        PERMISSIONS_CLAIM: grant.mask,
+        ROLE_VERSION_CLAIM: grant.version,
+        USER_VERSION_CLAIM: user_version(user_id),
+    }
+
+
+class PermissionRefreshToken(RefreshToken):
+    """
+        RefreshToken carrying the permission claims; `access_token` copies
+        them, so both tokens of a pair agree.
+    """
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token.stamp(user.id, user.user_type, user.role_id)
+        return token
+
+    def stamp(self, user_id, user_type, role_id):
+        for claim, value in permission_claims(user_id, user_type, role_id).items():
+            self[claim] = value
+
+
+class PermissionTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = PermissionRefreshToken
+
+
+class PermissionTokenRefreshSerializer(TokenRefreshSerializer):
+    '''
+        Re-stamps the claims from the user's current role, so refreshing
+        is how a client recovers from a stale token.
+    '''
+    token_class = PermissionRefreshToken
+
+    def validate(self, attrs):
+        from user.models import User
+
+        refresh = self.token_class(attrs['refresh'])
+        user = User.objects.filter(**{api_settings.USER_ID_FIELD: refresh.get(api_settings.USER_ID_CLAIM)}).only('user_type', 'role_id').first()
+        if user is not None:
+            refresh.stamp(user.id, user.user_type, user.role_id)
+        return super().validate({**attrs, 'refresh': str(refresh)})
+
+
+class TokenUserAuthentication(JWTAuthentication):
+    """
+        JWTAuthentication without the User query per request.
+
+        `request.user` is a TokenUser with id, user_type and role_id taken
+        from the claims; the rest of the row is fetched only if a view
+        reads another field. The claims are trusted while the token's user
+        version is current: changing a user's type, role or active flag, or
+        deleting them, revokes it (user/signals/CustomUserSignal.py), which
+        costs one cache read per request instead of a row read. Tokens
+        without the claims read the authorization columns from the row.
+    """
+    fields = ('id', 'user_type', 'role_id', 'is_active')
+
+    def get_user(self, validated_token):
+        from user.models import TokenUser
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+
+        if all(claim in validated_token for claim in (USER_TYPE_CLAIM, ROLE_ID_CLAIM, USER_VERSION_CLAIM)):
+            if validated_token[USER_VERSION_CLAIM] != user_version(user_id):
+                raise InvalidToken("User's access changed since this token was issued, refresh it.")
+            return TokenUser.from_db(
+                router.db_for_read(TokenUser),
+                [api_settings.USER_ID_FIELD, 'user_type', 'role_id'],
+                [user_id, validated_token[USER_TYPE_CLAIM], validated_token[ROLE_ID_CLAIM]],
+            )
+
+        user = TokenUser.objects.only(*self.fields).filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+        if user is None:
+            raise AuthenticationFailed("User not found", code="user_not_found")
+        if not user.is_active:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+        return user
+
+
+def request_grant(request):
+    '''
+        (registry, RoleGrant) for the request's user. Raises InvalidToken
+        when the token's permission claims were issued for another role or
+        an older version of it.
+    '''
+    registry = get_role_permissions()
+    role_id = request.user.role_id
+    grant = registry.grant(role_id)
+    token = request.auth
+    if token is not None and ROLE_VERSION_CLAIM in token:
+        if token.get(ROLE_ID_CLAIM) != role_id or token[ROLE_VERSION_CLAIM] != grant.version:
+            raise InvalidToken("Role permissions changed since this token was issued, refresh it.")
+    return registry, grant
+
+
+def request_has_permission(request, permission_name):
+    '''
+        Answered from the token's bitmask when it carries one, otherwise
+        from the registry.
+    '''
+    registry, grant = request_grant(request)
+    token = request.auth
+    mask = token[PERMISSIONS_CLAIM] if token is not None and PERMISSIONS_CLAIM in token else grant.mask
+    return bool(mask & registry.bits.get(permission_name, 0))
@@ -0,0 +1,109 @@
+from datetime import date
+
+from django.db import connection
+
+
+TABLE = 'user_trip'
+DEFAULT_PARTITION = 'user_trip_default'
+ARCHIVE_TABLE = 'user_trip_archive'
+
+
+
+def add_months(month, count):
+    years, month_index = divmod(month.month - 1 + count, 12)
+    return date(month.year + years, month_index + 1, 1)
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month:%Y_%m}'
+
+
+def month_bound(month):
+    return f"'{month.isoformat()} 00:00:00+00'"
+
+
+def is_partitioned(cursor):
+    cursor.execute(
+        "SELECT 1 FROM pg_partitioned_table JOIN pg_class ON pg_class.oid = pg_partitioned_table.partrelid WHERE pg_class.relname = %s",
+        [TABLE],
+    )
+    return cursor.fetchone() is not None
+
+
+def monthly_partitions(cursor):
+    '''
+        {month: partition name} of the attached monthly partitions.
+    '''
+    cursor.execute(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = %s",
+        [TABLE],
+    )
+    partitions = {}
+    prefix = f'{TABLE}_p'
+    for (name,) in cursor.fetchall():
+        if name.startswith(prefix):
+            year, month = name[len(prefix):].split('_')
+            partitions[date(int(year), int(month), 1)] = name
+    return partitions
+
+
+def columns(cursor, table):
+    cursor.execute(
+        "SELECT attname, format_type(atttypid, atttypmod) FROM pg_attribute "
+        "WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped ORDER BY attnum",
+        [table],
+    )
+    return cursor.fetchall()
+
+
+def create_partition(cursor, month):
+    '''
+        Attach the partition for `month`. Rows for that month that already
+        landed in the default partition are moved into it first, otherwise
+        the ATTACH would be rejected.
+    '''
+    name, start, end = partition_name(month), month_bound(month), month_bound(add_months(month, 1))
+    quote = connection.ops.quote_name
+    cursor.execute(f"CREATE TABLE {quote(name)} (LIKE {quote(TABLE)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    cursor.execute(
+        f"WITH moved AS (DELETE FROM {quote(DEFAULT_PARTITION)} WHERE created_at >= {start} AND created_at < {end} RETURNING *) "
+        f"INSERT INTO {quote(name)} SELECT * FROM moved"
+    )
+    cursor.execute(f"ALTER TABLE {quote(TABLE)} ATTACH PARTITION {quote(name)} FOR VALUES FROM ({start}) TO ({end})")
+    return name
+
+
+def sync_archive_columns(cursor):
+    '''
+        Add columns that Trip gained since the archive table was created.
+    '''
+    quote = connection.ops.quote_name
+    archived = {name for name, type in columns(cursor, ARCHIVE_TABLE)}
+    for name, type in columns(cursor, TABLE):
+        if name not in archived:
+            cursor.execute(f"ALTER TABLE {quote(ARCHIVE_TABLE)} ADD COLUMN {quote(name)} {type}")
+
+
+def archive_partition(cursor, name, statuses):
+    '''
+        Move trips in `statuses` out of partition `name` into the archive in
+        one statement. A partition left empty is detached and dropped.
+        Returns (rows moved, dropped).
+    '''
+    quote = connection.ops.quote_name
+    names = ', '.join(quote(column) for column, type in columns(cursor, TABLE))
+    cursor.execute(
+        f"WITH moved AS (DELETE FROM {quote(name)} WHERE status = ANY(%s) RETURNING {names}) "
+        f"INSERT INTO {quote(ARCHIVE_TABLE)} ({names}) SELECT {names} FROM moved",
+        [list(statuses)],
+    )
+    moved = cursor.rowcount
+    cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {quote(name)})")
+    if cursor.fetchone()[0]:
+        return moved, False
+    cursor.execute(f"ALTER TABLE {quote(TABLE)} DETACH PARTITION {quote(name)}")
+    cursor.execute(f"DROP TABLE {quote(name)}")
+    return moved, True
@@ -0,0 +1,60 @@
+from django.db import transaction
+from django.db.models import Case, Exists, Q, Value, When
+from django.utils import timezone
+
+from user.models import Trip, TripStatus, TRIP_TRANSITIONS, User
+
+
+
+def transition_trip(trip_id, action, scope=None, **changes):
+    '''
+        Move a trip along TRIP_TRANSITIONS with a single conditional UPDATE.
+
+        The row only changes if it is still in one of the allowed source
+        statuses (and matches `scope`), so concurrent callers cannot both
+        win and nobody waits on a row lock held across a read. Returns True
+        when this call made the transition.
+    '''
+    sources, target = TRIP_TRANSITIONS[action]
+    queryset = Trip.objects.filter(id=trip_id, status__in=sources)
+    if scope is not None:
+        queryset = queryset.filter(scope)
+    return queryset.update(status=target, updated_at=timezone.now(), **changes) == 1
+
+
+def accept_trip(trip_id, driver_id, vehicle_id, vehicle_type):
+    '''
+        First driver of the right vehicle type without an active trip wins.
+
+        The driver's User row is locked first so two accepts by the same
+        driver run one after the other and the second sees the first trip.
+        A partial unique index on (driver) would not work here: Trip is
+        partitioned by created_at and unique indexes must include it.
+    '''
+    scope = Q(driver__isnull=True, vehicle_type__iexact=vehicle_type) & ~Exists(
+        Trip.objects.filter(driver_id=driver_id, status__in=[TripStatus.ACCEPTED, TripStatus.ON_GOING])
+    )
+    with transaction.atomic(savepoint=False):
+        list(User.objects.select_for_update().filter(id=driver_id).values_list('id', flat=True))
+        return transition_trip(trip_id, 'accept', scope, driver_id=driver_id, vehicle_id_id=vehicle_id)
+
+
+def start_trip(trip_id, driver_id):
+    return transition_trip(trip_id, 'start', Q(driver_id=driver_id), pickup_time=timezone.now())
+
+
+def complete_trip(trip_id, driver_id):
+    return transition_trip(trip_id, 'complete', Q(driver_id=driver_id), drop_time=timezone.now())
+
+
+def cancel_trip(trip_id, user_id, description=None):
+    '''
+        Either side of the trip may cancel before it starts.
+    '''
+    changes = {
+        'cancelled_at': timezone.now(),
+        'cancelled_by': Case(When(customer_id=user_id, then=Value('customer')), default=Value('driver')),
+    }
+    if description:
+        changes['description'] = description
+    return transition_trip(trip_id, 'cancel', Q(customer_id=user_id) | Q(driver_id=user_id), **changes)
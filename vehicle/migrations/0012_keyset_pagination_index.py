@@ -0,0 +1,20 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0033_keyset_pagination_index'),
+        ('vehicle', '0011_alter_vehicle_vehicle_type_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='vehiclerequest',
+            index=models.Index(fields=['created_at', 'id'], name='vehicle_veh_created_dea6f8_idx'),
+        ),
+    ]
@@ -51,6 +51,12 @@ class VehicleRequest(BaseModel):
     action_at = models.DateTimeField(null=True, blank=True)
     verification_documents = models.ManyToManyField('DocumentType', related_name='vehicle_request_documents')
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of the admin lists.
+            models.Index(fields=['created_at', 'id']),
+        ]
+
 
 class DocumentType(BaseModel):
     document_type = models.CharField(max_length=100) # vehicle_front_image, vehicle_back_image, vehicle_leftSide_image, vehicle_rightSide_image, vehicle_rc_front_image, vehicle_rc_back_image
@@ -1,3 +1,154 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import date
+from io import BytesIO
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from user.models import DriverDetail, Permission, Role, RolePermission
+from user.tests import PASSWORD, PERMISSIONS, create_drivers, create_users, sequence
+from vehicle import urls
+from vehicle.models import Vehicle, VehicleRequest, DocumentType
+from utils.queryBudget import QueryBudgetMixin, unbudgeted_routes
+from utils.rolePermissions import get_role_permissions
+from utils.tokens import PermissionRefreshToken
+
+
+DOCUMENTS = (
+    'vehicle_front_image', 'vehicle_back_image', 'vehicle_leftSide_image',
+    'vehicle_rightSide_image', 'vehicle_rc_front_image', 'vehicle_rc_back_image',
+)
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+
+def image(name):
+    buffer = BytesIO()
+    Image.new('RGB', (4, 4)).save(buffer, 'PNG')
+    return SimpleUploadedFile(f'{name}.png', buffer.getvalue(), content_type='image/png')
+
+
+def create_driver_details(rows):
+    return DriverDetail.objects.bulk_create([DriverDetail(user=user, dob=date(1990, 1, 1)) for user in create_users(rows, 'driver')])
+
+
+def create_vehicle_requests(rows, status='pending', driver=None):
+    '''
+        Vehicle requests with the six documents each, for one driver or a new
+        driver per request.
+    '''
+    drivers = [driver] * rows if driver else create_driver_details(rows)
+    requests = VehicleRequest.objects.bulk_create([
+        VehicleRequest(driver=detail, vehicle_number=f'GJ{next(sequence):08d}', vehicle_type='2 Wheeler', status=status,
+                       vehicle_chassis_number=f'CH{next(sequence):015d}', vehicle_engine_number=f'EN{next(sequence):015d}')
+        for detail in drivers
+    ])
+    for request in requests:
+        request.verification_documents.set(DocumentType.objects.bulk_create([
+            DocumentType(document_type=document_type, document_image=f'vehicle_images/{document_type}.png') for document_type in DOCUMENTS
+        ]))
+    return requests
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class VehicleQueryBudgetTests(QueryBudgetMixin, TestCase):
+    '''
+        Every vehicle endpoint stays within the QUERY_BUDGETS in vehicle/urls.py,
+        whatever the number of rows behind it.
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        permissions = Permission.objects.bulk_create([Permission(permission_name=name, description=name) for name in PERMISSIONS])
+        role = Role.objects.create(role_name='CEO', description='Everything')
+        RolePermission.objects.create(role=role).permissions.set(permissions)
+        cls.admin = create_users(1, 'admin', role=role, email='admin@example.com')[0]
+        cls.admin.set_password(PASSWORD)
+        cls.admin.save()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = APIClient()
+        get_role_permissions()
+
+    def login(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {PermissionRefreshToken.for_user(user).access_token}')
+
+    def test_every_route_has_a_budget(self):
+        self.assertEqual(unbudgeted_routes(urls), [])
+
+    def test_add_vehicle(self):
+        driver = create_drivers(1)[0]
+        self.login(driver)
+
+        def request(_):
+            data = {document_type: image(document_type) for document_type in DOCUMENTS}
+            data.update({'vehicle_number': f'GJ{next(sequence):08d}', 'vehicle_type': '2 Wheeler',
+                         'vehicle_chassis_number': f'CH{next(sequence):015d}', 'vehicle_engine_number': f'EN{next(sequence):015d}'})
+            return self.client.post('/addVehicleView', data, format='multipart')
+        self.assertEqual(self.assertQueryBudget(request, create_vehicle_requests).status_code, 201)
+
+    def test_admin_vehicle_status_list(self):
+        self.login(self.admin)
+        self.assertQueryBudget(lambda _: self.client.get('/adminVehicleStatusListView'), create_vehicle_requests)
+
+    def test_driver_vehicle_details(self):
+        self.login(self.admin)
+        self.assertQueryBudget(
+            lambda request: self.client.get(f'/driverVehicleDetailsView/{request.id}'),
+            lambda rows: create_vehicle_requests(rows, 'approved')[-1],
+        )
+
+    def test_vehicle_list(self):
+        self.login(self.admin)
+        self.assertQueryBudget(lambda _: self.client.get('/vehicleListView'), lambda rows: create_vehicle_requests(rows, 'approved'))
+
+    def test_admin_vehicle_approval(self):
+        self.login(self.admin)
+        self.assertQueryBudget(
+            lambda request: self.client.patch(f'/adminVehicleApprovalView/{request.id}', {'is_approved': 'true'}, format='json'),
+            lambda rows: create_vehicle_requests(rows)[-1],
+        )
+
+    def test_draft_vehicle_list(self):
+        self.login(self.admin)
+        self.assertQueryBudget(
+            lambda _: self.client.get('/draftVehicleListView'),
+            create_driver_details,
+        )
+
+    def test_driver_vehicles_list(self):
+        user = create_drivers(1)[0]
+        self.login(user)
+
+        def scale(rows):
+            driver = DriverDetail.objects.get(user=user)
+            for request in create_vehicle_requests(rows, 'approved', driver):
+                vehicle = Vehicle.objects.create(driver=driver, vehicle_number=f'GJ{next(sequence):08d}', vehicle_type=request.vehicle_type)
+                vehicle.verification_documents.set(request.verification_documents.all())
+        self.assertQueryBudget(lambda _: self.client.get('/driverVehiclesListView'), scale)
+
+    def test_select_vehicle(self):
+        user = create_drivers(1)[0]
+        self.login(user)
+
+        def scale(rows):
+            driver = DriverDetail.objects.get(user=user)
+            return Vehicle.objects.bulk_create([
+                Vehicle(driver=driver, vehicle_number=f'GJ{next(sequence):08d}', vehicle_type='4 Wheeler') for _ in range(rows)
+            ])[-1]
+        self.assertQueryBudget(lambda vehicle: self.client.put('/selectVehicleView', {'vehicle_id': vehicle.id}, format='json'), scale)
+
+    def test_token(self):
+        self.assertQueryBudget(lambda _: self.client.post('/api/token/', {'mobile_number': self.admin.mobile_number, 'password': PASSWORD}, format='json'))
+
+    def test_token_refresh(self):
+        self.assertQueryBudget(lambda _: self.client.post('/api/token/refresh/', {'refresh': str(RefreshToken.for_user(self.admin))}, format='json'))
@@ -29,4 +29,20 @@ urlpatterns = [
     # Token
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
-]
\ No newline at end of file
+]
+
+
+# Max SQL queries per request, checked by the query budget tests in
+# vehicle/tests.py regardless of how many rows sit behind the endpoint.
+QUERY_BUDGETS = {
+    'addVehicleView': 16,
+    'adminVehicleStatusListView': 1,
+    'driverVehicleDetailsView/<int:pk>': 2,
+    'vehicleListView': 1,
+    'adminVehicleApprovalView/<int:pk>': 9,
+    'draftVehicleListView': 1,
+    'driverVehiclesListView': 3,
+    'selectVehicleView': 4,
+    'api/token/': 1,
+    'api/token/refresh/': 2,
+}
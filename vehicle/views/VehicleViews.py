@@ -2,16 +2,19 @@ from rest_framework import status
 from rest_framework.generics import ListAPIView, UpdateAPIView, CreateAPIView, RetrieveAPIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.filters import SearchFilter, OrderingFilter
 
 from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import F, Value, CharField, Case, When, BooleanField
 from django.db.models.functions import Concat
-from django.db.models import Subquery, OuterRef
+from django.db.models import Subquery, OuterRef, Prefetch
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
 
+from utils.tokens import TokenUserAuthentication
 from utils.mixins import DynamicPermission
+from utils.pagination import KeysetPagination
 from ..models import Vehicle, VehicleRequest, DocumentType
 from user.models import DriverDetail
 from ..serializers.vehicleSerializers import VehicleImageSerializer, SelectVehicleSerializer, DriverVehiclesListSerializer, VehicleListViewSerializer, AdminVehicleApprovalSerializer, AdminVehicleStatusListSerailzier, VehicleDetailsSerializer, DraftVehicleListViewSerializer, VehicleFrontImageSerializer
@@ -23,7 +26,7 @@ class addVehicleView(CreateAPIView):
     '''
         Add vehicle details for verification
     '''
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [TokenUserAuthentication]
     permission_classes = [IsAuthenticated]
     serializer_class = VehicleImageSerializer
     def create(self, request):
@@ -45,7 +48,8 @@ class AdminVehicleStatusListView(ListAPIView):
         Get all vehicle verification requests
     '''
 
-    authentication_classes = [JWTAuthentication]
+    pagination_class = KeysetPagination
+    authentication_classes = [TokenUserAuthentication]
     def get_permissions(self):
         return [IsAuthenticated(), DynamicPermission('vehicle_view')]
 
@@ -70,7 +74,7 @@ class AdminVehicleStatusListView(ListAPIView):
 
 
 class DriverVehicleDetailsView(RetrieveAPIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [TokenUserAuthentication]
     def get_permissions(self):
         return [IsAuthenticated(), DynamicPermission('vehicle_view')]
 
@@ -78,7 +82,7 @@ class DriverVehicleDetailsView(RetrieveAPIView):
 
     def get_object(self):
         try:
-            return VehicleRequest.objects.get(id=self.kwargs['pk'])
+            return VehicleRequest.objects.select_related('action_by').get(id=self.kwargs['pk'])
         except VehicleRequest.DoesNotExist:
             return Response({"status" : "error", "message" :"Validation Error", "errors":{"user": "Does not applied as Driver."}}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -87,7 +91,7 @@ class AdminVehicleApprovalView(UpdateAPIView):
     '''
         Approve or reject vehicle verification requests
     '''
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [TokenUserAuthentication]
     def get_permissions(self):
         return [IsAuthenticated(), DynamicPermission('vehicle_edit')]
 
@@ -130,7 +134,8 @@ class AdminVehicleApprovalView(UpdateAPIView):
 
 class VehicleListView(ListAPIView):
 
-    authentication_classes = [JWTAuthentication]
+    pagination_class = KeysetPagination
+    authentication_classes = [TokenUserAuthentication]
     def get_permissions(self):
         return [IsAuthenticated(), DynamicPermission('vehicle_view')]
 
@@ -146,12 +151,12 @@ class VehicleListView(ListAPIView):
 
 class DraftVehicleListView(ListAPIView):
 
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [TokenUserAuthentication]
     def get_permissions(self):
         return [IsAuthenticated(), DynamicPermission('vehicle_view')]
 
     vehicleRequest = VehicleRequest.objects.values_list("driver_id", flat=True).distinct()
-    queryset = DriverDetail.objects.filter(in_use=None).exclude(id__in=vehicleRequest).annotate(name=Concat(F('user__first_name'), Value(' '), F('user__last_name'), output_field=CharField()))
+    queryset = DriverDetail.objects.filter(in_use=None).exclude(id__in=vehicleRequest).select_related('user').annotate(name=Concat(F('user__first_name'), Value(' '), F('user__last_name'), output_field=CharField()))
     serializer_class = DraftVehicleListViewSerializer
 
     filter_backends = [SearchFilter, OrderingFilter, DjangoFilterBackend]
@@ -164,7 +169,7 @@ class DriverVehiclesListView(ListAPIView):
     '''
         Get all vehicle verification requests
     '''
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [TokenUserAuthentication]
     permission_classes = [IsAuthenticated]
     serializer_class = DriverVehiclesListSerializer
 
@@ -178,8 +183,14 @@ class DriverVehiclesListView(ListAPIView):
                 document_type="vehicle_front_image"
             ).values('id')[:1]
 
-            vehicles = Vehicle.objects.filter(driver=driver.id, deleted_at=None).prefetch_related("verification_documents").annotate(
-                selected=Case(When(id=driver.in_use.id, then=True), default=False, output_field=BooleanField()),
+            # Only the front image is shown, fetched for all vehicles in one query.
+            front_images = Prefetch(
+                'verification_documents',
+                queryset=DocumentType.objects.filter(document_type="vehicle_front_image"),
+                to_attr='front_images'
+            )
+            vehicles = Vehicle.objects.filter(driver=driver.id, deleted_at=None).prefetch_related(front_images).annotate(
+                selected=Case(When(id=driver.in_use_id, then=True), default=False, output_field=BooleanField()),
                 document_type_id=Subquery(vehicle_front_image_subquery)
             )
             # for i in vehicles:
@@ -225,15 +236,13 @@ class DriverVehiclesListView(ListAPIView):
 
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
-        document_serializer = self.get_serializer(queryset, many=True)
-        # print(document_serializer.data)
-        for i in document_serializer.data:
-            document_type_obj = DocumentType.objects.filter(id = i['document_type_id'])
-            document_type_serializer = VehicleFrontImageSerializer(document_type_obj, many=True, context={'request': request})
-            # import pdb
-            # pdb.set_trace()
-            i['vehicle_front_image'] = document_type_serializer.data[0]['document_image']
-            # print(document_type_serializer.data[0]['document_image'], "qwerty")
+        if isinstance(queryset, Response):
+            return queryset
+        vehicles = list(queryset)
+        document_serializer = self.get_serializer(vehicles, many=True)
+        for vehicle, i in zip(vehicles, document_serializer.data):
+            document_type_serializer = VehicleFrontImageSerializer(vehicle.front_images[:1], many=True, context={'request': request})
+            i['vehicle_front_image'] = document_type_serializer.data[0]['document_image'] if document_type_serializer.data else None
         data = {"data":document_serializer.data}
         return Response({
             "status": "success",
@@ -246,7 +255,7 @@ class SelectVehicleView(UpdateAPIView):
     '''
         Select vehicle for driver
     '''
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [TokenUserAuthentication]
     permission_classes = [IsAuthenticated]
 
     serializer_class = SelectVehicleSerializer
@@ -275,6 +284,11 @@ class SelectVehicleView(UpdateAPIView):
 
         driver.in_use = vehicle
         driver.save()
+        # Move an open socket over to the new vehicle type's trip group.
+        async_to_sync(get_channel_layer().group_send)(
+            f'driver_{driver.user_id}',
+            {'type': 'vehicle_selected', 'vehicle_type': vehicle.vehicle_type}
+        )
         data = {"driver_first_name": driver.user.first_name,
                 "driver_last_name": driver.user.last_name,
                 "vehicle_number": vehicle.vehicle_number}